@@ -32,6 +32,16 @@ const char db_insert_stmt_name[] = "INSERT INTO `names` (nameid, objectname, met
 const char db_insert_stmt_prefix[] = "INSERT INTO `prefixes` (prefixid, prefixname) VALUES (?, ?);";
 const char db_insert_stmt_value[] = "INSERT INTO `values` (prefixid, nameid, core, value) VALUES (?, ?, ?, ?);";
 
+// Delta-encoded snapshots (recordStatsDelta): only values that changed since the previous delta-encoded snapshot are stored,
+// as the difference to that snapshot. The full snapshot is the sum of all deltas up to and including its own prefixid.
+const char *db_create_stmts_delta[] = {
+   "CREATE TABLE IF NOT EXISTS `deltaprefixes` (prefixid INTEGER);",
+   "CREATE TABLE IF NOT EXISTS `deltavalues` (prefixid INTEGER, nameid INTEGER, core INTEGER, value INTEGER);",
+   "CREATE INDEX IF NOT EXISTS `idx_deltavalue_prefix` ON `deltavalues`(`prefixid`);",
+};
+const char db_insert_stmt_delta_prefix[] = "INSERT INTO `deltaprefixes` (prefixid) VALUES (?);";
+const char db_insert_stmt_delta_value[] = "INSERT INTO `deltavalues` (prefixid, nameid, core, value) VALUES (?, ?, ?, ?);";
+
 UInt64 getWallclockTimeCallback(String objectName, UInt32 index, String metricName, UInt64 arg)
 {
    struct timeval tv = {0,0};
@@ -44,6 +54,8 @@ StatsManager::StatsManager()
    : m_keyid(0)
    , m_prefixnum(0)
    , m_db(NULL)
+   , m_stmt_insert_delta_prefix(NULL)
+   , m_stmt_insert_delta_value(NULL)
 {
    init();
 
@@ -62,6 +74,11 @@ StatsManager::~StatsManager()
       sqlite3_finalize(m_stmt_insert_name);
       sqlite3_finalize(m_stmt_insert_prefix);
       sqlite3_finalize(m_stmt_insert_value);
+      if (m_stmt_insert_delta_value)
+      {
+         sqlite3_finalize(m_stmt_insert_delta_prefix);
+         sqlite3_finalize(m_stmt_insert_delta_value);
+      }
       sqlite3_close(m_db);
    }
 }
@@ -168,6 +185,70 @@ StatsManager::recordStats(String prefix)
    LOG_ASSERT_ERROR(res == SQLITE_OK, "Error executing SQL statement: %s", sqlite3_errmsg(m_db));
 }
 
+void
+StatsManager::recordStatsDelta(String prefix)
+{
+   LOG_ASSERT_ERROR(m_db, "m_db not yet set up !?");
+
+   // Allow lazily-maintained statistics to be updated
+   Sim()->getHooksManager()->callHooks(HookType::HOOK_PRE_STAT_WRITE, (UInt64)prefix.c_str());
+
+   int res;
+   int prefixid = ++m_prefixnum;
+
+   if (!m_stmt_insert_delta_value)
+   {
+      // Only create the delta tables when they are used
+      for(unsigned int i = 0; i < sizeof(db_create_stmts_delta)/sizeof(db_create_stmts_delta[0]); ++i)
+      {
+         res = sqlite3_exec(m_db, db_create_stmts_delta[i], NULL, NULL, NULL);
+         LOG_ASSERT_ERROR(res == SQLITE_OK, "Error executing SQL statement \"%s\": %s", db_create_stmts_delta[i], sqlite3_errmsg(m_db));
+      }
+      sqlite3_prepare(m_db, db_insert_stmt_delta_prefix, -1, &m_stmt_insert_delta_prefix, NULL);
+      sqlite3_prepare(m_db, db_insert_stmt_delta_value, -1, &m_stmt_insert_delta_value, NULL);
+   }
+
+   res = sqlite3_exec(m_db, "BEGIN TRANSACTION", NULL, NULL, NULL);
+   LOG_ASSERT_ERROR(res == SQLITE_OK, "Error executing SQL statement: %s", sqlite3_errmsg(m_db));
+
+   // Also insert the prefix into the regular prefix table, so it is listed along with all other snapshots
+   sqlite3_reset(m_stmt_insert_prefix);
+   sqlite3_bind_int(m_stmt_insert_prefix, 1, prefixid);
+   sqlite3_bind_text(m_stmt_insert_prefix, 2, prefix.c_str(), -1, SQLITE_TRANSIENT);
+   res = sqlite3_step(m_stmt_insert_prefix);
+   LOG_ASSERT_ERROR(res == SQLITE_DONE, "Error executing SQL statement: %s", sqlite3_errmsg(m_db));
+
+   sqlite3_reset(m_stmt_insert_delta_prefix);
+   sqlite3_bind_int(m_stmt_insert_delta_prefix, 1, prefixid);
+   res = sqlite3_step(m_stmt_insert_delta_prefix);
+   LOG_ASSERT_ERROR(res == SQLITE_DONE, "Error executing SQL statement: %s", sqlite3_errmsg(m_db));
+
+   for(StatsObjectList::iterator it1 = m_objects.begin(); it1 != m_objects.end(); ++it1)
+   {
+      for (StatsMetricList::iterator it2 = it1->second.begin(); it2 != it1->second.end(); ++it2)
+      {
+         for(StatsIndexList::iterator it3 = it2->second.second.begin(); it3 != it2->second.second.end(); ++it3)
+         {
+            UInt64 value = it3->second->recordMetric();
+            UInt64 &last = m_delta_last[it3->second];   // Zero for metrics not seen before
+            if (value != last)
+            {
+               sqlite3_reset(m_stmt_insert_delta_value);
+               sqlite3_bind_int(m_stmt_insert_delta_value, 1, prefixid);
+               sqlite3_bind_int(m_stmt_insert_delta_value, 2, it2->second.first);   // Metric ID
+               sqlite3_bind_int(m_stmt_insert_delta_value, 3, it3->second->index);  // Core ID
+               sqlite3_bind_int64(m_stmt_insert_delta_value, 4, SInt64(value - last));
+               res = sqlite3_step(m_stmt_insert_delta_value);
+               LOG_ASSERT_ERROR(res == SQLITE_DONE, "Error executing SQL statement: %s", sqlite3_errmsg(m_db));
+               last = value;
+            }
+         }
+      }
+   }
+   res = sqlite3_exec(m_db, "END TRANSACTION", NULL, NULL, NULL);
+   LOG_ASSERT_ERROR(res == SQLITE_OK, "Error executing SQL statement: %s", sqlite3_errmsg(m_db));
+}
+
 void
 StatsManager::registerMetric(StatsMetricBase *metric)
 {
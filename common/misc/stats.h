@@ -72,6 +72,7 @@ class StatsManager
       ~StatsManager();
       void init();
       void recordStats(String prefix);
+      void recordStatsDelta(String prefix);
       void registerMetric(StatsMetricBase *metric);
       StatsMetricBase *getMetricObject(String objectName, UInt32 index, String metricName);
       void logTopology(String component, core_id_t core_id, core_id_t master_id);
@@ -87,6 +88,8 @@ class StatsManager
       sqlite3_stmt *m_stmt_insert_name;
       sqlite3_stmt *m_stmt_insert_prefix;
       sqlite3_stmt *m_stmt_insert_value;
+      sqlite3_stmt *m_stmt_insert_delta_prefix;
+      sqlite3_stmt *m_stmt_insert_delta_value;
 
       // Use std::string here because String (__versa_string) does not provide a hash function for STL containers with gcc < 4.6
       typedef std::unordered_map<UInt64, StatsMetricBase *> StatsIndexList;
@@ -94,6 +97,8 @@ class StatsManager
       typedef std::unordered_map<std::string, StatsMetricWithKey> StatsMetricList;
       typedef std::unordered_map<std::string, StatsMetricList> StatsObjectList;
       StatsObjectList m_objects;
+      // Metric values at the time of the last recordStatsDelta
+      std::unordered_map<StatsMetricBase *, UInt64> m_delta_last;
 
       static int __busy_handler(void* self, int count) { return ((StatsManager*)self)->busy_handler(count); }
       int busy_handler(int count);
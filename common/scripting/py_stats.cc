@@ -121,6 +121,179 @@ getStatsGetter(PyObject *self, PyObject *args)
 }
 
 
+//////////
+// getter_group(): return a statsGetterGroupObject Python object which reads a list of stats values in one call
+//////////
+
+typedef struct {
+   PyObject_HEAD
+   StatsMetricBase **metrics;
+   Py_ssize_t size;
+} statsGetterGroupObject;
+
+static void
+statsGetterGroupDealloc(PyObject *self)
+{
+   statsGetterGroupObject *group = (statsGetterGroupObject *)self;
+   PyMem_Free(group->metrics);
+   PyObject_Del(self);
+}
+
+static Py_ssize_t
+statsGetterGroupLength(PyObject *self)
+{
+   return ((statsGetterGroupObject *)self)->size;
+}
+
+static PyObject *
+statsGetterGroupRead(PyObject *self, PyObject *args)
+{
+   statsGetterGroupObject *group = (statsGetterGroupObject *)self;
+   PyObject *pBuffer = NULL;
+
+   if (!PyArg_ParseTuple(args, "|O", &pBuffer))
+      return NULL;
+
+   if (!pBuffer) {
+      // No buffer given: return a new list of values
+      PyObject *pValues = PyList_New(group->size);
+      if (!pValues)
+         return NULL;
+      for (Py_ssize_t i = 0; i < group->size; ++i)
+         PyList_SET_ITEM(pValues, i, PyLong_FromUnsignedLongLong(group->metrics[i]->recordMetric()));
+      return pValues;
+   }
+
+   // Fill a writable buffer (e.g. an array.array of 64-bit unsigned integers) with one UInt64 per statistic
+   void *buffer = NULL;
+   Py_ssize_t length = 0;
+   if (PyObject_AsWriteBuffer(pBuffer, &buffer, &length) < 0)
+      return NULL;
+
+   if (length < group->size * (Py_ssize_t)sizeof(UInt64)) {
+      PyErr_SetString(PyExc_ValueError, "Buffer too small, need 8 bytes per statistic");
+      return NULL;
+   }
+
+   UInt64 *values = (UInt64 *)buffer;
+   for (Py_ssize_t i = 0; i < group->size; ++i)
+      values[i] = group->metrics[i]->recordMetric();
+
+   Py_RETURN_NONE;
+}
+
+static PyMethodDef statsGetterGroupMethods[] = {
+   {"read", statsGetterGroupRead, METH_VARARGS, "Read all statistics values, into a writable buffer of 64-bit unsigned integers ([buffer])."},
+   {NULL, NULL, 0, NULL} /* Sentinel */
+};
+
+static PySequenceMethods statsGetterGroupSequence = {
+   statsGetterGroupLength,    /*sq_length*/
+};
+
+static PyTypeObject statsGetterGroupType = {
+   PyObject_HEAD_INIT(NULL)
+   0,                         /*ob_size*/
+   "statsGetterGroup",        /*tp_name*/
+   sizeof(statsGetterGroupObject), /*tp_basicsize*/
+   0,                         /*tp_itemsize*/
+   statsGetterGroupDealloc,   /*tp_dealloc*/
+   0,                         /*tp_print*/
+   0,                         /*tp_getattr*/
+   0,                         /*tp_setattr*/
+   0,                         /*tp_compare*/
+   0,                         /*tp_repr*/
+   0,                         /*tp_as_number*/
+   &statsGetterGroupSequence, /*tp_as_sequence*/
+   0,                         /*tp_as_mapping*/
+   0,                         /*tp_hash */
+   0,                         /*tp_call*/
+   0,                         /*tp_str*/
+   0,                         /*tp_getattro*/
+   0,                         /*tp_setattro*/
+   0,                         /*tp_as_buffer*/
+   Py_TPFLAGS_DEFAULT,        /*tp_flags*/
+   "Stats getter group objects", /*tp_doc*/
+   0,                         /*tp_traverse*/
+   0,                         /*tp_clear*/
+   0,                         /*tp_richcompare*/
+   0,                         /*tp_weaklistoffset*/
+   0,                         /*tp_iter*/
+   0,                         /*tp_iternext*/
+   statsGetterGroupMethods,   /*tp_methods*/
+   0,                         /*tp_members*/
+   0,                         /*tp_getset*/
+   0,                         /*tp_base*/
+   0,                         /*tp_dict*/
+   0,                         /*tp_descr_get*/
+   0,                         /*tp_descr_set*/
+   0,                         /*tp_dictoffset*/
+   0,                         /*tp_init*/
+   0,                         /*tp_alloc*/
+   0,                         /*tp_new*/
+   0,                         /*tp_free*/
+   0,                         /*tp_is_gc*/
+   0,                         /*tp_bases*/
+   0,                         /*tp_mro*/
+   0,                         /*tp_cache*/
+   0,                         /*tp_subclasses*/
+   0,                         /*tp_weaklist*/
+   0,                         /*tp_del*/
+   0,                         /*tp_version_tag*/
+};
+
+static PyObject *
+getStatsGetterGroup(PyObject *self, PyObject *args)
+{
+   PyObject *pMetricList = NULL;
+
+   if (!PyArg_ParseTuple(args, "O", &pMetricList))
+      return NULL;
+
+   PyObject *pMetrics = PySequence_Fast(pMetricList, "Argument must be a sequence of (objectName, index, metricName) tuples");
+   if (!pMetrics)
+      return NULL;
+
+   Py_ssize_t size = PySequence_Fast_GET_SIZE(pMetrics);
+   StatsMetricBase **metrics = PyMem_New(StatsMetricBase *, size ? size : 1);
+   if (!metrics) {
+      Py_DECREF(pMetrics);
+      return PyErr_NoMemory();
+   }
+
+   for (Py_ssize_t i = 0; i < size; ++i) {
+      const char *objectName = NULL, *metricName = NULL;
+      long int index = -1;
+
+      if (!PyArg_ParseTuple(PySequence_Fast_GET_ITEM(pMetrics, i), "sls", &objectName, &index, &metricName)) {
+         PyMem_Free(metrics);
+         Py_DECREF(pMetrics);
+         return NULL;
+      }
+
+      metrics[i] = Sim()->getStatsManager()->getMetricObject(objectName, index, metricName);
+
+      if (!metrics[i]) {
+         PyErr_Format(PyExc_ValueError, "Stats metric not found: %s[%ld].%s", objectName, index, metricName);
+         PyMem_Free(metrics);
+         Py_DECREF(pMetrics);
+         return NULL;
+      }
+   }
+   Py_DECREF(pMetrics);
+
+   statsGetterGroupObject *pGroup = PyObject_New(statsGetterGroupObject, &statsGetterGroupType);
+   if (!pGroup) {
+      PyMem_Free(metrics);
+      return NULL;
+   }
+   pGroup->metrics = metrics;
+   pGroup->size = size;
+
+   return (PyObject *)pGroup;
+}
+
+
 //////////
 // write(): write the current set of statistics out to sim.stats or our own file
 //////////
@@ -139,6 +312,24 @@ writeStats(PyObject *self, PyObject *args)
 }
 
 
+//////////
+// write_delta(): write only the statistics that changed since the previous write_delta()
+//////////
+
+static PyObject *
+writeStatsDelta(PyObject *self, PyObject *args)
+{
+   const char *prefix = NULL;
+
+   if (!PyArg_ParseTuple(args, "s", &prefix))
+      return NULL;
+
+   Sim()->getStatsManager()->recordStatsDelta(prefix);
+
+   Py_RETURN_NONE;
+}
+
+
 //////////
 // register(): register a callback function that returns a statistics value
 //////////
@@ -246,7 +437,9 @@ getIcount(PyObject *self, PyObject *args)
 static PyMethodDef PyStatsMethods[] = {
    {"get",  getStatsValue, METH_VARARGS, "Retrieve current value of statistic (objectName, index, metricName)."},
    {"getter", getStatsGetter, METH_VARARGS, "Return object to retrieve statistics value."},
+   {"getter_group", getStatsGetterGroup, METH_VARARGS, "Return object to retrieve a list of statistics values in one call ([(objectName, index, metricName), ...])."},
    {"write", writeStats, METH_VARARGS, "Write statistics (<prefix>, [<filename>])."},
+   {"write_delta", writeStatsDelta, METH_VARARGS, "Write statistics as a delta to the previous write_delta() (<prefix>)."},
    {"register", registerStats, METH_VARARGS, "Register callback that defines statistics value for (objectName, index, metricName)."},
    {"register_per_thread", registerPerThread, METH_VARARGS, "Add a per-thread statistic (perthreadName) based on a named statistic (objectName, metricName)."},
    {"marker", writeMarker, METH_VARARGS, "Record a marker (coreid, threadid, arg0, arg1, [description])."},
@@ -265,4 +458,11 @@ void HooksPy::PyStats::setup(void)
 
    Py_INCREF(&statsGetterType);
    PyModule_AddObject(pModule, "Getter", (PyObject *)&statsGetterType);
+
+   statsGetterGroupType.tp_new = PyType_GenericNew;
+   if (PyType_Ready(&statsGetterGroupType) < 0)
+      return;
+
+   Py_INCREF(&statsGetterGroupType);
+   PyModule_AddObject(pModule, "GetterGroup", (PyObject *)&statsGetterGroupType);
 }
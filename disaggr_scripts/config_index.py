@@ -0,0 +1,147 @@
+# Python 3
+"""Parsed sim.cfg files of all runs of an experiment output directory.
+
+Every {run}_sim.cfg is parsed once with sniper_config.parse_config and kept
+as a flat {key: value string} dictionary, e.g.
+{"perf_model/dram/localdram_size": "4194304", ...}. Comparing the runs gives
+the keys that actually vary, i.e. the axes of the sweep, and a table with one
+row per run and one column per varying key to pivot plots on.
+
+Indexes are cached per directory and only rebuilt when one of the sim.cfg
+files was added, removed or modified.
+"""
+import os
+import re
+
+from typing import Any, Dict, List, Optional, Tuple, TypeVar
+
+import sniper_config
+from results_warehouse import convert_value
+
+PathLike = TypeVar("PathLike", str, bytes, os.PathLike)  # Type for file/directory paths
+
+RUN_CONFIG_PATTERN = re.compile(r"^(\d+)_sim\.cfg$")
+
+_index_cache = {}  # {realpath: (signature, ConfigIndex)}
+
+
+def read_config(config_path: PathLike) -> Dict[str, str]:
+    """Parse a sim.cfg file into a flat {key: value string} dictionary.
+    Per-core values are joined with commas.
+    """
+    with open(config_path, "r") as config_file:
+        config = sniper_config.parse_config(config_file.read())
+    flat = {}
+    for key in config:
+        value = sniper_config.get_config(config, key)
+        if isinstance(value, list):
+            value = ",".join(value)
+        flat[key] = value
+    return flat
+
+
+def find_run_configs(output_directory_path: PathLike) -> List[Tuple[int, str]]:
+    """(run number, path) of all {run}_sim.cfg files, sorted by run number."""
+    runs = []
+    for filename in os.listdir(output_directory_path):
+        match = RUN_CONFIG_PATTERN.match(filename)
+        if match:
+            runs.append((int(match.group(1)), os.path.join(output_directory_path, filename)))
+    return sorted(runs)
+
+
+class ConfigIndex:
+    def __init__(self, output_directory_path: PathLike):
+        if not os.path.isdir(output_directory_path):
+            raise NotADirectoryError(
+                "Directory {} could not be found".format(output_directory_path)
+            )
+        self.output_directory_path = output_directory_path
+        run_configs = find_run_configs(output_directory_path)
+        self.runs = [run for run, _ in run_configs]
+        self.configs = {run: read_config(path) for run, path in run_configs}
+
+        keys = set()
+        for config in self.configs.values():
+            keys.update(config)
+        self.keys = sorted(keys)
+        # A key only present in some runs also varies
+        self.varying = [
+            key
+            for key in self.keys
+            if len(set(config.get(key) for config in self.configs.values())) > 1
+        ]
+
+    def find_key(self, name: str, category: Optional[str] = None) -> str:
+        """Full key of a config parameter given by its full key, or by its
+        name (e.g. "localdram_size") with an optional category (e.g.
+        "perf_model/dram"). If several keys share the name, the one that
+        varies across the runs is chosen.
+        """
+        if category is not None:
+            name = "{}/{}".format(category.rstrip("/"), name)
+        if name in self.keys:
+            return name
+        candidates = [key for key in self.keys if key.endswith("/" + name)]
+        if len(candidates) > 1:
+            candidates = [key for key in candidates if key in self.varying] or candidates
+        if not candidates:
+            raise KeyError(
+                "Config parameter {} not found in the sim.cfg files of {}".format(
+                    name, self.output_directory_path
+                )
+            )
+        elif len(candidates) > 1:
+            raise KeyError(
+                "Config parameter {} is ambiguous: {}".format(name, ", ".join(candidates))
+            )
+        return candidates[0]
+
+    def get_values(self, key: str, runs: Optional[List[int]] = None) -> List[Optional[str]]:
+        """Value strings of key for the given runs (default: all runs), None
+        for runs that do not have the key.
+        """
+        if runs is None:
+            runs = self.runs
+        return [self.configs.get(run, {}).get(key) for run in runs]
+
+    def get_sweep_axis(self) -> Optional[str]:
+        """The varying key if the runs form a one-dimensional sweep, else None."""
+        if len(self.varying) == 1:
+            return self.varying[0]
+        return None
+
+    def get_sweep_table(self) -> List[Dict[str, Any]]:
+        """One row per run with the run number (key "run") and the value of
+        every varying key, converted to int or float where possible.
+        """
+        return [
+            dict(
+                [("run", run)]
+                + [(key, convert_value(self.configs[run].get(key))) for key in self.varying]
+            )
+            for run in self.runs
+        ]
+
+    def get_sweep_dataframe(self):
+        """get_sweep_table as a pandas DataFrame indexed by run number."""
+        import pandas as pd
+
+        return pd.DataFrame(self.get_sweep_table(), columns=["run"] + self.varying).set_index("run")
+
+
+def get_config_index(output_directory_path: PathLike) -> ConfigIndex:
+    """Cached ConfigIndex of an experiment output directory."""
+    path = os.path.realpath(output_directory_path)
+    if not os.path.isdir(path):
+        raise NotADirectoryError(
+            "Directory {} could not be found".format(output_directory_path)
+        )
+    signature = []
+    for run, config_path in find_run_configs(path):
+        st = os.stat(config_path)
+        signature.append((run, st.st_mtime_ns, st.st_size))
+    signature = tuple(signature)
+    if path not in _index_cache or _index_cache[path][0] != signature:
+        _index_cache[path] = (signature, ConfigIndex(path))
+    return _index_cache[path][1]
@@ -13,6 +13,8 @@ import matplotlib.pyplot as plt
 
 from typing import Any, Callable, List, Optional, TextIO, TypeVar
 
+from config_index import get_config_index
+
 PathLike = TypeVar("PathLike", str, bytes, os.PathLike)  # Type for file/directory paths
 
 
@@ -38,8 +40,6 @@ def get_stats_from_files(
     stat_settings: Optional[List[StatSetting]] = None,
 ):
     ipc_line_no = 3  # Indexing start from 0, not 1
-    # Can add check for config_param_category, for param names that exist in multiple categories
-    config_line_beginning = config_param_name + " = "
     if stat_settings is None:  # Use stat_settings defined here
         # StatSetting line_beginning's: case sensitive, not sensitive to leading whitespace
         stat_settings = [
@@ -56,9 +56,6 @@ def get_stats_from_files(
     y_value_line_nos = [None for _ in range(len(stat_settings))]
     y_values = [[] for _ in range(len(stat_settings))]
 
-    x_value_line_no = None
-    config_param_values = []
-
     if not os.path.isdir(output_directory_path):
         raise NotADirectoryError(
             "Directory could not be found".format(output_directory_path)
@@ -108,32 +105,24 @@ def get_stats_from_files(
                         else np.nan
                     )  # The last entry of the line
 
-        # Associated sim.cfg file
-        with open(
-            os.path.join(output_directory_path, "{}_sim.cfg".format(file_num)), "r"
-        ) as config_file:
-            if first_file:
-                for line_no, line in enumerate(config_file.readlines()):
-                    if line.startswith(config_line_beginning):
-                        x_value_line_no = line_no
-                        # The entry after the equals sign
-                        config_param_values.append(float(line.split()[2]))
-                if x_value_line_no is None:
-                    raise ValueError(
-                        "Error: didn't find desired line starting with '{}' in .cfg file".format(
-                            config_line_beginning
-                        )
-                    )
-            else:
-                line = config_file.readlines()[x_value_line_no]
-                # The entry after the equals sign
-                config_param_values.append(float(line.split()[2]))
         first_file = False
         file_num += 1
         out_file_path = os.path.join(
             output_directory_path, "{}_sim.out".format(file_num)
         )
 
+    # Associated sim.cfg files
+    config_index = get_config_index(output_directory_path)
+    config_key = config_index.find_key(config_param_name, config_param_category)
+    config_param_values = config_index.get_values(config_key, list(range(1, file_num)))
+    if None in config_param_values:
+        raise ValueError(
+            "Error: didn't find desired parameter {} in .cfg file {}_sim.cfg".format(
+                config_key, config_param_values.index(None) + 1
+            )
+        )
+    config_param_values = [float(value) for value in config_param_values]
+
     return config_param_values, y_values, stat_settings
 
 
@@ -330,55 +319,28 @@ def check_config(
     # config_param_category: str,
     config_param_name: str,
 ):
-    ipc_line_no = 3  # Indexing start from 0, not 1
-    # Can add check for config_param_category, for param names that exist in multiple categories
-    config_line_beginning = config_param_name + " = "
-
-    x_value_line_no = None
-    config_param_values = []
-
-    if not os.path.isdir(output_directory_path):
-        raise NotADirectoryError(
-            "Directory could not be found".format(output_directory_path)
+    config_index = get_config_index(output_directory_path)
+    config_key = config_index.find_key(config_param_name)
+    config_param_values = config_index.get_values(config_key)
+    if None in config_param_values:
+        raise ValueError(
+            "Error: didn't find desired parameter {} in .cfg file {}_sim.cfg".format(
+                config_key, config_index.runs[config_param_values.index(None)]
+            )
         )
+    print("Config {} values:\n".format(config_param_name), config_param_values)
 
-    first_file = True
-    file_num = 1
-    out_file_path = os.path.join(output_directory_path, "{}_sim.cfg".format(file_num))
-    # Read all the output files, starting from 1 and going up
-    while os.path.isfile(out_file_path):
-        # sim.cfg file
-        with open(
-            os.path.join(output_directory_path, "{}_sim.cfg".format(file_num)), "r"
-        ) as config_file:
-            if first_file:
-                for line_no, line in enumerate(config_file.readlines()):
-                    if line.startswith(config_line_beginning):
-                        x_value_line_no = line_no
-                        # The entry after the equals sign
-                        config_param_values.append(str(line.split()[2]))
-                if x_value_line_no is None:
-                    raise ValueError(
-                        "Error: didn't find desired line starting with '{}' in .cfg file".format(
-                            config_line_beginning
-                        )
-                    )
-            else:
-                line = config_file.readlines()[x_value_line_no]
-                if not line.startswith(config_line_beginning):
-                    raise ValueError(
-                        "Error: didn't find desired line starting with '{}' in .cfg file {}".format(
-                            config_line_beginning, out_file_path
-                        )
-                    )
-                # The entry after the equals sign
-                config_param_values.append(str(line.split()[2]))
-        first_file = False
-        file_num += 1
-        out_file_path = os.path.join(
-            output_directory_path, "{}_sim.cfg".format(file_num)
+
+def print_sweep(output_directory_path: PathLike):
+    """Print the config parameters that vary across the runs, one line per run."""
+    config_index = get_config_index(output_directory_path)
+    print("Varying config parameters:", ", ".join(config_index.varying) or "none")
+    for row in config_index.get_sweep_table():
+        print(
+            "  {}: {}".format(
+                row.pop("run"), ", ".join("{}={}".format(key, value) for key, value in row.items())
+            )
         )
-    print("Config {} values:\n".format(config_param_name), config_param_values)
 
 
 if __name__ == "__main__":
@@ -408,6 +370,8 @@ if __name__ == "__main__":
         # check_config(directory_path, "remote_mem_bw_scalefactor")
         # check_config(directory_path, "remote_partitioned_queues")
         # check_config(directory_path, "remote_cacheline_queue_fraction")
+    elif type == "sweep":
+        print_sweep(".")
     elif type == "print_only_parent_dir":
         directory_path = "."
         passed_over_directories = []
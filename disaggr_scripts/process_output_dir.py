@@ -2,6 +2,7 @@
 # Optionally call plot graph functions
 
 import os
+import functools
 import numpy as np
 import natsort
 import shutil
@@ -12,10 +13,12 @@ import matplotlib.pyplot as plt
 from scipy import interpolate
 
 from enum import IntEnum
-from typing import Any, Callable, Dict, List, Optional, TextIO, TypeVar
+from typing import Any, Callable, Dict, List, Optional, TextIO, Tuple, TypeVar
 
 PathLike = TypeVar("PathLike", str, bytes, os.PathLike)  # Type for file/directory paths
 
+import sniper_lib
+
 # import plot_graph
 # import plot_graph_pq
 
@@ -87,16 +90,40 @@ class BandwidthInfo:
         return self.__str__()
 
 
+def read_stat_lines(
+    out_file_path: PathLike, line_beginnings: List[str], ipc_line_no: int = 3
+) -> Optional[Tuple[List[Optional[str]], bool]]:
+    """For each of line_beginnings, return the last entry of the first line of
+    the sim.out file at out_file_path that starts with it (None if the file has
+    no such line), and whether line ipc_line_no of the file is the IPC line.
+    Return None if the file is empty.
+    """
+    with open(out_file_path, "r") as out_file:
+        out_file_lines = [line.strip() for line in out_file]
+    if len(out_file_lines) == 0:
+        return None
+    has_ipc_line = len(out_file_lines) > ipc_line_no and out_file_lines[ipc_line_no].startswith("IPC")
+    values = [None for _ in range(len(line_beginnings))]
+    for line in out_file_lines:
+        for index, line_beginning in enumerate(line_beginnings):
+            if values[index] is None and line.startswith(line_beginning):
+                values[index] = line.split()[-1]  # The last entry of the line
+    return values, has_ipc_line
+
+
 def get_stats_from_files(
     output_directory_path: PathLike,
     first_experiment_no: Optional[int] = 1,
     log_file: Optional[TextIO] = None,
     stat_settings: Optional[List[StatSetting]] = None,
+    workers: Optional[int] = None,
 ):
     """Run this script in an experiment folder, ie the containing folder of
     numbered Sniper config and output files.
+
+    The numbered sim.out files are read in parallel by a pool of worker
+    processes (default: one per CPU).
     """
-    ipc_line_no = 3  # Indexing start from 0, not 1
     if stat_settings is None:
         # Use stat_settings defined here
         # StatSetting line_beginning's: case sensitive, not sensitive to leading whitespace
@@ -111,7 +138,6 @@ def get_stats_from_files(
             #  StatSetting("DDR page misses", int),
         ]
 
-    y_value_line_nos = [None for _ in range(len(stat_settings))]
     y_values = [[] for _ in range(len(stat_settings))]
 
     if not os.path.isdir(output_directory_path):
@@ -119,78 +145,66 @@ def get_stats_from_files(
             "Directory could not be found".format(output_directory_path)
         )
 
-    first_file = True
+    # Find all the output files, starting from first_experiment_no and going up
+    out_file_paths = []
     file_num = first_experiment_no
     out_file_path = os.path.join(output_directory_path, "{}_sim.out".format(file_num))
-    # Read all the output files, starting from 1 and going up
     while os.path.isfile(out_file_path):
-        with open(out_file_path, "r") as out_file:
-            out_file_lines = out_file.readlines()
-            if len(out_file_lines) == 0:
-                # The file is empty...
-                print("{} is an empty file!".format(out_file_path))
-                for index in range(len(y_values)):
-                    y_values[index].append(np.nan)
-                file_num += 1
-                out_file_path = os.path.join(
-                    output_directory_path, "{}_sim.out".format(file_num)
-                )
-                continue
+        out_file_paths.append(out_file_path)
+        file_num += 1
+        out_file_path = os.path.join(
+            output_directory_path, "{}_sim.out".format(file_num)
+        )
+
+    stat_lines = sniper_lib.load_results_parallel(
+        out_file_paths,
+        workers=workers,
+        loader=functools.partial(
+            read_stat_lines,
+            line_beginnings=[stat_setting.line_beginning for stat_setting in stat_settings],
+        ),
+    )
+
+    first_file = True
+    for out_file_path in out_file_paths:
+        values = stat_lines[out_file_path]
+        if isinstance(values, Exception):
             if first_file:
-                # Get line numbers of relevant lines
-                for line_no, line in enumerate(out_file_lines):
-                    for index, stat_setting in enumerate(stat_settings):
-                        if line.strip().startswith(stat_setting.line_beginning):
-                            y_value_line_nos[index] = line_no
-                            y_values[index].append(
-                                stat_setting.format_func(line.split()[-1])
-                                if line.split()[-1] != "|"
-                                else np.nan
-                            )  # The last entry of the line
-                if not out_file_lines[ipc_line_no].strip().startswith("IPC"):
+                raise values
+            print(values)
+            values = [None for _ in range(len(stat_settings))]
+        elif values is None:
+            # The file is empty...
+            print("{} is an empty file!".format(out_file_path))
+            values = [None for _ in range(len(stat_settings))]
+        else:
+            values, has_ipc_line = values
+            if first_file:
+                # Only the first (non-empty) file needs to have the expected layout
+                if not has_ipc_line:
                     raise ValueError(
                         "Error: didn't find desired line starting with '{}' in .out file".format(
                             "IPC"
                         )
                     )
-                elif None in y_value_line_nos:
+                elif None in values:
                     error_strs = []
-                    for index, value in enumerate(y_value_line_nos):
+                    for index, value in enumerate(values):
                         if value is None:
                             error_strs.append(
                                 "Error: didn't find desired line starting with '{}' in .out file".format(
                                     stat_settings[index].line_beginning
                                 )
                             )
-                            y_values[index].append(np.nan)  # ignore missing stats
                     # raise ValueError("\n".join(error_strs))
                     print("\n".join(error_strs))
-            else:
-                # Read the lines of pertinant information
-                for index in range(len(y_values)):
-                    if y_value_line_nos[index] is None \
-                            or not out_file_lines[y_value_line_nos[index]].strip().startswith(stat_settings[index].line_beginning):
-                        # Couldn't find the line where it was in the previous file, try looking again for the line in this file
-                        y_value_line_nos[index] = None
-                        for line_no, line in enumerate(out_file_lines):
-                            if line.strip().startswith(stat_settings[index].line_beginning):
-                                y_value_line_nos[index] = line_no  # found it
-                                break
-                    if y_value_line_nos[index] is None:  # Still didn't find the line
-                        y_values[index].append(np.nan)  # ignore missing stats
-                        continue
-                    line = out_file_lines[y_value_line_nos[index]]
-                    y_values[index].append(
-                        stat_settings[index].format_func(line.split()[-1])
-                        if line.split()[-1] != "|"
-                        else np.nan
-                    )  # The last entry of the line
-
-        first_file = False
-        file_num += 1
-        out_file_path = os.path.join(
-            output_directory_path, "{}_sim.out".format(file_num)
-        )
+            first_file = False
+        for index, value in enumerate(values):
+            y_values[index].append(
+                stat_settings[index].format_func(value)
+                if value is not None and value != "|"
+                else np.nan
+            )  # ignore missing stats
 
     return y_values, stat_settings
 
@@ -228,6 +242,7 @@ def get_and_print_stats(
     stat_settings: Optional[List[StatSetting]] = None,
     print_to_terminal: bool = True,
     first_experiment_no: int = 1,
+    workers: Optional[int] = None,
 ):
     """Run this script in an experiment folder, ie the containing folder of
     numbered Sniper config and output files.
@@ -236,7 +251,8 @@ def get_and_print_stats(
         output_directory_path,
         log_file=log_file,
         stat_settings=stat_settings,
-        first_experiment_no=first_experiment_no
+        first_experiment_no=first_experiment_no,
+        workers=workers,
     )
 
     print_stats(
@@ -269,6 +285,7 @@ def process_and_graph_experiment_series(
     graphing_function: Optional[Callable[[str, Optional[TextIO]], bool]] = None,
     first_experiment_no: int = 1,
     stat_settings: Optional[List[StatSetting]] = None,
+    workers: Optional[int] = None,
 ):
     """Run this script in the directory containing experiment folders, ie the
     containing folder of the run.py file.
@@ -427,6 +444,7 @@ def process_and_graph_experiment_series(
                     log_file=log_file,
                     first_experiment_no=first_experiment_no,
                     stat_settings=stat_settings,
+                    workers=workers,
                 )
                 # print()
                 print(file=log_file)
@@ -0,0 +1,314 @@
+# Python 3
+"""Consolidate the results of all runs of an ExperimentManager sweep into a
+single SQLite file, for analysis with one pandas query instead of opening
+thousands of {run}_sim.out / {run}_sim.cfg / {run}_sim.stats.sqlite3 files.
+
+The `runs` table has one row per run (its experiment and number). Values
+are stored in long tables, so sweeps over many parameters and statistics
+don't run into SQLite's column limit: `run_values` has one row per run and
+sim.cfg parameter (eg "perf_model/dram/localdram_size") or ROI statistic
+(eg "dram.remote-reads"), and `core_stats` has the per-core values of
+per-core statistics. A per-core statistic is only summed over all cores
+into `run_values` if it is a counter for which the sum is meaningful (see
+is_additive); others, like ipc or max-* gauges, are only in `core_stats`.
+load_dataframe pivots the values into one row per run.
+
+Ingestion is incremental: runs whose files did not change since the last
+ingestion are skipped.
+"""
+import sys
+import os
+import re
+import getopt
+import sqlite3
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+import sniper_config
+import sniper_lib
+import sniper_stats_sqlite
+
+PathLike = TypeVar("PathLike", str, bytes, os.PathLike)  # Type for file/directory paths
+
+WAREHOUSE_FILENAME = "results_warehouse.sqlite3"
+RUN_FILE_PATTERN = re.compile(r"^(\d+)_sim\.cfg$")
+
+SCHEMA_VERSION = 3  # Version 1 had one `runs` column per config key and statistic, version 2 did not sum latency and time counters
+
+create_stmts = [
+    "CREATE TABLE IF NOT EXISTS `runs` (`run_id` INTEGER PRIMARY KEY, `experiment` TEXT, `run` INTEGER, `signature` TEXT, UNIQUE (`experiment`, `run`));",
+    "CREATE TABLE IF NOT EXISTS `run_values` (`run_id` INTEGER, `key` TEXT, `value`, PRIMARY KEY (`run_id`, `key`));",
+    "CREATE INDEX IF NOT EXISTS `idx_run_values_key` ON `run_values`(`key`);",
+    "CREATE TABLE IF NOT EXISTS `core_stats` (`run_id` INTEGER, `key` TEXT, `core` INTEGER, `value`, PRIMARY KEY (`run_id`, `key`, `core`));",
+]
+
+# Integer per-core statistics that are not summed over cores, only stored per
+# core: the per-core (wall clock) elapsed time, derived rates, min/max gauges
+# and fractions. Totals such as dram.total-remote-access-latency are summed.
+NON_ADDITIVE_PATTERN = re.compile(
+    r"^(?:performance_model\.elapsed_time.*|ipc|fs_to_cycles_cores|.*[._-](?:max|min)[_-].*|.*fraction)$"
+)
+
+
+def find_runs(root_directory: PathLike) -> List[Tuple[str, int, str]]:
+    """Return (experiment, run number, experiment directory) for every
+    {run}_sim.cfg that has a matching {run}_sim.stats.sqlite3 below
+    root_directory. experiment is the directory path relative to
+    root_directory.
+    """
+    runs = []
+    for dirpath, dirnames, filenames in os.walk(root_directory):
+        dirnames.sort()
+        filenames = set(filenames)
+        for filename in sorted(filenames):
+            match = RUN_FILE_PATTERN.match(filename)
+            if match and "{}_sim.stats.sqlite3".format(match.group(1)) in filenames:
+                runs.append(
+                    (
+                        os.path.relpath(dirpath, root_directory),
+                        int(match.group(1)),
+                        dirpath,
+                    )
+                )
+    return runs
+
+
+def get_run_signature(experiment_dir: PathLike, run: int) -> str:
+    """Modification times and sizes of the files a run is read from."""
+    signature = []
+    for filename in ("sim.cfg", "sim.stats.sqlite3"):
+        st = os.stat(os.path.join(experiment_dir, "{}_{}".format(run, filename)))
+        signature.append("{}:{}".format(st.st_mtime_ns, st.st_size))
+    return ",".join(signature)
+
+
+def convert_value(value: Any) -> Any:
+    """Convert a config string to int or float where possible."""
+    if not isinstance(value, str):
+        return value
+    for type_ in (int, float):
+        try:
+            return type_(value)
+        except ValueError:
+            pass
+    return value
+
+
+def is_additive(key: str, values: List[Any]) -> bool:
+    """Return True iff the sum of the per-core values of statistic key is
+    meaningful: integer counters (eg instruction counts, dram reads, total
+    latencies) that are not gauges (see NON_ADDITIVE_PATTERN).
+    """
+    return not NON_ADDITIVE_PATTERN.match(key) and all(
+        isinstance(value, int) and not isinstance(value, bool) for value in values
+    )
+
+
+def read_run(experiment_dir: PathLike, run: int) -> Dict[str, Any]:
+    """Read the config and ROI statistics of one run in an experiment output
+    directory. Return a dictionary with the {key: value} rows for the
+    `run_values` table (key "values") and the (key, core, value) rows for the
+    `core_stats` table (key "core_stats").
+    """
+    with open(os.path.join(experiment_dir, "{}_sim.cfg".format(run))) as config_file:
+        config = sniper_config.parse_config(config_file.read())
+    stats = sniper_stats_sqlite.SniperStatsSqlite(
+        os.path.join(experiment_dir, "{}_sim.stats.sqlite3".format(run))
+    )
+    ncores = int(config["general/total_cores"])
+    results = sniper_lib.stats_process(
+        config, stats.parse_stats(("roi-begin", "roi-end"), ncores)
+    )
+
+    values = {}
+    for key in config:
+        value = sniper_config.get_config(config, key)
+        if isinstance(value, list):
+            value = ",".join(value)
+        values[key] = convert_value(value)
+    core_stats = []
+    for key, value in results.items():
+        if isinstance(value, list):
+            core_stats.extend((key, core, v) for core, v in enumerate(value))
+            if not is_additive(key, value):
+                continue
+            value = sum(value)
+        values[key] = value
+    return {"values": values, "core_stats": core_stats}
+
+
+def open_warehouse(warehouse_path: PathLike) -> sqlite3.Connection:
+    """Open (and create) a warehouse file. Warehouses with an older schema
+    are emptied; their runs are ingested again.
+    """
+    db = sqlite3.connect(warehouse_path)
+    if db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        for table in ("runs", "run_values", "core_stats"):
+            db.execute("DROP TABLE IF EXISTS `{}`".format(table))
+        db.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+    for stmt in create_stmts:
+        db.execute(stmt)
+    return db
+
+
+def ingest(
+    root_directory: PathLike,
+    warehouse_path: Optional[PathLike] = None,
+    workers: Optional[int] = None,
+    verbose: bool = False,
+) -> Dict[str, int]:
+    """Add all new or changed runs below root_directory to the warehouse file
+    (default: results_warehouse.sqlite3 in root_directory). Return the number
+    of added, updated, unchanged and failed runs.
+    """
+    if warehouse_path is None:
+        warehouse_path = os.path.join(root_directory, WAREHOUSE_FILENAME)
+    db = open_warehouse(warehouse_path)
+    known_signatures = {
+        (experiment, run): signature
+        for experiment, run, signature in db.execute(
+            "SELECT `experiment`, `run`, `signature` FROM `runs`"
+        )
+    }
+
+    counts = {"added": 0, "updated": 0, "unchanged": 0, "failed": 0}
+    to_read = {}
+    for experiment, run, experiment_dir in find_runs(root_directory):
+        signature = get_run_signature(experiment_dir, run)
+        if known_signatures.get((experiment, run)) == signature:
+            counts["unchanged"] += 1
+        else:
+            to_read[os.path.join(experiment_dir, "{}_sim.cfg".format(run))] = (
+                experiment,
+                run,
+                experiment_dir,
+                signature,
+            )
+
+    # Read all runs that need updating in parallel
+    run_data = sniper_lib.load_results_parallel(
+        list(to_read.keys()), workers=workers, loader=read_run_from_cfg_path
+    )
+
+    for cfg_path, (experiment, run, experiment_dir, signature) in to_read.items():
+        data = run_data[cfg_path]
+        if isinstance(data, Exception):
+            print("Failed to ingest {} run {}: {}".format(experiment, run, data))
+            counts["failed"] += 1
+            continue
+        if (experiment, run) in known_signatures:
+            counts["updated"] += 1
+            run_id = db.execute(
+                "SELECT `run_id` FROM `runs` WHERE `experiment` = ? AND `run` = ?",
+                (experiment, run),
+            ).fetchone()[0]
+            db.execute(
+                "UPDATE `runs` SET `signature` = ? WHERE `run_id` = ?",
+                (signature, run_id),
+            )
+            db.execute("DELETE FROM `run_values` WHERE `run_id` = ?", (run_id,))
+            db.execute("DELETE FROM `core_stats` WHERE `run_id` = ?", (run_id,))
+        else:
+            counts["added"] += 1
+            run_id = db.execute(
+                "INSERT INTO `runs` (`experiment`, `run`, `signature`) VALUES (?, ?, ?)",
+                (experiment, run, signature),
+            ).lastrowid
+        db.executemany(
+            "INSERT INTO `run_values` (`run_id`, `key`, `value`) VALUES (?, ?, ?)",
+            [(run_id, key, value) for key, value in data["values"].items()],
+        )
+        db.executemany(
+            "INSERT INTO `core_stats` (`run_id`, `key`, `core`, `value`) VALUES (?, ?, ?, ?)",
+            [(run_id, key, core, value) for key, core, value in data["core_stats"]],
+        )
+        if verbose:
+            print("Ingested {} run {}".format(experiment, run))
+    db.commit()
+    db.close()
+    return counts
+
+
+def read_run_from_cfg_path(cfg_path: PathLike) -> Dict[str, Any]:
+    """load_results_parallel loader: read the run whose {run}_sim.cfg is at
+    cfg_path.
+    """
+    match = RUN_FILE_PATTERN.match(os.path.basename(cfg_path))
+    return read_run(os.path.dirname(cfg_path), int(match.group(1)))
+
+
+def load_dataframe(
+    warehouse_path: PathLike,
+    columns: Optional[Iterable[str]] = None,
+    experiment_pattern: Optional[str] = None,
+):
+    """Return the values of all runs as a pandas DataFrame with one row per
+    run: its experiment and run number, and one column per config key and
+    statistic in `run_values`. Optionally only load the given columns (in
+    addition to the experiment and run number), and only experiments whose
+    name matches the SQL LIKE pattern experiment_pattern.
+    """
+    import pandas as pd
+
+    query = "SELECT `experiment`, `run`, `key`, `value` FROM `runs` JOIN `run_values` USING (`run_id`)"
+    conditions = []
+    params = []
+    if columns is not None:
+        columns = [c for c in columns if c not in ("experiment", "run")]
+        conditions.append("`key` IN ({})".format(", ".join("?" for _ in columns)))
+        params.extend(columns)
+    if experiment_pattern is not None:
+        conditions.append("`experiment` LIKE ?")
+        params.append(experiment_pattern)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    with sqlite3.connect(warehouse_path) as db:
+        values = pd.read_sql_query(query, db, params=params)
+        runs = pd.read_sql_query(
+            "SELECT `experiment`, `run` FROM `runs`"
+            + (" WHERE `experiment` LIKE ?" if experiment_pattern is not None else ""),
+            db,
+            params=[experiment_pattern] if experiment_pattern is not None else [],
+        )
+    df = values.pivot(index=["experiment", "run"], columns="key", values="value")
+    # Runs without any of the requested values still get a row
+    df = df.reindex(pd.MultiIndex.from_frame(runs)).sort_index()
+    if columns is not None:
+        df = df.reindex(columns=columns)
+    df.columns.name = None
+    return df.reset_index().infer_objects()
+
+
+if __name__ == "__main__":
+    usage_str = "Usage: python3 results_warehouse.py [-h] [-v] [-j <workers (default: #cpus)>] [-o <warehouse file (default: <root>/{})>] [<experiment root directory (default: .)>]".format(
+        WAREHOUSE_FILENAME
+    )
+    workers = None
+    warehouse_path = None
+    verbose = False
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hvj:o:")
+    except getopt.GetoptError:
+        print(usage_str)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            print(usage_str)
+            sys.exit()
+        elif opt == "-v":
+            verbose = True
+        elif opt == "-j":
+            workers = int(arg)
+        elif opt == "-o":
+            warehouse_path = arg
+    if len(args) > 1:
+        print(usage_str)
+        sys.exit(2)
+    root_directory = args[0] if args else "."
+
+    counts = ingest(root_directory, warehouse_path, workers=workers, verbose=verbose)
+    print(
+        "{added} runs added, {updated} updated, {unchanged} unchanged, {failed} failed".format(
+            **counts
+        )
+    )
@@ -255,6 +255,7 @@ if __name__ == "__main__":
                         command_str=command_str,
                         experiment_run_configs=pq_cacheline_combined_rmode1_configs,
                         output_root_directory=".",
+                        use_trace_cache=True,  # sssp_int runs with 1 thread
                     )
                 )
 
@@ -313,7 +314,14 @@ if __name__ == "__main__":
         print(log_str, file=log_file)
 
         experiment_manager = ExperimentManager(
-            output_root_directory=".", max_concurrent_processes=16, log_file=log_file
+            output_root_directory=".",
+            max_concurrent_processes=16,
+            log_file=log_file,
+            result_store_directory="run_result_store",  # Run identical runs once; resume interrupted sweeps
+            resource_aware=True,  # Admit runs based on learned memory/CPU use
+            predict_durations=True,  # Start the longest runs first; log an ETA
+            trace_cache_directory="trace_cache",  # Simulate use_trace_cache experiments from a SIFT trace recorded once per benchmark
+            # shared_queue_path="run_queue.sqlite3",  # Execute the sweep together with other workers running this script
         )
         experiment_manager.add_experiments(experiments)
         experiment_manager.start(
@@ -8,8 +8,22 @@ import datetime
 import traceback
 import copy
 import getopt
+import hashlib
+import json
+import ast
+import re
+import select
+import shlex
 import shutil
 import subprocess
+import configparser
+import heapq
+import math
+import statistics
+import socket
+import sqlite3
+import threading
+import contextlib
 from collections import deque
 
 import typing
@@ -19,6 +33,18 @@ PathLike = TypeVar("PathLike", str, bytes, os.PathLike)  # Type for file/directo
 
 this_file_containing_dir_abspath = os.path.dirname(os.path.abspath(__file__))
 
+# Sniper output files saved for each ExperimentRun, as {run no}_{filename}
+SAVED_OUTPUT_FILES = ["sim.cfg", "sim.stats.sqlite3", "sim.out"]
+
+# Config keys that (besides the command) mostly determine how long a run takes
+SALIENT_CONFIG_KEYS = [
+    "perf_model/dram/localdram_size",
+    "perf_model/dram/enable_remote_mem",
+    "perf_model/dram/compression_model/use_compression",
+    "perf_model/dram/compression_model/compression_scheme",
+    "perf_model/dram/compression_model/cacheline/use_cacheline_compression",
+]
+
 # # If scripts in the Sniper tools folder need to be called
 # sys.path.append(os.path.join(this_file_containing_dir_abspath, "..", "tools"))
 
@@ -156,6 +182,7 @@ class ExperimentRun:
         config_file_str: str,
         setup_command_str=None,
         clean_up_command_str=None,
+        use_trace_cache: bool = False,
     ) -> None:
         self.experiment_name = experiment_name
         self.experiment_run_no = experiment_run_no
@@ -164,6 +191,7 @@ class ExperimentRun:
         self.config_file_str = config_file_str
         self.setup_command_str = setup_command_str
         self.clean_up_command_str = clean_up_command_str
+        self.use_trace_cache = use_trace_cache
         self.log_str = "Experiment {} run {} missing log str\n".format(
             experiment_name, experiment_run_no
         )
@@ -174,13 +202,16 @@ class ExperimentRun:
         """
         return self.config_file_str
 
-    def get_execution_script_str(self) -> str:
+    def get_execution_script_str(self, command_str: Optional[str] = None) -> str:
         """Write this string to a file to generate a script that executes this
-        ExperimentRun.
+        ExperimentRun. If command_str is given, it is executed instead of this
+        ExperimentRun's command string (eg to simulate from a SIFT trace).
 
         The returned string needs to be formatted with named argument
         sniper_output_dir: where the experiment run output directory is
         """
+        if command_str is None:
+            command_str = self.command_str
         lines = []
 
         # lines.append("cd {0}")
@@ -188,19 +219,22 @@ class ExperimentRun:
         if self.setup_command_str:
             lines.append(self.setup_command_str)
 
-        lines.append('echo "Running linux command:\n{}"'.format(self.command_str))
-        if "{sniper_output_dir}" not in self.command_str:
+        lines.append('echo "Running linux command:\n{}"'.format(command_str))
+        if "{sniper_output_dir}" not in command_str:
             # command_str should have a {0} field to specify the Sniper output directory
             raise ValueError(
                 "Experiment {} run {} missing '{{sniper_output_dir}}' in command_str to specify Sniper output directory. command_str given:\n{}".format(
-                    self.experiment_name, self.experiment_run_no, self.command_str
+                    self.experiment_name, self.experiment_run_no, command_str
                 )
             )
-        lines.append(self.command_str)
+        lines.append(command_str)
+        # The exit status of the script is that of the command, not of the
+        # commands saving its output below
+        lines.append("status=$?")
         lines.append(
-            'if [ $? !=  0 ] ; then echo "{}" $?; fi'.format(
+            'if [ $status !=  0 ] ; then echo "{}" $status; fi'.format(
                 "Run-sniper-repeat command '{}' for experiment {} run {} got error ret val: ".format(
-                    self.command_str, self.experiment_name, self.experiment_run_no
+                    command_str, self.experiment_name, self.experiment_run_no
                 )
             )
         )  # using single bracket [ ] testing for now, since might not be sure which shell is used
@@ -208,12 +242,12 @@ class ExperimentRun:
         if self.clean_up_command_str:
             lines.append(self.clean_up_command_str)
 
-        # Wait a little bit of time in case something needs to wrap up
-        lines.append("sleep 30")  # sleep for 30 seconds
+        # Wait for any background jobs started by the commands, so that all
+        # output files are closed before they are copied
+        lines.append("wait")
 
         # Save a copy of the output for later reference
-        files_to_save = ["sim.cfg", "sim.stats.sqlite3", "sim.out"]
-        for filename in files_to_save:
+        for filename in SAVED_OUTPUT_FILES:
             lines.append(
                 'cp "{0}" "{1}"/"{2}_{0}"'.format(
                     filename,
@@ -221,9 +255,33 @@ class ExperimentRun:
                     self.experiment_run_no,
                 )
             )
+        lines.append("exit $status")
 
         return "\n".join(lines)
 
+    def get_run_hash(self) -> str:
+        """Return a hash identifying the work done by this ExperimentRun: runs
+        with the same command and configs produce the same results, no matter
+        which Experiment they belong to.
+        """
+        h = hashlib.sha256()
+        for s in (
+            self.command_str,
+            self.config_file_str,
+            self.setup_command_str,
+            self.clean_up_command_str,
+        ):
+            h.update(repr(s).encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get_saved_output_file_path(self, filename: str) -> PathLike:
+        """Return the path the Sniper output file filename is saved to."""
+        return os.path.join(
+            self.experiment_output_directory_abspath,
+            "{}_{}".format(self.experiment_run_no, filename),
+        )
+
     def set_log_str(self, log_str) -> None:
         """Set the log string of this ExperimentRun."""
         self.log_str = log_str
@@ -253,12 +311,18 @@ class Experiment:
         setup_command_str: Optional[str] = None,
         clean_up_command_str: Optional[str] = None,
         post_experiment_processing_function: Optional[Callable[[str], None]] = None,
+        use_trace_cache: bool = False,
     ):
         """Optional parameter post_experiment_processing_function should be a
         callable taking three arguments:
           1) the absolute path of the experiment output directory
           2) the starting experiment number
           3) an opened log file
+
+        If use_trace_cache is True and the ExperimentManager has a TraceCache,
+        the runs of this experiment are simulated from a recorded trace of the
+        benchmark. Traces are recorded for a single thread: only set it for
+        benchmarks known to be single-threaded.
         """
         self.experiment_name = experiment_name
         self.command_str = command_str
@@ -268,14 +332,21 @@ class Experiment:
         self.setup_command_str = setup_command_str
         self.clean_up_command_str = clean_up_command_str
         self.post_experiment_processing_function = post_experiment_processing_function
+        self.use_trace_cache = use_trace_cache
         self.start_time = None
         self._experiment_runs = []
         self._experiment_output_dir_abspath = None
         self._completed_experiment_runs = 0
 
-    def prepare_experiment(self) -> List[ExperimentRun]:
+    def prepare_experiment(
+        self, reuse_output_directory: bool = False
+    ) -> List[ExperimentRun]:
         """Create directory that will eventually contain all finalized experiment
         output, and generate a list of ExperimentRuns.
+
+        If reuse_output_directory is True, an existing output directory of an
+        experiment with the same name is reused (eg when resuming an
+        interrupted sweep) instead of creating a new one.
         """
         # Find a directory name that doesn't already exist
         experiment_output_directory_name = self.experiment_name + "_output_files"
@@ -283,7 +354,9 @@ class Experiment:
             self.output_root_directory, experiment_output_directory_name
         )
         num = 2
-        while os.path.exists(experiment_output_directory):
+        while os.path.exists(experiment_output_directory) and not (
+            reuse_output_directory and os.path.isdir(experiment_output_directory)
+        ):
             experiment_output_directory_name = (
                 self.experiment_name + "_output_files_" + str(num)
             )
@@ -291,7 +364,7 @@ class Experiment:
                 self.output_root_directory, experiment_output_directory_name
             )
             num += 1
-        os.makedirs(experiment_output_directory)
+        os.makedirs(experiment_output_directory, exist_ok=True)
         # Use absolute path from now on so no future results get messed up
         self._experiment_output_dir_abspath = os.path.abspath(
             experiment_output_directory
@@ -307,6 +380,7 @@ class Experiment:
                 self.command_str,
                 self._experiment_output_dir_abspath,
                 config_collection.generate_config_file_str(),
+                use_trace_cache=self.use_trace_cache,
             )
             self._experiment_runs.append(obj)
         return self._experiment_runs.copy()  # Shallow copy
@@ -321,6 +395,16 @@ class Experiment:
         """Return True iff all runs of this experiment are completed."""
         return self._completed_experiment_runs == len(self._experiment_runs)
 
+    def mark_runs_completed(self, log_strs: Dict[int, Optional[str]]) -> None:
+        """Mark all runs of this experiment as completed, eg when they were
+        executed by other workers of a SharedRunQueue, and set their log
+        strings from log_strs ({run number: log string}).
+        """
+        for experiment_run in self._experiment_runs:
+            if log_strs.get(experiment_run.experiment_run_no):
+                experiment_run.set_log_str(log_strs[experiment_run.experiment_run_no])
+        self._completed_experiment_runs = len(self._experiment_runs)
+
     def compile_experiment_log(self) -> PathLike:
         """Create and return a log file from the log strings in this Experiment's
         ExperimentRun objects.
@@ -359,6 +443,666 @@ class Experiment:
                 )
 
 
+class RunResultStore:
+    """Content-addressed store of completed ExperimentRun outputs, keyed by
+    ExperimentRun.get_run_hash(). Lets identical runs of different
+    Experiments execute only once, and lets an interrupted sweep be resumed.
+    """
+
+    def __init__(self, store_directory: PathLike) -> None:
+        self.store_directory_abspath = os.path.abspath(store_directory)
+        os.makedirs(self.store_directory_abspath, exist_ok=True)
+
+    def _run_dir(self, run_hash: str) -> PathLike:
+        return os.path.join(self.store_directory_abspath, run_hash)
+
+    def has_result(self, run_hash: str) -> bool:
+        """Return True iff a completed result with run_hash is in the store."""
+        return os.path.isfile(os.path.join(self._run_dir(run_hash), "complete"))
+
+    def save_result(self, experiment_run: ExperimentRun) -> bool:
+        """Add the saved output files of the completed experiment_run to the
+        store. Return False if some of the output files are missing or the
+        saved sim.out is not that of a finished simulation.
+        """
+        if not all(
+            os.path.isfile(experiment_run.get_saved_output_file_path(filename))
+            for filename in SAVED_OUTPUT_FILES
+        ) or not is_finished_sim_out(experiment_run.get_saved_output_file_path("sim.out")):
+            return False
+        run_dir = self._run_dir(experiment_run.get_run_hash())
+        os.makedirs(run_dir, exist_ok=True)
+        for filename in SAVED_OUTPUT_FILES:
+            _link_or_copy(
+                experiment_run.get_saved_output_file_path(filename),
+                os.path.join(run_dir, filename),
+            )
+        with open(os.path.join(run_dir, "run.log"), "w") as log_file:
+            log_file.write(experiment_run.get_log_str())
+        with open(os.path.join(run_dir, "run_info.txt"), "w") as info_file:
+            info_file.write(
+                "Command:\n{}\n\nConfig:\n{}\n".format(
+                    experiment_run.command_str, experiment_run.get_config_file_str()
+                )
+            )
+        # Mark as complete last, so partially saved results are never used
+        open(os.path.join(run_dir, "complete"), "w").close()
+        return True
+
+    def link_result(self, experiment_run: ExperimentRun) -> None:
+        """Link the stored result with the same hash as experiment_run into
+        experiment_run's experiment output directory, as if it had been run.
+        """
+        run_dir = self._run_dir(experiment_run.get_run_hash())
+        for filename in SAVED_OUTPUT_FILES:
+            _link_or_copy(
+                os.path.join(run_dir, filename),
+                experiment_run.get_saved_output_file_path(filename),
+            )
+        with open(os.path.join(run_dir, "run.log")) as log_file:
+            stored_log_str = log_file.read()
+        experiment_run.set_log_str(
+            "Experiment run {}: reused stored result {}\n".format(
+                experiment_run.experiment_run_no, experiment_run.get_run_hash()
+            )
+            + stored_log_str
+        )
+
+
+def is_finished_sim_out(sim_out_path: PathLike) -> bool:
+    """Return True iff sim_out_path is a sim.out generated at the end of a
+    simulation (run-sniper leaves it empty or missing when the simulation
+    failed).
+    """
+    try:
+        with open(sim_out_path, "r") as sim_out_file:
+            sim_out = sim_out_file.read()
+    except OSError:
+        return False
+    return all(
+        re.search(r"^\s*{}\s*\|".format(re.escape(row)), sim_out, re.MULTILINE)
+        for row in ("Instructions", "IPC", "Time (ns)")
+    )
+
+
+def _link_or_copy(src: PathLike, dst: PathLike) -> None:
+    """Hard link src to dst (replacing dst), copying if linking fails (eg
+    across file systems).
+    """
+    if os.path.exists(dst):
+        if os.path.samefile(src, dst):
+            return
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class TraceCache:
+    """Cache of SIFT traces recorded with record-trace, so the runs of a sweep
+    that only differ in their configs (eg perf_model/dram/*) are simulated
+    from one recorded trace (run-sniper --traces=) instead of each executing
+    the benchmark under Pin.
+
+    Traces are keyed by the benchmark binary, its arguments (input files by
+    path, modification time and size) and the instruction cap of the run
+    (-s stop-by-icount:<icount>, recorded with record-trace -d <icount>).
+    A command is only traced if it is of the form
+    "[cd <dir> && ...] <path>/run-sniper <options> -- <benchmark command> [&& ...]"
+    and doesn't use options a trace cannot reproduce (eg warmup with
+    stop-by-icount:<icount>:<start>, pinballs or MPI). Traces are recorded
+    for a single thread: only use the cache for single-threaded benchmarks
+    (see Experiment's use_trace_cache).
+
+    Recording holds a flock on <trace key>.lock in the cache directory, so
+    one run records a trace and concurrent runs needing it (also of other
+    workers) wait for it instead of recording it again.
+    """
+
+    RUN_SNIPER_PATTERN = re.compile(
+        r"^(?P<prefix>(?:.*(?:&&|;)\s*)?)(?P<sniper>\S*run-sniper)\s+(?P<options>.*?)\s+--\s+(?P<app>.*?)(?P<suffix>\s*(?:&&|;).*)?$"
+    )
+    UNSUPPORTED_OPTIONS_PATTERN = re.compile(
+        r"--traces|--trace-manual|--response-traces|--pinballs|--pid|--mpi|--sift|--frontend|--roi-script|stop-by-icount:\d+:"
+    )
+    ICOUNT_PATTERN = re.compile(r"stop-by-icount:(\d+)")
+    ROI_PATTERN = re.compile(r"(?<!\S)--roi(?!\S)")
+
+    def __init__(self, cache_directory: PathLike) -> None:
+        self.cache_directory_abspath = os.path.abspath(cache_directory)
+        os.makedirs(self.cache_directory_abspath, exist_ok=True)
+
+    def _trace_dir(self, trace_key: str) -> PathLike:
+        return os.path.join(self.cache_directory_abspath, trace_key)
+
+    def has_trace(self, trace_key: str) -> bool:
+        """Return True iff the trace with trace_key has been recorded."""
+        return os.path.isfile(os.path.join(self._trace_dir(trace_key), "trace.sift"))
+
+    def _match(self, command_str: str) -> Optional[typing.Match]:
+        """Return the regex match of command_str if it is traceable, else None."""
+        match = self.RUN_SNIPER_PATTERN.match(command_str.strip())
+        if match is None or self.UNSUPPORTED_OPTIONS_PATTERN.search(
+            match.group("options")
+        ):
+            return None
+        return match
+
+    def get_trace_key(self, command_str: str, execution_dir: PathLike) -> Optional[str]:
+        """Return the key of the trace for command_str executed in
+        execution_dir, or None if the command cannot be simulated from a trace.
+        """
+        match = self._match(command_str)
+        if match is None:
+            return None
+        # The benchmark runs in execution_dir, or where the prefix cd's to
+        app_dir = execution_dir
+        for cd_dir in re.findall(r"(?:^|&&|;)\s*cd\s+(\S+)", match.group("prefix")):
+            # Like cd, resolve .. lexically (execution_dir may not exist yet)
+            app_dir = os.path.normpath(os.path.join(app_dir, cd_dir))
+        try:
+            app_args = shlex.split(match.group("app"))
+        except ValueError:
+            return None
+        if len(app_args) == 0 or "{" in match.group("app"):
+            return None
+        key_parts = []
+        for index, arg in enumerate(app_args):
+            path = os.path.normpath(os.path.join(app_dir, arg))
+            if index == 0 and "/" not in arg:
+                path = shutil.which(arg) or path
+            if os.path.isfile(path):
+                st = os.stat(path)
+                key_parts.append((os.path.realpath(path), st.st_mtime_ns, st.st_size))
+            elif index == 0:
+                return None  # Benchmark binary not found
+            else:
+                key_parts.append(arg)
+        icount = self.ICOUNT_PATTERN.search(match.group("options"))
+        key_parts.append(icount.group(1) if icount else None)
+        key_parts.append(bool(self.ROI_PATTERN.search(match.group("options"))))
+        return hashlib.sha256(repr(key_parts).encode()).hexdigest()
+
+    def get_command_str(self, command_str: str, trace_key: str) -> str:
+        """Return a shell command that simulates command_str from the trace
+        with trace_key (see get_trace_key), recording the trace first if it is
+        not in the cache yet. If recording fails, command_str is executed as is.
+        """
+        match = self._match(command_str)
+        if match is None:
+            return command_str
+        trace_dir = shlex.quote(self._trace_dir(trace_key))
+        lock_file = shlex.quote(self._trace_dir(trace_key) + ".lock")
+        record_dir = trace_dir + ".tmp$$"  # Recordings without flock don't share a directory
+        record_trace = os.path.join(os.path.dirname(match.group("sniper")), "record-trace")
+        icount = self.ICOUNT_PATTERN.search(match.group("options"))
+        record_options = ""
+        if icount:
+            record_options += " -d {}".format(icount.group(1))
+        if self.ROI_PATTERN.search(match.group("options")):
+            # The trace only contains the ROI
+            record_options += " --roi"
+        replay_options = self.ROI_PATTERN.sub("", match.group("options"))
+        replay_command_str = "{}{} {} --traces={}/trace{}".format(
+            match.group("prefix"),
+            match.group("sniper"),
+            replay_options,
+            trace_dir,
+            match.group("suffix") or "",
+        )
+        # Record under the lock (a run that waited for it finds the trace), and
+        # move the recorded trace into place only when complete; if flock is
+        # unavailable, concurrent recordings keep the trace moved first
+        return (
+            "( flock 9 || true; if [ ! -f {trace_dir}/trace.sift ]; then mkdir -p {record_dir} && ( {prefix}{record_trace} -o {record_dir}/trace{record_options} -- {app} ) && [ -f {record_dir}/trace.sift ] && mv -T {record_dir} {trace_dir}; rm -rf {record_dir}; fi ) 9>{lock_file}; "
+            "if [ -f {trace_dir}/trace.sift ]; then {replay}; else {original}; fi"
+        ).format(
+            trace_dir=trace_dir,
+            lock_file=lock_file,
+            record_dir=record_dir,
+            prefix=match.group("prefix"),
+            record_trace=record_trace,
+            record_options=record_options,
+            app=match.group("app"),
+            replay=replay_command_str,
+            original=command_str.strip(),
+        )
+
+
+def get_meminfo() -> Dict[str, int]:
+    """Return the fields of /proc/meminfo in bytes (empty if unavailable)."""
+    meminfo = {}
+    try:
+        with open("/proc/meminfo") as meminfo_file:
+            for line in meminfo_file:
+                fields = line.split()
+                meminfo[fields[0].rstrip(":")] = int(fields[1]) * (
+                    1024 if len(fields) > 2 else 1
+                )
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    return meminfo
+
+
+def get_process_tree_rss_bytes(pid: int) -> Optional[int]:
+    """Return the total resident set size of process pid and all its
+    descendants (eg the shell, run-sniper, Pin and Sniper), or None if it
+    cannot be determined (eg on platforms without /proc).
+    """
+    children = {}
+    try:
+        proc_pids = [int(entry) for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return None
+    for proc_pid in proc_pids:
+        try:
+            with open("/proc/{}/stat".format(proc_pid)) as stat_file:
+                # The command name can contain spaces, the ppid follows it
+                ppid = int(stat_file.read().rsplit(")", 1)[1].split()[1])
+        except (IOError, OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(proc_pid)
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    rss = 0
+    to_visit = [pid]
+    while to_visit:
+        proc_pid = to_visit.pop()
+        to_visit.extend(children.get(proc_pid, []))
+        try:
+            with open("/proc/{}/statm".format(proc_pid)) as statm_file:
+                rss += int(statm_file.read().split()[1]) * page_size
+        except (IOError, OSError, ValueError, IndexError):
+            pass
+    return rss
+
+
+def read_sim_info(sim_info_path: PathLike) -> Optional[Dict]:
+    """Parse the sim.info file written by run-sniper (a pprint'ed Python 2
+    dictionary), or return None if it doesn't exist or cannot be parsed.
+    """
+    try:
+        with open(sim_info_path) as sim_info_file:
+            sim_info_str = sim_info_file.read()
+        # Strip Python 2 long integer suffixes
+        return ast.literal_eval(re.sub(r"\b(\d+)L\b", r"\1", sim_info_str))
+    except (IOError, OSError, ValueError, SyntaxError):
+        return None
+
+
+class ResourceUsageEstimator:
+    """Learn the peak memory use (RSS) and CPU use (average number of busy
+    cores) of ExperimentRuns, to estimate the footprint of future runs. Usage
+    is recorded per exact run (ExperimentRun.get_run_hash()) and per command
+    string (ie benchmark and command line Sniper options, shared by all runs
+    of an Experiment), and persisted to a JSON file so later sweeps can use it.
+    """
+
+    def __init__(self, usage_file_path: PathLike) -> None:
+        self.usage_file_path = usage_file_path
+        self.usage = {"runs": {}, "commands": {}}
+        try:
+            with open(self.usage_file_path) as usage_file:
+                self.usage.update(json.load(usage_file))
+        except (IOError, OSError, ValueError):
+            pass
+
+    @staticmethod
+    def _command_key(experiment_run: ExperimentRun) -> str:
+        return hashlib.sha256(experiment_run.command_str.encode()).hexdigest()
+
+    def record(
+        self, experiment_run: ExperimentRun, peak_rss_bytes: int, cpus: Optional[float]
+    ) -> None:
+        """Record the measured usage of a completed ExperimentRun."""
+        for table, key in (
+            ("runs", experiment_run.get_run_hash()),
+            ("commands", self._command_key(experiment_run)),
+        ):
+            entry = self.usage[table].setdefault(key, {"rss": 0, "cpus": None})
+            entry["rss"] = max(entry["rss"], peak_rss_bytes)
+            if cpus is not None:
+                entry["cpus"] = max(entry["cpus"] or 0, cpus)
+        temp_path = self.usage_file_path + ".tmp"
+        with open(temp_path, "w") as usage_file:
+            json.dump(self.usage, usage_file)
+        os.replace(temp_path, self.usage_file_path)
+
+    def estimate(self, experiment_run: ExperimentRun) -> typing.Tuple[int, float]:
+        """Return the estimated (peak RSS in bytes, number of cores used) of
+        experiment_run. Runs without any recorded usage are assumed to be as
+        large as the largest recorded run, and to use one core.
+        """
+        for table, key in (
+            ("runs", experiment_run.get_run_hash()),
+            ("commands", self._command_key(experiment_run)),
+        ):
+            if key in self.usage[table]:
+                entry = self.usage[table][key]
+                return entry["rss"], entry["cpus"] or 1.0
+        return max((entry["rss"] for entry in self.usage["runs"].values()), default=0), 1.0
+
+
+class RunDurationEstimator:
+    """Learn how long ExperimentRuns take, to predict the duration of future
+    runs. Durations are recorded per exact run (ExperimentRun.get_run_hash()),
+    per command string and values of the salient config keys, and per command
+    string, and persisted to a JSON file so later sweeps can use them. The
+    last max_history durations are kept per command and config values.
+    """
+
+    def __init__(
+        self,
+        history_file_path: PathLike,
+        salient_config_keys: Iterable[str] = SALIENT_CONFIG_KEYS,
+        max_history: int = 10,
+    ) -> None:
+        self.history_file_path = history_file_path
+        self.salient_config_keys = list(salient_config_keys)
+        self.max_history = max_history
+        self.history = {"runs": {}, "configs": {}, "commands": {}}
+        try:
+            with open(self.history_file_path) as history_file:
+                self.history.update(json.load(history_file))
+        except (IOError, OSError, ValueError):
+            pass
+
+    @staticmethod
+    def _command_key(experiment_run: ExperimentRun) -> str:
+        return hashlib.sha256(experiment_run.command_str.encode()).hexdigest()
+
+    def _config_key(self, experiment_run: ExperimentRun) -> str:
+        config = configparser.ConfigParser(interpolation=None)
+        config.read_string(experiment_run.get_config_file_str())
+        h = hashlib.sha256(experiment_run.command_str.encode())
+        for key in self.salient_config_keys:
+            category, name = key.rsplit("/", 1)
+            h.update(b"\0")
+            h.update(repr(config.get(category, name, fallback=None)).encode())
+        return h.hexdigest()
+
+    def record(self, experiment_run: ExperimentRun, duration_seconds: float) -> None:
+        """Record the duration of a successfully completed ExperimentRun."""
+        self.history["runs"][experiment_run.get_run_hash()] = duration_seconds
+        for table, key in (
+            ("configs", self._config_key(experiment_run)),
+            ("commands", self._command_key(experiment_run)),
+        ):
+            durations = self.history[table].setdefault(key, [])
+            durations.append(duration_seconds)
+            del durations[: -self.max_history]
+        temp_path = self.history_file_path + ".tmp"
+        with open(temp_path, "w") as history_file:
+            json.dump(self.history, history_file)
+        os.replace(temp_path, self.history_file_path)
+
+    def estimate(self, experiment_run: ExperimentRun) -> Optional[float]:
+        """Return the predicted duration in seconds of experiment_run: its own
+        last duration, or the median duration of runs with the same command
+        (and salient config values). Runs without any history are assumed to
+        be as long as the longest recorded run. Return None if nothing has
+        been recorded yet.
+        """
+        run_hash = experiment_run.get_run_hash()
+        if run_hash in self.history["runs"]:
+            return self.history["runs"][run_hash]
+        for table, key in (
+            ("configs", self._config_key(experiment_run)),
+            ("commands", self._command_key(experiment_run)),
+        ):
+            if self.history[table].get(key):
+                return statistics.median(self.history[table][key])
+        return max(self.history["runs"].values(), default=None)
+
+
+class SharedRunQueue:
+    """Queue of ExperimentRuns in an SQLite file, shared by the
+    ExperimentManagers of several worker processes (on one or more hosts) that
+    together execute a sweep. A worker atomically claims a run and holds a
+    lease on it, which it renews while the run executes. Runs whose lease
+    expired (eg because their worker crashed) are claimed again by another
+    worker, at most max_attempts times in total. The post experiment
+    processing of an Experiment is done once, by a worker that knows the
+    Experiment, after all of its runs have finished.
+
+    The queue file and the experiment output directories must be on storage
+    shared by all workers, at the same path. SQLite relies on file locking,
+    which is unreliable on some network file systems (eg NFS without lockd).
+    """
+
+    create_stmts = [
+        "CREATE TABLE IF NOT EXISTS `runs` (`id` INTEGER PRIMARY KEY, `experiment` TEXT, `run_no` INTEGER, `run` TEXT, `priority` REAL, `state` TEXT, `worker` TEXT, `lease_expires` REAL, `attempts` INTEGER, `log` TEXT, UNIQUE (`experiment`, `run_no`));",
+        "CREATE INDEX IF NOT EXISTS `idx_runs_state` ON `runs`(`state`);",
+        "CREATE TABLE IF NOT EXISTS `experiments` (`name` TEXT PRIMARY KEY, `post_processing_worker` TEXT);",
+    ]
+
+    def __init__(
+        self,
+        queue_file_path: PathLike,
+        worker_id: Optional[str] = None,
+        lease_seconds: float = 300,
+        max_attempts: int = 3,
+    ) -> None:
+        self.queue_file_path = os.path.abspath(queue_file_path)
+        self.worker_id = worker_id or "{}:{}".format(socket.gethostname(), os.getpid())
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Transactions are started explicitly, BEGIN IMMEDIATE takes the write
+        # lock up front so two workers can never claim the same run
+        self.db = sqlite3.connect(self.queue_file_path, timeout=60, isolation_level=None)
+        self._execute_transaction(
+            lambda: [self.db.execute(stmt) for stmt in self.create_stmts]
+        )
+
+    def _execute_transaction(self, function: Callable[[], typing.Any]) -> typing.Any:
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            result = function()
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+        return result
+
+    def add_experiment_runs(
+        self,
+        experiment_runs: Iterable[ExperimentRun],
+        priorities: Optional[Iterable[float]] = None,
+    ) -> None:
+        """Add ExperimentRuns to the queue; runs with a higher priority are
+        claimed first. Runs already in the queue (same experiment name and run
+        number, eg added by another worker running the same script) are left
+        as they are.
+        """
+        experiment_runs = list(experiment_runs)
+        if priorities is None:
+            priorities = [0.0] * len(experiment_runs)
+        rows = [
+            (
+                experiment_run.experiment_name,
+                experiment_run.experiment_run_no,
+                json.dumps(
+                    {
+                        "command_str": experiment_run.command_str,
+                        "output_dir": experiment_run.experiment_output_directory_abspath,
+                        "config_file_str": experiment_run.config_file_str,
+                        "setup_command_str": experiment_run.setup_command_str,
+                        "clean_up_command_str": experiment_run.clean_up_command_str,
+                        "use_trace_cache": experiment_run.use_trace_cache,
+                    }
+                ),
+                priority,
+            )
+            for experiment_run, priority in zip(experiment_runs, priorities)
+        ]
+
+        def add():
+            self.db.executemany(
+                "INSERT OR IGNORE INTO `experiments` (`name`) VALUES (?)",
+                set((row[0],) for row in rows),
+            )
+            self.db.executemany(
+                "INSERT OR IGNORE INTO `runs` (`experiment`, `run_no`, `run`, `priority`, `state`, `attempts`) VALUES (?, ?, ?, ?, 'queued', 0)",
+                rows,
+            )
+
+        self._execute_transaction(add)
+
+    def claim(
+        self, admit: Optional[Callable[[ExperimentRun], bool]] = None
+    ) -> Optional[typing.Tuple[int, ExperimentRun]]:
+        """Claim the queued run with the highest priority, or a run whose
+        lease expired. Return its queue id and ExperimentRun, or None if
+        there is nothing to claim or admit(ExperimentRun) returns False for
+        the run next in line.
+        """
+
+        def claim():
+            now = time.time()
+            self.db.execute(
+                "UPDATE `runs` SET `state` = 'failed', `log` = ? WHERE `state` = 'running' AND `lease_expires` < ? AND `attempts` >= ?",
+                ("Lease expired {} times\n".format(self.max_attempts), now, self.max_attempts),
+            )
+            row = self.db.execute(
+                "SELECT `id`, `experiment`, `run_no`, `run` FROM `runs` WHERE `state` = 'queued' OR (`state` = 'running' AND `lease_expires` < ?) ORDER BY `priority` DESC, `id` LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            queue_id, experiment_name, run_no, run_json = row
+            run = json.loads(run_json)
+            experiment_run = ExperimentRun(
+                experiment_name,
+                run_no,
+                run["command_str"],
+                run["output_dir"],
+                run["config_file_str"],
+                run["setup_command_str"],
+                run["clean_up_command_str"],
+                run.get("use_trace_cache", False),
+            )
+            if admit is not None and not admit(experiment_run):
+                return None
+            self.db.execute(
+                "UPDATE `runs` SET `state` = 'running', `worker` = ?, `lease_expires` = ?, `attempts` = `attempts` + 1 WHERE `id` = ?",
+                (self.worker_id, now + self.lease_seconds, queue_id),
+            )
+            return queue_id, experiment_run
+
+        return self._execute_transaction(claim)
+
+    def release(self, queue_id: int) -> None:
+        """Put a claimed run that this worker did not start back in the queue."""
+        self._execute_transaction(
+            lambda: self.db.execute(
+                "UPDATE `runs` SET `state` = 'queued', `worker` = NULL, `attempts` = `attempts` - 1 WHERE `id` = ? AND `worker` = ? AND `state` = 'running'",
+                (queue_id, self.worker_id),
+            )
+        )
+
+    def heartbeat(self) -> None:
+        """Renew the leases of all runs this worker is executing."""
+        self._execute_transaction(
+            lambda: self.db.execute(
+                "UPDATE `runs` SET `lease_expires` = ? WHERE `worker` = ? AND `state` = 'running'",
+                (time.time() + self.lease_seconds, self.worker_id),
+            )
+        )
+
+    @contextlib.contextmanager
+    def background_heartbeat(self) -> typing.Iterator[None]:
+        """Context manager that renews the leases of this worker's runs every
+        lease_seconds / 3 from a background thread, while the worker is busy
+        with something else (eg post experiment processing).
+        """
+        self.heartbeat()
+        stop = threading.Event()
+
+        def renew_leases():
+            # SQLite connections can't be shared between threads
+            db = sqlite3.connect(self.queue_file_path, timeout=60, isolation_level=None)
+            try:
+                while not stop.wait(self.lease_seconds / 3):
+                    try:
+                        db.execute("BEGIN IMMEDIATE")
+                        db.execute(
+                            "UPDATE `runs` SET `lease_expires` = ? WHERE `worker` = ? AND `state` = 'running'",
+                            (time.time() + self.lease_seconds, self.worker_id),
+                        )
+                        db.execute("COMMIT")
+                    except sqlite3.OperationalError:
+                        # Queue file busy; try again at the next interval
+                        if db.in_transaction:
+                            db.execute("ROLLBACK")
+            finally:
+                db.close()
+
+        thread = threading.Thread(target=renew_leases, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, queue_id: int, succeeded: bool, log_str: str) -> bool:
+        """Report a run executed by this worker as finished. Return False if
+        the run's lease had expired and it was claimed by another worker.
+        """
+        return self._execute_transaction(
+            lambda: self.db.execute(
+                "UPDATE `runs` SET `state` = ?, `log` = ? WHERE `id` = ? AND `worker` = ? AND `state` = 'running'",
+                ("done" if succeeded else "failed", log_str, queue_id, self.worker_id),
+            ).rowcount
+            == 1
+        )
+
+    def unfinished_runs(self, experiment_name: Optional[str] = None) -> int:
+        """Return the number of runs (of one experiment, or of all) that are
+        queued or being executed.
+        """
+        if experiment_name is None:
+            return self.db.execute(
+                "SELECT COUNT(*) FROM `runs` WHERE `state` IN ('queued', 'running')"
+            ).fetchone()[0]
+        return self.db.execute(
+            "SELECT COUNT(*) FROM `runs` WHERE `experiment` = ? AND `state` IN ('queued', 'running')",
+            (experiment_name,),
+        ).fetchone()[0]
+
+    def claim_post_processing(
+        self, experiment_name: str
+    ) -> Optional[Dict[int, Optional[str]]]:
+        """If all runs of the experiment have finished and no worker has done
+        its post experiment processing yet, claim it for this worker and
+        return the log strings of the runs ({run number: log string}).
+        Otherwise, return None.
+        """
+
+        def claim():
+            if self.db.execute(
+                "SELECT 1 FROM `runs` WHERE `experiment` = ? AND `state` IN ('queued', 'running') LIMIT 1",
+                (experiment_name,),
+            ).fetchone():
+                return None
+            if (
+                self.db.execute(
+                    "UPDATE `experiments` SET `post_processing_worker` = ? WHERE `name` = ? AND `post_processing_worker` IS NULL",
+                    (self.worker_id, experiment_name),
+                ).rowcount
+                == 0
+            ):
+                return None
+            return dict(
+                self.db.execute(
+                    "SELECT `run_no`, `log` FROM `runs` WHERE `experiment` = ?",
+                    (experiment_name,),
+                )
+            )
+
+        return self._execute_transaction(claim)
+
+
 class ExperimentManager:
     class ProcessInfo:
         """Class only used by ExperimentManager, collecting information needed
@@ -370,6 +1114,12 @@ class ExperimentManager:
         experiment_run: Optional[ExperimentRun]
         containing_experiment: Optional[Experiment]
         temp_dir: Optional[PathLike]
+        rss_estimate: int
+        cpus_estimate: float
+        current_rss: int
+        peak_rss: int
+        shared_queue_id: Optional[int]
+        trace_key: Optional[str]
 
         def __init__(self) -> None:
             self.process = None
@@ -378,28 +1128,103 @@ class ExperimentManager:
             self.experiment_run = None
             self.containing_experiment = None
             self.temp_dir = None
+            self.rss_estimate = 0
+            self.cpus_estimate = 0.0
+            self.current_rss = 0
+            self.peak_rss = 0
+            self.shared_queue_id = None
+            self.trace_key = None  # Key of the trace this run is recording
 
     class ProcessQueueInfo:
         """Class only used by ExperimentManager, to keep track of the
         containing Experiment of an ExperimentRun."""
 
         def __init__(
-            self, containing_experiment: Experiment, experiment_run: ExperimentRun
+            self,
+            containing_experiment: Experiment,
+            experiment_run: ExperimentRun,
+            shared_queue_id: Optional[int] = None,
         ) -> None:
             self.containing_experiment = containing_experiment
             self.experiment_run = experiment_run
+            self.shared_queue_id = shared_queue_id
+            # Key of the trace the run is simulated from, see _get_trace_key
+            self.trace_key = None
+            self.trace_key_known = False
+            self.records_trace = False
 
     _pending_experiments: typing.Deque[Experiment]
     _running_experiments: List[Experiment]
     _process_queue: typing.Deque[ProcessQueueInfo]
     _current_concurrent_processes: int
+    _result_store: Optional[RunResultStore]
+    _running_run_hashes: Dict[str, List[ProcessQueueInfo]]
+    _shared_queue: Optional[SharedRunQueue]
+    _shared_experiments: Dict[str, Experiment]
+    _trace_cache: Optional[TraceCache]
+    _recording_traces: Dict[str, List[ProcessQueueInfo]]
 
     def __init__(
         self,
         output_root_directory: PathLike,
         max_concurrent_processes: int,
         log_file: TextIO,
+        result_store_directory: Optional[PathLike] = None,
+        resource_aware: bool = False,
+        max_memory_fraction: float = 0.9,
+        max_cores: Optional[int] = None,
+        resource_sample_interval_seconds: int = 10,
+        predict_durations: bool = False,
+        shared_queue_path: Optional[PathLike] = None,
+        shared_queue_lease_seconds: float = 300,
+        trace_cache_directory: Optional[PathLike] = None,
     ) -> None:
+        """If result_store_directory is specified, completed runs are saved in a
+        RunResultStore there: runs with the same command and configs as a
+        stored or currently running run are not executed again, but have the
+        stored result linked into their experiment output directory. Existing
+        experiment output directories are reused, so rerunning an interrupted
+        sweep only executes the missing runs. Note that the store is keyed only
+        by command and configs; use a new store directory after rebuilding
+        Sniper or changing its inputs.
+
+        If resource_aware is True, at most max_concurrent_processes runs are
+        still started, but a run is only started if its estimated peak memory
+        fits in max_memory_fraction of the machine's memory (and in the
+        currently available memory) and its estimated CPU use fits in
+        max_cores (default: all cores), given the runs already running. Peak
+        memory and CPU use are learned from the sim.info files of completed
+        runs and by sampling the memory use of running runs every
+        resource_sample_interval_seconds, and runs with the largest estimated
+        memory use are started first.
+
+        If predict_durations is True, the duration of every successfully
+        completed run is recorded, the runs of all added experiments are
+        prepared up front and those with the longest predicted duration are
+        started first so long runs don't end up determining the total time of
+        a sweep by starting last, and an estimate of the remaining time is
+        logged after every completed run.
+
+        If shared_queue_path is specified, the runs of all added experiments
+        are put in a SharedRunQueue in that file, and this manager executes
+        runs claimed from it. Several managers (eg the same script started on
+        several hosts, with the output root directory on shared storage) can
+        use the same queue file to execute one sweep together; each run is
+        executed by one of them and the post experiment processing of each
+        experiment is done once. Existing experiment output directories are
+        reused. A worker renews the leases of its runs every
+        shared_queue_lease_seconds / 3 seconds; runs of workers that stopped
+        doing so are executed again by another worker.
+
+        If trace_cache_directory is specified, for experiments with
+        use_trace_cache=True (single-threaded benchmarks), the benchmark of
+        each unique command (binary, input and instruction cap) is executed
+        once to record a SIFT trace in a TraceCache there, and all runs with
+        that command are simulated from the trace instead of executing the
+        benchmark again. Runs that need a trace being recorded wait for it.
+        Other experiments and commands the TraceCache cannot trace are
+        executed as usual.
+        """
         self.output_directory_abspath = os.path.abspath(output_root_directory)
         self.max_concurrent_processes = max_concurrent_processes
         self.log_file = log_file
@@ -407,6 +1232,45 @@ class ExperimentManager:
         self._running_experiments = []  # use list for easier extracting from the middle
         self._process_queue = deque([])  # append, popleft
         self._current_concurrent_processes = 0
+        self._result_store = None
+        if result_store_directory is not None:
+            self._result_store = RunResultStore(
+                os.path.join(self.output_directory_abspath, result_store_directory)
+            )
+        # Hashes of runs currently executing -> identical runs waiting for their result
+        self._running_run_hashes = {}
+        self._resource_estimator = None
+        if resource_aware:
+            self._resource_estimator = ResourceUsageEstimator(
+                os.path.join(self.output_directory_abspath, "resource_usage.json")
+            )
+        self.max_memory_bytes = int(
+            max_memory_fraction * get_meminfo().get("MemTotal", 0)
+        ) or None
+        self.max_cores = max_cores if max_cores is not None else os.cpu_count()
+        self.resource_sample_interval_seconds = resource_sample_interval_seconds
+        self._duration_estimator = None
+        if predict_durations:
+            self._duration_estimator = RunDurationEstimator(
+                os.path.join(self.output_directory_abspath, "run_durations.json")
+            )
+        self._shared_queue = None
+        if shared_queue_path is not None:
+            self._shared_queue = SharedRunQueue(
+                os.path.join(self.output_directory_abspath, shared_queue_path),
+                lease_seconds=shared_queue_lease_seconds,
+            )
+        # Experiments of the runs claimed from the shared queue, by name
+        self._shared_experiments = {}
+        self._trace_cache = None
+        if trace_cache_directory is not None:
+            self._trace_cache = TraceCache(
+                os.path.join(self.output_directory_abspath, trace_cache_directory)
+            )
+        # Keys of traces currently being recorded -> runs waiting for the trace
+        self._recording_traces = {}
+        # Keys of traces that could not be recorded
+        self._failed_trace_keys = set()
 
     # def set_max_concurrent_processes(self, max_concurrent_processes: int) -> None:
     #     self.max_concurrent_processes = max_concurrent_processes
@@ -417,8 +1281,429 @@ class ExperimentManager:
     def add_experiments(self, experiments: Iterable[Experiment]) -> None:
         self._pending_experiments.extend(experiments)
 
+    def _log(self, log_str: str) -> None:
+        print(log_str)
+        print(log_str, file=self.log_file)
+
+    def _reuse_stored_result(self, process_request: ProcessQueueInfo) -> None:
+        """Complete process_request's ExperimentRun using the stored result."""
+        self._result_store.link_result(process_request.experiment_run)
+        process_request.containing_experiment.experiment_run_completed()
+        self._log(
+            "Experiment {} run {} reused stored result {}".format(
+                process_request.experiment_run.experiment_name,
+                process_request.experiment_run.experiment_run_no,
+                process_request.experiment_run.get_run_hash(),
+            )
+        )
+        if process_request.shared_queue_id is not None:
+            self._shared_queue.complete(
+                process_request.shared_queue_id,
+                True,
+                process_request.experiment_run.get_log_str(),
+            )
+
+    def _next_process_request(
+        self, process_info: List[ExperimentManager.ProcessInfo]
+    ) -> Optional[ProcessQueueInfo]:
+        """Pop and return the next ExperimentRun in the process queue that needs
+        to be executed, or None if there is none or it cannot be admitted yet.
+        With a result store, runs that have a stored result are completed right
+        away, and runs identical to a currently executing run wait for its
+        result instead of being executed. With a trace cache, runs that need a
+        trace currently being recorded wait for it.
+        """
+        if self._shared_queue is not None:
+            return self._claim_shared_process_request(process_info)
+        while len(self._process_queue) > 0:
+            process_request = self._process_queue[0]
+            if self._result_store is not None:
+                run_hash = process_request.experiment_run.get_run_hash()
+                if self._result_store.has_result(run_hash):
+                    self._process_queue.popleft()
+                    self._reuse_stored_result(process_request)
+                    continue
+                elif run_hash in self._running_run_hashes:
+                    self._process_queue.popleft()
+                    self._running_run_hashes[run_hash].append(process_request)
+                    continue
+            if self._trace_being_recorded(process_request):
+                self._process_queue.popleft()
+                self._recording_traces[process_request.trace_key].append(process_request)
+                continue
+            if not self._can_admit(process_request, process_info):
+                return None
+            self._process_queue.popleft()
+            if self._result_store is not None:
+                self._running_run_hashes[run_hash] = []
+            self._start_trace_recording(process_request)
+            return process_request
+        return None
+
+    def _get_process_temp_dir(self, process_request: ProcessQueueInfo) -> PathLike:
+        """Return the directory process_request's ExperimentRun is executed in."""
+        return os.path.join(
+            process_request.containing_experiment._experiment_output_dir_abspath,
+            "run_{}".format(process_request.experiment_run.experiment_run_no),
+        )
+
+    def _get_trace_key(self, process_request: ProcessQueueInfo) -> Optional[str]:
+        """Return the key of the trace process_request's ExperimentRun can be
+        simulated from, or None if it should execute its command as is. The
+        key is computed once per run.
+        """
+        if not process_request.trace_key_known:
+            if (
+                self._trace_cache is not None
+                and process_request.experiment_run.use_trace_cache
+            ):
+                process_request.trace_key = self._trace_cache.get_trace_key(
+                    process_request.experiment_run.command_str,
+                    self._get_process_temp_dir(process_request),
+                )
+            process_request.trace_key_known = True
+        if process_request.trace_key in self._failed_trace_keys:
+            return None
+        return process_request.trace_key
+
+    def _trace_being_recorded(self, process_request: ProcessQueueInfo) -> bool:
+        """Return True iff the trace process_request's ExperimentRun is simulated
+        from is being recorded by another run of this manager.
+        """
+        trace_key = self._get_trace_key(process_request)
+        return trace_key is not None and trace_key in self._recording_traces
+
+    def _start_trace_recording(self, process_request: ProcessQueueInfo) -> None:
+        """Let process_request's ExperimentRun, which is about to be started,
+        record its trace if it is not in the cache yet; runs of this manager
+        that need the trace wait for it. (Runs of other workers wait for the
+        trace's lock, see TraceCache.)
+        """
+        trace_key = self._get_trace_key(process_request)
+        if trace_key is not None and not self._trace_cache.has_trace(trace_key):
+            self._recording_traces[trace_key] = []
+            process_request.records_trace = True
+
+    def _trace_recording_finished(self, pi: ExperimentManager.ProcessInfo) -> None:
+        """Requeue the runs that were waiting for the trace recorded by the
+        finished run in process slot pi.
+        """
+        if pi.trace_key is None:
+            return
+        if not self._trace_cache.has_trace(pi.trace_key):
+            self._failed_trace_keys.add(pi.trace_key)
+            self._log(
+                "Experiment {} run {}: recording trace {} failed, runs with the same command execute it as is".format(
+                    pi.experiment_run.experiment_name,
+                    pi.experiment_run.experiment_run_no,
+                    pi.trace_key,
+                )
+            )
+        waiting_requests = self._recording_traces.pop(pi.trace_key, [])
+        self._process_queue.extendleft(reversed(waiting_requests))
+        pi.trace_key = None
+
+    def _publish_pending_experiments(self) -> None:
+        """Add the runs of all pending experiments to the shared queue."""
+        while len(self._pending_experiments) > 0:
+            experiment = self._pending_experiments.popleft()
+            self._running_experiments.append(experiment)
+            self._shared_experiments[experiment.experiment_name] = experiment
+            experiment_runs = experiment.prepare_experiment(reuse_output_directory=True)
+            priorities = None
+            if self._duration_estimator is not None:
+                priorities = [
+                    self._duration_estimator.estimate(experiment_run) or 0.0
+                    for experiment_run in experiment_runs
+                ]
+            self._shared_queue.add_experiment_runs(experiment_runs, priorities)
+
+    def _claim_shared_process_request(
+        self, process_info: List[ExperimentManager.ProcessInfo]
+    ) -> Optional[ProcessQueueInfo]:
+        """Claim the next run to execute from the shared queue, or return None
+        if there is none or it cannot be admitted yet. Runs are only claimed
+        if they can be admitted. Runs that have a stored result are completed
+        right away, runs identical to a run this worker is executing wait for
+        its result (in the process queue if it turns out unusable), and runs
+        that need a trace this worker is recording wait for it.
+        """
+        while True:
+            if len(self._process_queue) > 0:
+                # Already claimed, waited for an identical run without a usable result
+                process_request = self._process_queue[0]
+                if self._result_store is not None:
+                    run_hash = process_request.experiment_run.get_run_hash()
+                    if self._result_store.has_result(run_hash):
+                        self._process_queue.popleft()
+                        self._reuse_stored_result(process_request)
+                        continue
+                    elif run_hash in self._running_run_hashes:
+                        self._process_queue.popleft()
+                        self._running_run_hashes[run_hash].append(process_request)
+                        continue
+                if self._trace_being_recorded(process_request):
+                    self._process_queue.popleft()
+                    self._recording_traces[process_request.trace_key].append(process_request)
+                    continue
+                if not self._can_admit(process_request, process_info):
+                    return None
+                self._process_queue.popleft()
+                if self._result_store is not None:
+                    self._running_run_hashes[run_hash] = []
+                self._start_trace_recording(process_request)
+                return process_request
+            claimed = self._shared_queue.claim(
+                lambda experiment_run: self._can_admit(
+                    ExperimentManager.ProcessQueueInfo(None, experiment_run),
+                    process_info,
+                )
+            )
+            if claimed is None:
+                return None
+            queue_id, experiment_run = claimed
+            experiment = self._shared_experiments.get(experiment_run.experiment_name)
+            if experiment is None:
+                # Run of an experiment added by another worker
+                experiment = Experiment(
+                    experiment_run.experiment_name,
+                    experiment_run.command_str,
+                    [],
+                    self.output_directory_abspath,
+                )
+                experiment._experiment_output_dir_abspath = (
+                    experiment_run.experiment_output_directory_abspath
+                )
+                self._shared_experiments[experiment_run.experiment_name] = experiment
+            process_request = ExperimentManager.ProcessQueueInfo(
+                experiment, experiment_run, queue_id
+            )
+            if self._result_store is not None:
+                run_hash = experiment_run.get_run_hash()
+                if self._result_store.has_result(run_hash):
+                    self._reuse_stored_result(process_request)
+                    continue
+                elif run_hash in self._running_run_hashes:
+                    # The lease of the waiting run is renewed with the others
+                    self._running_run_hashes[run_hash].append(process_request)
+                    continue
+            if self._trace_being_recorded(process_request):
+                self._recording_traces[process_request.trace_key].append(process_request)
+                continue
+            if self._result_store is not None:
+                self._running_run_hashes[run_hash] = []
+            self._start_trace_recording(process_request)
+            return process_request
+
+    def _can_admit(
+        self,
+        process_request: ProcessQueueInfo,
+        process_info: List[ExperimentManager.ProcessInfo],
+    ) -> bool:
+        """Return True iff the estimated memory and CPU use of process_request's
+        ExperimentRun fit next to the currently running runs. A run is always
+        admitted when nothing else is running.
+        """
+        if self._resource_estimator is None:
+            return True
+        running = [pi for pi in process_info if pi.process is not None]
+        if len(running) == 0:
+            return True
+        rss_estimate, cpus_estimate = self._resource_estimator.estimate(
+            process_request.experiment_run
+        )
+        committed_rss = sum(max(pi.rss_estimate, pi.peak_rss) for pi in running)
+        if (
+            self.max_memory_bytes is not None
+            and committed_rss + rss_estimate > self.max_memory_bytes
+        ):
+            return False
+        # Running runs may still grow to their estimated peak
+        expected_growth = sum(
+            max(pi.rss_estimate - pi.current_rss, 0) for pi in running
+        )
+        available_memory = get_meminfo().get("MemAvailable")
+        if (
+            available_memory is not None
+            and rss_estimate + expected_growth > available_memory
+        ):
+            return False
+        if sum(pi.cpus_estimate for pi in running) + cpus_estimate > self.max_cores:
+            return False
+        return True
+
+    def _sort_process_queue(self) -> None:
+        """Order the process queue so runs with the longest predicted duration,
+        and then runs with the largest estimated memory use, are started first,
+        which reduces the time the last large runs take after everything else
+        has finished. Runs with no prediction keep their order.
+        """
+        if self._resource_estimator is None and self._duration_estimator is None:
+            return
+
+        def sort_key(process_request: ExperimentManager.ProcessQueueInfo):
+            duration = 0.0
+            if self._duration_estimator is not None:
+                duration = self._duration_estimator.estimate(process_request.experiment_run) or 0.0
+            rss = 0
+            if self._resource_estimator is not None:
+                rss = self._resource_estimator.estimate(process_request.experiment_run)[0]
+            return duration, rss
+
+        self._process_queue = deque(
+            sorted(self._process_queue, key=sort_key, reverse=True)
+        )
+
+    def _estimate_remaining_seconds(
+        self, process_info: List[ExperimentManager.ProcessInfo]
+    ) -> Optional[float]:
+        """Return the predicted time until all runs in the process queue have
+        completed, assigning queued runs in order to the process slot that
+        frees up first. Return None if there are no predictions.
+        """
+        now = time.time()
+        slots = []
+        for pi in process_info:
+            remaining = 0.0
+            if pi.process is not None:
+                duration = self._duration_estimator.estimate(pi.experiment_run)
+                if duration is None:
+                    return None
+                remaining = max(duration - (now - pi.start_time), 0.0)
+            slots.append(remaining)
+        heapq.heapify(slots)
+        for process_request in self._process_queue:
+            duration = self._duration_estimator.estimate(process_request.experiment_run)
+            if duration is None:
+                return None
+            heapq.heapreplace(slots, slots[0] + duration)
+        return max(slots)
+
+    def _log_eta(
+        self,
+        process_info: List[ExperimentManager.ProcessInfo],
+        timezone: Optional[datetime.tzinfo],
+    ) -> None:
+        if self._duration_estimator is None:
+            return
+        remaining = self._estimate_remaining_seconds(process_info)
+        if remaining is None:
+            return
+        log_str = "Estimated time remaining: {} (ETA {}), {} runs queued".format(
+            datetime.timedelta(seconds=math.ceil(remaining)),
+            (datetime.datetime.now() + datetime.timedelta(seconds=remaining)).astimezone(timezone),
+            len(self._process_queue),
+        )
+        if len(self._pending_experiments) > 0:
+            log_str += ", not counting {} experiments not started yet".format(
+                len(self._pending_experiments)
+            )
+        self._log(log_str)
+
+    def _sample_resource_usage(
+        self, process_info: List[ExperimentManager.ProcessInfo]
+    ) -> None:
+        """Update the current and peak memory use of the running runs."""
+        if self._resource_estimator is None:
+            return
+        for pi in process_info:
+            if pi.process is not None:
+                rss = get_process_tree_rss_bytes(pi.process.pid)
+                if rss is not None:
+                    pi.current_rss = rss
+                    pi.peak_rss = max(pi.peak_rss, rss)
+
+    def _record_resource_usage(self, pi: ExperimentManager.ProcessInfo) -> None:
+        """Learn the resource usage of the finished run in process slot pi from
+        live samples and the sim.info written by run-sniper.
+        """
+        if self._resource_estimator is None:
+            return
+        peak_rss = pi.peak_rss
+        cpus = None
+        sim_info = read_sim_info(os.path.join(pi.temp_dir, "sim.info"))
+        if sim_info is not None and sim_info.get("rusage"):
+            rusage = sim_info["rusage"]
+            peak_rss = max(peak_rss, int(rusage[2]) * 1024)  # ru_maxrss is in KiB
+            if sim_info.get("t_elapsed"):
+                cpus = (rusage[0] + rusage[1]) / sim_info["t_elapsed"]
+        if peak_rss > 0:
+            self._resource_estimator.record(pi.experiment_run, peak_rss, cpus)
+
+    def _process_request_finished(
+        self, process_request: ProcessQueueInfo, succeeded: bool
+    ) -> None:
+        """Save the result of a finished ExperimentRun in the result store, and
+        complete the identical runs that were waiting for it.
+        """
+        if self._result_store is None:
+            return
+        run_hash = process_request.experiment_run.get_run_hash()
+        waiting_requests = self._running_run_hashes.pop(run_hash, [])
+        if succeeded and self._result_store.save_result(process_request.experiment_run):
+            for waiting_request in waiting_requests:
+                self._reuse_stored_result(waiting_request)
+        else:
+            # No usable result; execute the waiting runs themselves
+            self._process_queue.extendleft(reversed(waiting_requests))
+
+    @staticmethod
+    def _wait_for_process_exit(
+        process_info: List[ExperimentManager.ProcessInfo],
+        poll_interval_seconds: int,
+        timeout_seconds: Optional[float] = None,
+    ) -> None:
+        """Block until at least one of the running processes in process_info
+        has exited, or until timeout_seconds have passed. The exited process is
+        not reaped, so its Popen.poll() will still return its exit status.
+        """
+        running_pids = set(
+            pi.process.pid for pi in process_info if pi.process is not None
+        )
+        if len(running_pids) == 0:
+            return
+        # Only the processes of this manager are waited for: waiting for any
+        # child could reap unrelated children (eg started by post experiment
+        # processing) before their Popen does
+        pidfds = []
+        try:
+            for pid in running_pids:
+                pidfds.append(os.pidfd_open(pid))
+            # A pidfd becomes readable when its process exits
+            select.select(pidfds, [], [], timeout_seconds)
+            return
+        except (AttributeError, OSError):
+            pass  # pidfd_open not available (Python < 3.9, Linux < 5.3 or not Linux)
+        finally:
+            for pidfd in pidfds:
+                os.close(pidfd)
+        if timeout_seconds is None and len(running_pids) == 1 and hasattr(os, "waitid"):
+            try:
+                # WNOWAIT leaves the child waitable so Popen can reap it
+                os.waitid(os.P_PID, running_pids.pop(), os.WEXITED | os.WNOWAIT)
+            except ChildProcessError:
+                pass  # Already reaped
+            return
+        # Fall back to polling the processes
+        deadline = None if timeout_seconds is None else time.time() + timeout_seconds
+        while all(
+            pi.process is None or pi.process.poll() is None for pi in process_info
+        ):
+            if deadline is None:
+                time.sleep(poll_interval_seconds)
+            elif time.time() < deadline:
+                time.sleep(min(poll_interval_seconds, max(deadline - time.time(), 0)))
+            else:
+                return
+
     def start(self, manager_sleep_interval_seconds: int = 60, timezone: Optional[datetime.tzinfo] = None) -> None:
-        """Start running Experiment's added to this ExperimentManager."""
+        """Start running Experiment's added to this ExperimentManager.
+
+        The manager wakes up as soon as a running ExperimentRun exits, so a
+        freed process slot is refilled immediately. manager_sleep_interval_seconds
+        is only used as the polling interval on platforms without
+        os.pidfd_open (with several running processes, or without os.waitid).
+        """
         os.chdir(self.output_directory_abspath)
         process_info = [
             ExperimentManager.ProcessInfo()
@@ -426,10 +1711,19 @@ class ExperimentManager:
         ]
 
         try:
+            if self._shared_queue is not None:
+                self._publish_pending_experiments()
             while (
                 len(self._pending_experiments) > 0
                 or len(self._process_queue) > 0
                 or sum(pi.process is None for pi in process_info) != len(process_info)
+                or (
+                    self._shared_queue is not None
+                    and (
+                        len(self._running_experiments) > 0
+                        or self._shared_queue.unfinished_runs() > 0
+                    )
+                )
             ):
                 if (
                     len(self._process_queue) < self.max_concurrent_processes
@@ -438,41 +1732,50 @@ class ExperimentManager:
                 ):
                     # Replenish self._process_queue if there are more experiments yet to be started,
                     # and there is a free process slot
-                    experiment = self._pending_experiments.popleft()
-                    self._running_experiments.append(experiment)
-                    experiment_runs = experiment.prepare_experiment()
-                    for experiment_run in experiment_runs:
-                        self._process_queue.append(
-                            ExperimentManager.ProcessQueueInfo(
-                                experiment, experiment_run
-                            )
+                    if self._duration_estimator is not None:
+                        # Rank the runs of all pending experiments by predicted
+                        # duration, not only those of the next experiment
+                        experiments = list(self._pending_experiments)
+                        self._pending_experiments.clear()
+                    else:
+                        experiments = [self._pending_experiments.popleft()]
+                    for experiment in experiments:
+                        self._running_experiments.append(experiment)
+                        experiment_runs = experiment.prepare_experiment(
+                            reuse_output_directory=self._result_store is not None
+                            or self._shared_queue is not None
                         )
+                        for experiment_run in experiment_runs:
+                            self._process_queue.append(
+                                ExperimentManager.ProcessQueueInfo(
+                                    experiment, experiment_run
+                                )
+                            )
+                    self._sort_process_queue()
+
+                self._sample_resource_usage(process_info)
 
+                no_process_request = False
                 for index in range(len(process_info)):
-                    if (
-                        process_info[index].process is None
-                        and len(self._process_queue) > 0
-                    ):
-                        process_request = self._process_queue.popleft()
+                    if process_info[index].process is None:
+                        process_request = self._next_process_request(process_info)
+                        if process_request is None:
+                            no_process_request = True
+                            continue
                         process_info[
                             index
                         ].experiment_run = process_request.experiment_run
                         process_info[
                             index
                         ].containing_experiment = process_request.containing_experiment
+                        process_info[index].shared_queue_id = process_request.shared_queue_id
+                        process_info[index].trace_key = (
+                            process_request.trace_key if process_request.records_trace else None
+                        )
 
                         # Create temp dir
-                        process_temp_dir_name = "run_{}".format(
-                            process_info[index].experiment_run.experiment_run_no
-                        )
-                        process_temp_dir = os.path.join(
-                            process_info[
-                                index
-                            ].containing_experiment._experiment_output_dir_abspath,
-                            process_temp_dir_name,
-                        )
-                        if not os.path.isdir(process_temp_dir):
-                            os.makedirs(process_temp_dir)
+                        process_temp_dir = self._get_process_temp_dir(process_request)
+                        os.makedirs(process_temp_dir, exist_ok=True)
                         process_info[index].temp_dir = process_temp_dir
 
                         # Change current working directory to that of the process to spawn
@@ -486,6 +1789,15 @@ class ExperimentManager:
                                 process_info[index].experiment_run.get_config_file_str()
                             )
 
+                        # Simulate from the cached trace of the benchmark, recording it first if needed
+                        command_str = None
+                        trace_key = self._get_trace_key(process_request)
+                        if trace_key is not None:
+                            command_str = self._trace_cache.get_command_str(
+                                process_info[index].experiment_run.command_str,
+                                trace_key,
+                            )
+
                         # Create ExperimentRun execution script
                         execution_script_path = "experiment_run_{}.sh".format(
                             process_info[index].experiment_run.experiment_run_no
@@ -497,7 +1809,7 @@ class ExperimentManager:
                             # use current directory for Sniper output since we're already in the process' temp dir
                             execution_script.write(
                                 process_info[index]
-                                .experiment_run.get_execution_script_str()
+                                .experiment_run.get_execution_script_str(command_str)
                                 .format(sniper_output_dir=os.path.abspath("."))  # sniper_output_dir should be an absolute path
                             )
                         os.chmod(
@@ -520,6 +1832,15 @@ class ExperimentManager:
                             text=True,
                         )
                         process_info[index].start_time = time.time()
+                        process_info[index].current_rss = 0
+                        process_info[index].peak_rss = 0
+                        if self._resource_estimator is not None:
+                            (
+                                process_info[index].rss_estimate,
+                                process_info[index].cpus_estimate,
+                            ) = self._resource_estimator.estimate(
+                                process_info[index].experiment_run
+                            )
                         log_str = "Process {} for experiment {} run {} started at time {}".format(
                             index,
                             process_info[index].experiment_run.experiment_name,
@@ -554,6 +1875,18 @@ class ExperimentManager:
                             )
                             print(log_str)
                             print(log_str, file=self.log_file)
+                            if (
+                                ret == 0
+                                and self._duration_estimator is not None
+                                and is_finished_sim_out(
+                                    os.path.join(process_info[index].temp_dir, "sim.out")
+                                )
+                            ):
+                                # Only learn from runs that finished their simulation
+                                self._duration_estimator.record(
+                                    process_info[index].experiment_run,
+                                    end_time - process_info[index].start_time,
+                                )
 
                             process_info[
                                 index
@@ -569,15 +1902,61 @@ class ExperimentManager:
                             )
                             process_info[index].log_file.close()
                             process_info[index].log_file = None
-
-                            time.sleep(2)  # give a bit of time for things to settle in
+                            self._record_resource_usage(process_info[index])
+                            self._trace_recording_finished(process_info[index])
+
+                            self._process_request_finished(
+                                ExperimentManager.ProcessQueueInfo(
+                                    process_info[index].containing_experiment,
+                                    process_info[index].experiment_run,
+                                ),
+                                ret == 0,
+                            )
+                            if self._shared_queue is not None and not self._shared_queue.complete(
+                                process_info[index].shared_queue_id,
+                                ret == 0,
+                                process_info[index].experiment_run.get_log_str(),
+                            ):
+                                self._log(
+                                    "Experiment {} run {}: lease expired, result of the run is not reported to the shared queue".format(
+                                        process_info[index].experiment_run.experiment_name,
+                                        process_info[index].experiment_run.experiment_run_no,
+                                    )
+                                )
+                            self._log_eta(process_info, timezone)
 
                 # Process experiments that have all runs completed
                 i = 0
                 while i < len(self._running_experiments):
-                    if self._running_experiments[i].experiment_done():
+                    if self._shared_queue is not None:
+                        # Runs may have been executed by other workers, one of
+                        # which does the post experiment processing
+                        experiment_done = (
+                            self._shared_queue.unfinished_runs(
+                                self._running_experiments[i].experiment_name
+                            )
+                            == 0
+                        )
+                        post_process = False
+                        if experiment_done:
+                            log_strs = self._shared_queue.claim_post_processing(
+                                self._running_experiments[i].experiment_name
+                            )
+                            if log_strs is not None:
+                                self._running_experiments[i].mark_runs_completed(log_strs)
+                                post_process = True
+                    else:
+                        experiment_done = post_process = self._running_experiments[
+                            i
+                        ].experiment_done()
+                    if post_process:
                         try:
-                            self._running_experiments[i].post_experiment_processing()
+                            if self._shared_queue is not None:
+                                # Post experiment processing can take longer than a lease
+                                with self._shared_queue.background_heartbeat():
+                                    self._running_experiments[i].post_experiment_processing()
+                            else:
+                                self._running_experiments[i].post_experiment_processing()
                         except Exception as e:
                             log_str = "Error occurred while running post experiment processing for experiment '{}':".format(
                                 self._running_experiments[i].experiment_name
@@ -587,6 +1966,7 @@ class ExperimentManager:
                             # Print exception details but don't let this post-processing crash the entire ExperimentManager
                             traceback.print_exc()
                             traceback.print_exc(file=self.log_file)
+                    if experiment_done:
                         log_str = "Experiment {} complete".format(
                             self._running_experiments[i].experiment_name
                         )
@@ -596,9 +1976,45 @@ class ExperimentManager:
                     else:
                         i += 1
 
-                if len(self._process_queue) > 0 or len(self._pending_experiments) == 0:
-                    # Can sleep for a while since don't need to check processes that often; reduce CPU usage
-                    time.sleep(manager_sleep_interval_seconds)
+                if self._shared_queue is not None:
+                    if any(pi.process is not None for pi in process_info):
+                        self._shared_queue.heartbeat()
+                    if no_process_request or all(
+                        pi.process is not None for pi in process_info
+                    ):
+                        # Nothing more to claim for now; wake up when a run exits, or to
+                        # renew leases and to check for runs with expired leases
+                        heartbeat_interval = self._shared_queue.lease_seconds / 3
+                        if any(pi.process is not None for pi in process_info):
+                            self._wait_for_process_exit(
+                                process_info,
+                                manager_sleep_interval_seconds,
+                                heartbeat_interval,
+                            )
+                        elif self._shared_queue.unfinished_runs() > 0:
+                            time.sleep(min(manager_sleep_interval_seconds, heartbeat_interval))
+                    continue
+
+                free_slot_available = any(pi.process is None for pi in process_info)
+                work_available = (
+                    len(self._process_queue) > 0 or len(self._pending_experiments) > 0
+                )
+                admission_blocked = (
+                    len(self._process_queue) > 0
+                    and not self._can_admit(self._process_queue[0], process_info)
+                )
+                if not (
+                    free_slot_available and work_available and not admission_blocked
+                ) and any(pi.process is not None for pi in process_info):
+                    # Nothing to start until a running process exits; block until one does
+                    # (with resource awareness, also wake up periodically to sample memory use)
+                    self._wait_for_process_exit(
+                        process_info,
+                        manager_sleep_interval_seconds,
+                        self.resource_sample_interval_seconds
+                        if self._resource_estimator is not None
+                        else None,
+                    )
 
         except KeyboardInterrupt:
             pass  # Cleanup is done in the finally block
@@ -50,7 +50,12 @@ class SniperStatsBase:
 
 
 def SniperStats(resultsdir = '.', jobid = None):
-    import sniper_stats_sqlite
-    stats = sniper_stats_sqlite.SniperStatsSqlite(os.path.join(resultsdir, 'sim.stats.sqlite3'))
+    if not os.path.exists(os.path.join(resultsdir, 'sim.stats.sqlite3')) and os.path.exists(os.path.join(resultsdir, 'sim.stats.db')):
+        # Runs archived from older Sniper versions
+        import sniper_stats_db
+        stats = sniper_stats_db.SniperStatsDb(os.path.join(resultsdir, 'sim.stats.db'))
+    else:
+        import sniper_stats_sqlite
+        stats = sniper_stats_sqlite.SniperStatsSqlite(os.path.join(resultsdir, 'sim.stats.sqlite3'))
     stats.config = sniper_lib.get_config(jobid, resultsdir)
     return stats
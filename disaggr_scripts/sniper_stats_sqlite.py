@@ -5,6 +5,13 @@ class SniperStatsSqlite(sniper_stats.SniperStatsBase):
     self.db = sqlite3.connect(filename)
     self.db.text_factory = str # Don't try to convert database contents to UTF-8
     self.names = self.read_metricnames()
+    # Precomputed deltas, added by tools/sniper_stats_optimize.py
+    self.has_deltas = bool(self.db.execute('SELECT name FROM sqlite_master WHERE type="table" AND name="deltapairs"').fetchall())
+    # Delta-encoded snapshots, written by sim.stats.write_delta: a snapshot is the sum of all deltas up to its own prefixid
+    if self.db.execute('SELECT name FROM sqlite_master WHERE type="table" AND name="deltaprefixes"').fetchall():
+      self.deltaprefixids = sorted([ prefixid for (prefixid,) in self.db.execute('select prefixid from `deltaprefixes`') ])
+    else:
+      self.deltaprefixids = []
 
   def get_snapshots(self):
     snapshots = []
@@ -22,27 +29,74 @@ class SniperStatsSqlite(sniper_stats.SniperStatsBase):
       names[nameid] = (objectname, metricname)
     return names
 
-  def read_snapshot(self, prefix, metrics = None):
-    c = self.db.cursor()
-    c.execute('select prefixid from `prefixes` where prefixname = ?', (prefix,))
-    prefixids = list(c)
+  def get_namefilter(self, metrics):
+    if metrics:
+      nameids = [ str(nameid) for nameid, (objectname, metricname) in list(self.names.items()) if '%s.%s' % (objectname, metricname) in metrics ]
+      return ' and nameid in (%s)' % ','.join(nameids)
+    else:
+      return ''
+
+  def get_prefixid(self, prefix):
+    prefixids = self.db.execute('select prefixid from `prefixes` where prefixname = ?', (prefix,)).fetchall()
     if prefixids:
-      prefixid = prefixids[0][0]
-      if metrics:
-        nameids = [ str(nameid) for nameid, (objectname, metricname) in list(self.names.items()) if '%s.%s' % (objectname, metricname) in metrics ]
-        namefilter = ' and nameid in (%s)' % ','.join(nameids)
-      else:
-        namefilter = ''
-      values = {}
-      c = self.db.cursor()
-      c.execute('select nameid, core, value from `values` where prefixid = ? %s' % namefilter, (prefixid,))
-      for nameid, core, value in c:
-        if nameid not in values: values[nameid] = {}
-        values[nameid][core] = value
-      return values
+      return prefixids[0][0]
     else:
       raise ValueError('Invalid prefix %s' % prefix)
 
+  def parse_stats(self, partial, ncores, metrics = None):
+    (k1, k2) = partial
+    if self.has_deltas:
+      prefixids = (self.get_prefixid(k1), self.get_prefixid(k2))
+      if self.db.execute('select 1 from `deltapairs` where prefixid0 = ? and prefixid1 = ?', prefixids).fetchall():
+        return self.parse_stats_deltas(prefixids, (k1, k2), ncores, metrics)
+    return sniper_stats.SniperStatsBase.parse_stats(self, (k1, k2), ncores, metrics = metrics)
+
+  def parse_stats_deltas(self, prefixids, partial, ncores, metrics = None):
+    # Same output as SniperStatsBase.parse_stats, but using the precomputed end-minus-begin values
+    (k1, k2) = partial
+    deltas = {}
+    c = self.db.cursor()
+    c.execute('select nameid, core, value from `deltas` where prefixid0 = ? and prefixid1 = ? %s' % self.get_namefilter(metrics), prefixids)
+    for nameid, core, value in c:
+      if nameid not in deltas: deltas[nameid] = {}
+      deltas[nameid][core] = value
+    # Absolute begin and end times are still needed to find the interval boundaries
+    timemetrics = ('performance_model.elapsed_time', 'barrier.global_time')
+    v1 = self.read_snapshot(k1, metrics = timemetrics)
+    v2 = self.read_snapshot(k2, metrics = timemetrics)
+    results = []
+    for metricid in list(self.names.keys()):
+      name = '%s.%s' % self.names[metricid]
+      if metrics and name not in metrics:
+        continue
+      vals = deltas.get(metricid, {})
+      id_min = min(min(list(vals.keys()) or [0]), 0)
+      id_max = max(max(list(vals.keys()) or [0])+1, ncores)
+      results += [ (name, idx, vals.get(idx, 0)) for idx in range(id_min, id_max) ]
+      vals1 = v1.get(metricid, {})
+      vals2 = v2.get(metricid, {})
+      if name == 'performance_model.elapsed_time':
+        results += [ ('performance_model.elapsed_time_begin', idx, vals1.get(idx, 0)) for idx in range(ncores) ]
+        results += [ ('performance_model.elapsed_time_end', idx, vals2.get(idx, 0)) for idx in range(ncores) ]
+      elif name == 'barrier.global_time':
+        results += [ ('barrier.global_time_begin', idx, vals1.get(idx, 0)) for idx in range(ncores) ]
+        results += [ ('barrier.global_time_end', idx, vals2.get(idx, 0)) for idx in range(ncores) ]
+    return results
+
+  def read_snapshot(self, prefix, metrics = None):
+    prefixid = self.get_prefixid(prefix)
+    namefilter = self.get_namefilter(metrics)
+    values = {}
+    c = self.db.cursor()
+    if prefixid in self.deltaprefixids:
+      c.execute('select nameid, core, sum(value) from `deltavalues` where prefixid <= ? %s group by nameid, core having sum(value) != 0' % namefilter, (prefixid,))
+    else:
+      c.execute('select nameid, core, value from `values` where prefixid = ? %s' % namefilter, (prefixid,))
+    for nameid, core, value in c:
+      if nameid not in values: values[nameid] = {}
+      values[nameid][core] = value
+    return values
+
   def get_topology(self):
     c = self.db.cursor()
     return c.execute('SELECT componentname, coreid, masterid FROM topology').fetchall()
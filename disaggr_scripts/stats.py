@@ -3,7 +3,8 @@ from enum import Enum, auto
 from itertools import starmap
 
 def get_ipc(res_directory):
-    res = sniper_lib.get_results(resultsdir=res_directory)
+    res = sniper_lib.get_results(resultsdir=res_directory, outputs=[
+        'barrier.global_time', 'performance_model.instruction_count', 'core.instructions', 'fs_to_cycles_cores'])
     results = res['results']
     config = res['config']
     ncores = int(config['general/total_cores'])
@@ -37,7 +38,7 @@ def get_ipc(res_directory):
 
 def get_time(res_dir):
     # Return execution time in milliseconds
-    res = sniper_lib.get_results(resultsdir=res_dir)
+    res = sniper_lib.get_results(resultsdir=res_dir, outputs=['barrier.global_time'])
     results = res['results']
     config = res['config']
 
@@ -55,7 +56,11 @@ def get_time(res_dir):
     return float(results['performance_model.elapsed_time_fixed'][0]) / (10 ** 12)
 
 def get_compression_stats(res_dir):
-    res = sniper_lib.get_results(resultsdir=res_dir)
+    res = sniper_lib.get_results(resultsdir=res_dir, outputs=[
+        'compression.bytes-saved', 'compression.cacheline-bytes-saved', 'dram.page-moves',
+        'compression.total-compression-latency', 'compression.total-decompression-latency', 'dram.remote-reads',
+        'dram.remote-writes', 'compression.total-cacheline-compression-latency',
+        'compression.total-cacheline-decompression-latency'])
     results = res['results']
     config = res['config']
 
@@ -87,7 +92,9 @@ def get_compression_stats(res_dir):
     return cr, cl, dl, ccr, ccl, cdl
 
 def get_average_bw(res_dir):
-    res = sniper_lib.get_results(resultsdir=res_dir)
+    res = sniper_lib.get_results(resultsdir=res_dir, outputs=[
+        'dram.remote-reads', 'dram.remote-writes', 'dram.total-bw-utilization-sum',
+        'dram.cacheline-bw-utilization-sum', 'dram.page-bw-utilization-sum'])
     results = res['results']
 
     # weighted_average = 0
@@ -109,7 +116,10 @@ def get_average_bw(res_dir):
     return list(results['dram.avg-bw-utilization'])[0] * 100
 
 def get_average_bw_queueing_delay(res_dir):
-    res = sniper_lib.get_results(resultsdir=res_dir)
+    res = sniper_lib.get_results(resultsdir=res_dir, outputs=[
+        'dram-datamovement-queue.num-requests', 'dram-datamovement-queue.num-cacheline-requests',
+        'dram-datamovement-queue.num-page-requests', 'dram-datamovement-queue.total-queue-delay',
+        'dram-datamovement-queue.total-cacheline-queue-delay', 'dram-datamovement-queue.total-page-queue-delay'])
     results = res['results']
     if 'dram-datamovement-queue.num-cacheline-requests' in results and sum(results['dram-datamovement-queue.num-requests']) > 0:
         avg_queue1_delay = (0.25 * results['dram-datamovement-queue.total-cacheline-queue-delay'][0] + 0.75 * results['dram-datamovement-queue.total-page-queue-delay'][0]) / (results['dram-datamovement-queue.num-cacheline-requests'][0] + results['dram-datamovement-queue.num-page-requests'][0])
@@ -121,7 +131,8 @@ def get_average_bw_queueing_delay(res_dir):
     return avg_queue1_delay
 
 def get_local_dram_hit_rate(res_dir):
-    res = sniper_lib.get_results(resultsdir=res_dir)
+    res = sniper_lib.get_results(resultsdir=res_dir, outputs=[
+        'dram.reads', 'dram.writes', 'dram.remote-reads', 'dram.remote-writes'])
     results = res['results']
 
     results['dram.accesses'] = results['dram.reads'][0] + results['dram.writes'][0]
@@ -133,7 +144,9 @@ def get_local_dram_hit_rate(res_dir):
     return ((results['dram.local-reads'] + results['dram.local-writes']) /  float(results['dram.accesses'])) * 100
 
 def get_weighted_dram_latency(res_dir):
-    res = sniper_lib.get_results(resultsdir=res_dir)
+    res = sniper_lib.get_results(resultsdir=res_dir, outputs=[
+        'dram.reads', 'dram.writes', 'dram.remote-reads', 'dram.remote-writes', 'dram.total-local-access-latency',
+        'dram.total-remote-access-latency'])
     results = res['results']
 
     results['dram.accesses'] = [results['dram.reads'][0] + results['dram.writes'][0]]
@@ -150,7 +163,9 @@ def get_weighted_dram_latency(res_dir):
     return weighted_local_lat, weighted_remote_lat
 
 def get_inflight_page_stats(res_dir):
-    res = sniper_lib.get_results(resultsdir=res_dir)
+    res = sniper_lib.get_results(resultsdir=res_dir, outputs=[
+        'dram.max-total-bufferspace', 'dram.max-inflight-bufferspace', 'dram.max-inflight-extra-bufferspace',
+        'dram.max-inflightevicted-bufferspace'])
     results = res['results']
 
     total = results['dram.max-total-bufferspace']                       # max simultaneous # inflight pages, both directions (bufferspace)
@@ -160,7 +175,11 @@ def get_inflight_page_stats(res_dir):
     return total[0], inflight[0], inflight_extra[0], inflightevicted[0]  # return stats for Core 0
 
 def get_inflight_cacheline_stats(res_dir):
-    res = sniper_lib.get_results(resultsdir=res_dir)
+    res = sniper_lib.get_results(resultsdir=res_dir, outputs=[
+        'dram.reads', 'dram.writes', 'dram.sum-simultaneous-inflight-cachelines-reads',
+        'dram.sum-simultaneous-inflight-cachelines-writes', 'dram.sum-simultaneous-inflight-cachelines-total',
+        'dram.max-simultaneous-inflight-cachelines-reads', 'dram.max-simultaneous-inflight-cachelines-writes',
+        'dram.max-simultaneous-inflight-cachelines-total'])
     results = res['results']
     results['dram.accesses'] = list(map(sum, zip(results['dram.reads'], results['dram.writes'])))
 
@@ -199,9 +218,26 @@ class PageLatencies(Enum):
     # DRAM_HW_WRITE_QUEUE_DELAY = auto()
     DRAM_HW_WRITE_PROCESSING_TIME_AND_QUEUE_DELAY = auto()
 
+# Statistics read by populate_latency_breakdown
+LATENCY_BREAKDOWN_OUTPUTS = [
+    'dram.reads', 'dram.writes', 'dram.remote-reads', 'dram.remote-writes', 'dram.total-local-dram-hardware-latency',
+    'dram.total-local-dram-hardware-latency-count', 'dram.total-local-dram-hardware-latency-processing-time',
+    'dram.total-local-dram-hardware-latency-queue-delay', 'dram.total-remote-dram-hardware-latency-pages',
+    'dram.total-remote-dram-hardware-latency-pages-count',
+    'dram.total-remote-dram-hardware-latency-pages-processing-time',
+    'dram.total-remote-dram-hardware-latency-pages-queue-delay', 'dram.total-local-dram-hardware-write-latency-pages',
+    'dram.total-remote-dram-hardware-latency-cachelines', 'dram.total-remote-dram-hardware-latency-cachelines-count',
+    'dram.total-remote-dram-hardware-latency-cachelines-processing-time',
+    'dram.total-remote-dram-hardware-latency-cachelines-queue-delay', 'dram.total-network-cacheline-processing-time',
+    'dram.total-network-cacheline-queue-delay', 'dram.total-remote-to-local-cacheline-move-count',
+    'dram.total-network-page-processing-time', 'dram.total-network-page-queue-delay',
+    'dram.total-remote-to-local-page-move-count', 'dram.total-remote-access-latency',
+    'dram.total-remote-datamovement-latency', 'compression.bytes-saved', 'dram.page-moves',
+    'compression.total-compression-latency', 'compression.total-decompression-latency']
+
 def populate_latency_breakdown(res_dir, cacheline_latencies, page_latencies):
     # Assume NETWORK_LATENCY and DRAM_HW_WRITE_FIXED_LATENCY (in ns) are already prepopulated in cacheline_latencies and page_latencies
-    res = sniper_lib.get_results(resultsdir=res_dir)
+    res = sniper_lib.get_results(resultsdir=res_dir, outputs=LATENCY_BREAKDOWN_OUTPUTS)
     results = res['results']
     config = res['config']
     ncores = int(config['general/total_cores'])
@@ -0,0 +1,83 @@
+# Python 3
+"""Ingest a small synthetic run into a results warehouse: summable per-core
+counters (including total latencies) reach load_dataframe as totals, gauges
+and rates are only stored per core.
+
+Run with: python3 -m unittest test_results_warehouse (from disaggr_scripts)
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import results_warehouse
+
+NCORES = 2
+SIM_CFG = """[general]
+total_cores = {}
+[perf_model/core]
+frequency = 2.66
+[perf_model/dram]
+localdram_size = 8388608
+""".format(NCORES)
+# (objectname, metricname): per-core values at roi-begin and roi-end
+STATS = {
+    ("performance_model", "elapsed_time"): ([1000000, 1000000], [3000000, 3000000]),
+    ("barrier", "global_time"): ([1000000], [3000000]),
+    ("performance_model", "instruction_count"): ([100, 200], [1100, 2200]),
+    ("dram", "reads"): ([10, 20], [40, 70]),
+    ("dram", "total-remote-access-latency"): ([500, 700], [2500, 4700]),
+    ("dram", "max-bufferspace"): ([0, 0], [8, 5]),
+}
+
+
+def write_run(experiment_dir, run):
+    with open(os.path.join(experiment_dir, "{}_sim.cfg".format(run)), "w") as f:
+        f.write(SIM_CFG)
+    db = sqlite3.connect(os.path.join(experiment_dir, "{}_sim.stats.sqlite3".format(run)))
+    db.execute("CREATE TABLE `names` (nameid INTEGER, objectname TEXT, metricname TEXT)")
+    db.execute("CREATE TABLE `prefixes` (prefixid INTEGER, prefixname TEXT)")
+    db.execute("CREATE TABLE `values` (prefixid INTEGER, nameid INTEGER, core INTEGER, value INTEGER)")
+    db.executemany(
+        "INSERT INTO `prefixes` VALUES (?, ?)", [(1, "roi-begin"), (2, "roi-end")]
+    )
+    for nameid, ((objectname, metricname), snapshots) in enumerate(STATS.items()):
+        db.execute("INSERT INTO `names` VALUES (?, ?, ?)", (nameid, objectname, metricname))
+        for prefixid, values in enumerate(snapshots, 1):
+            db.executemany(
+                "INSERT INTO `values` VALUES (?, ?, ?, ?)",
+                [(prefixid, nameid, core, value) for core, value in enumerate(values)],
+            )
+    db.commit()
+    db.close()
+
+
+class ResultsWarehouseTest(unittest.TestCase):
+    def test_counters_reach_dataframe(self):
+        with tempfile.TemporaryDirectory() as root:
+            experiment_dir = os.path.join(root, "exp_output_files")
+            os.makedirs(experiment_dir)
+            write_run(experiment_dir, 1)
+            warehouse_path = os.path.join(root, results_warehouse.WAREHOUSE_FILENAME)
+
+            counts = results_warehouse.ingest(root, warehouse_path, workers=1)
+            self.assertEqual(counts["added"], 1)
+            df = results_warehouse.load_dataframe(warehouse_path)
+
+            self.assertEqual(len(df), 1)
+            self.assertEqual(df["dram.total-remote-access-latency"][0], 2000 + 4000)
+            self.assertEqual(df["dram.reads"][0], 30 + 50)
+            self.assertEqual(df["perf_model/dram/localdram_size"][0], 8388608)
+            for key in ("dram.max-bufferspace", "ipc", "performance_model.elapsed_time"):
+                self.assertNotIn(key, df.columns)
+
+            with sqlite3.connect(warehouse_path) as db:
+                max_bufferspace = db.execute(
+                    "SELECT `core`, `value` FROM `core_stats` WHERE `key` = ? ORDER BY `core`",
+                    ("dram.max-bufferspace",),
+                ).fetchall()
+            self.assertEqual(max_bufferspace, [(0, 8), (1, 5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
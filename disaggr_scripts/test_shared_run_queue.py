@@ -0,0 +1,98 @@
+# Python 3
+"""Two ExperimentManager workers executing one sweep through a shared
+SharedRunQueue: every run is executed exactly once, and the post experiment
+processing of every experiment is done once.
+
+Run with: python3 -m unittest test_shared_run_queue (from disaggr_scripts)
+"""
+import collections
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+this_file_containing_dir_abspath = os.path.dirname(os.path.abspath(__file__))
+
+WORKER_SCRIPT = textwrap.dedent(
+    """
+    import os, sys
+    sys.path.insert(0, {scripts_dir!r})
+    from run_sniper_repeat_base import ConfigEntry, Experiment, ExperimentManager, ExperimentRunConfig
+
+    output_root = {output_root!r}
+
+    def post_experiment_processing(output_dir, start_experiment_no, log_file):
+        with open(os.path.join(output_root, "post_processed"), "a") as f:
+            f.write(os.path.basename(output_dir) + "\\n")
+
+    experiments = []
+    for name in ("a", "b"):
+        run_configs = [
+            ExperimentRunConfig([ConfigEntry("perf_model/dram", "latency", str(latency))])
+            for latency in range(6)
+        ]
+        # Each run appends its (unique) run directory; {{sniper_output_dir}} is required in commands
+        command_str = "pwd >> {{0}}/executed; sleep 0.2; touch sim.cfg sim.out sim.stats.sqlite3 # {{{{sniper_output_dir}}}}".format(output_root)
+        experiments.append(
+            Experiment(
+                name,
+                command_str,
+                run_configs,
+                output_root,
+                post_experiment_processing_function=post_experiment_processing,
+            )
+        )
+    with open(os.path.join(output_root, "worker_{{}}.log".format(os.getpid())), "w") as log_file:
+        experiment_manager = ExperimentManager(
+            output_root_directory=output_root,
+            max_concurrent_processes=2,
+            log_file=log_file,
+            shared_queue_path="run_queue.sqlite3",
+            shared_queue_lease_seconds=30,
+        )
+        experiment_manager.add_experiments(experiments)
+        experiment_manager.start(manager_sleep_interval_seconds=1)
+    """
+)
+
+
+class SharedRunQueueTest(unittest.TestCase):
+    def test_two_workers_execute_every_run_once(self):
+        with tempfile.TemporaryDirectory() as output_root:
+            script = WORKER_SCRIPT.format(
+                scripts_dir=this_file_containing_dir_abspath, output_root=output_root
+            )
+            workers = [
+                subprocess.Popen(
+                    [sys.executable, "-c", script],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.STDOUT,
+                )
+                for _ in range(2)
+            ]
+            for worker in workers:
+                self.assertEqual(worker.wait(timeout=120), 0)
+
+            with open(os.path.join(output_root, "executed")) as f:
+                executed = collections.Counter(
+                    os.path.relpath(line.strip(), output_root) for line in f
+                )
+            expected = [
+                os.path.join("{}_output_files".format(name), "run_{}".format(run_no))
+                for name in ("a", "b")
+                for run_no in range(1, 7)
+            ]
+            self.assertEqual(sorted(executed), sorted(expected))
+            self.assertTrue(all(count == 1 for count in executed.values()), executed)
+
+            with open(os.path.join(output_root, "post_processed")) as f:
+                post_processed = collections.Counter(line.strip() for line in f)
+            self.assertEqual(
+                post_processed, {"a_output_files": 1, "b_output_files": 1}
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
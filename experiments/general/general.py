@@ -1259,7 +1259,11 @@ with open(log_filename, "w") as log_file:
     print(log_str, file=log_file)
 
     experiment_manager = automation.ExperimentManager(
-        output_root_directory=".", max_concurrent_processes=48, log_file=log_file
+        output_root_directory=".",
+        max_concurrent_processes=48,
+        log_file=log_file,
+        result_store_directory="run_result_store",  # Run identical runs once; resume interrupted sweeps
+        resource_aware=True,  # Admit runs based on learned memory/CPU use
     )
     experiment_manager.add_experiments(experiments)
     # compiled_application_checker(experiments)
@@ -3,8 +3,13 @@ import numpy as np
 import matplotlib as plt
 plt.use('Agg')
 import os
+import signal
+import json
+import hashlib
+import functools
 import subprocess
 import threading
+import concurrent.futures
 
 import sys
 sys.path.insert(1, '../../tools')
@@ -70,40 +75,128 @@ def log_compression_stats(res_directory, result_filename, program_command, confi
         f.write("Average Decompression Latency(ns): {}\n\n".format(avg_decompression_latency))
         f.close()
 
-def sweep_thread(data, result_filename, config_name, config_param, val, program_command, cwd):
-    run_directory = "./{}-{}-{}".format(result_filename, config_param.split("/")[-1], val)
+def run_sniper(run_directory, config_name, config_settings, program_command, cwd, timeout=None):
+    # config_settings is a list of (config_param, val), each passed to run-sniper as -g --config_param=val
     sniper_path = os.path.abspath("../../run-sniper")
     output_directory = os.path.abspath("./{}".format(run_directory))
     if not cwd: cwd = run_directory
-    command = "{} -v -n 1 -c {} -g --{}={} -d {} -- {}".format(sniper_path, config_name, config_param, val, output_directory, program_command)
-    subprocess.call("mkdir {}".format(run_directory), shell=True)
-    subprocess.call(command, shell=True, cwd=cwd)
+    settings = " ".join("-g --{}={}".format(config_param, val) for config_param, val in config_settings)
+    command = "{} -v -n 1 -c {} {} -d {} -- {}".format(sniper_path, config_name, settings, output_directory, program_command)
+    os.makedirs(run_directory, exist_ok=True)
+    # Own process group, so a timeout kills the simulator and not just the shell that started it
+    proc = subprocess.Popen(command, shell=True, cwd=cwd, start_new_session=True)
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+        raise
+
+class SweepExecutor:
+    """Runs the simulations of all sweeps of a script on a fixed number of workers.
+
+    Sweeps and configurations can still be started from as many threads as before,
+    but at most `workers` simulations run at the same time. The worker count and the
+    per-run timeout (in seconds) default to $SWEEP_WORKERS (number of cpus) and
+    $SWEEP_TIMEOUT (none).
+    """
+    def __init__(self, workers=None, timeout=None):
+        self.workers = workers or int(os.environ.get("SWEEP_WORKERS", 0)) or os.cpu_count()
+        self.timeout = timeout or float(os.environ.get("SWEEP_TIMEOUT", 0)) or None
+        # Each worker thread only waits on its run-sniper process
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+
+    def run_one(self, run, val):
+        try:
+            return run(val, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            print("Sweep value {} timed out after {} seconds".format(val, self.timeout))
+        except Exception as e:
+            print("Sweep value {} failed: {}".format(val, e))
+        return None
+
+    def run_sweep(self, values, run, state_filename=None):
+        """Calls run(val, timeout=...) for each sweep value, returns {val: result}.
+
+        Results are written to state_filename as they come in. Values found there from an
+        earlier, interrupted invocation are not simulated again. Failed or timed out runs
+        have a result of None and are not saved, so they are retried the next time.
+        """
+        state = load_sweep_state(state_filename)
+        results = {}
+        futures = {}
+        for val in values:
+            if str(val) in state:
+                results[val] = state[str(val)]
+            elif val not in futures.values():
+                futures[self.pool.submit(self.run_one, run, val)] = val
+        for future in concurrent.futures.as_completed(futures):
+            val = futures[future]
+            results[val] = future.result()
+            if results[val] is not None and state_filename:
+                state[str(val)] = results[val]
+                save_sweep_state(state_filename, state)
+        failed = [val for val in futures.values() if results[val] is None]
+        if failed:
+            print("{} of {} sweep values failed and are retried on the next invocation: {}".format(
+                len(failed), len(values), ", ".join(str(val) for val in failed)))
+        return results
+
+def sweep_state_filename(name, config_name, config_params, program_command, cwd):
+    """State file of a sweep, named after a hash of everything the simulations depend on
+    besides the sweep values, so results of a different config or benchmark are never reused.
+    """
+    h = hashlib.sha256()
+    config_path = config_name if os.path.exists(config_name) else config_name + ".cfg"
+    config_contents = open(config_path).read() if os.path.exists(config_path) else None
+    for part in (config_name, config_contents, list(config_params), program_command, cwd and os.path.abspath(cwd)):
+        h.update(repr(part).encode())
+        h.update(b"\0")
+    return "./{}-{}.json".format(name, h.hexdigest()[:16])
+
+def sweep_frame(data):
+    # Sweep values for which a run failed (None) are reported and left out
+    df = pd.DataFrame(data)
+    failed = df.isnull().any(axis=1)
+    if failed.any():
+        print("Leaving out {} sweep values with failed runs:\n{}".format(failed.sum(), df[failed]))
+    return df[~failed]
+
+def load_sweep_state(state_filename):
+    if not state_filename or not os.path.exists(state_filename):
+        return {}
+    with open(state_filename) as f:
+        return json.load(f)
+
+def save_sweep_state(state_filename, state):
+    # Write to a temporary file first, a crash while saving must not lose the results so far
+    with open(state_filename + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(state_filename + ".tmp", state_filename)
+
+executor = SweepExecutor()
+
+def sweep_thread(result_filename, config_name, config_param, program_command, cwd, val, timeout=None):
+    run_directory = "./{}-{}-{}".format(result_filename, config_param.split("/")[-1], val)
+    run_sniper(run_directory, config_name, [(config_param, val)], program_command, cwd, timeout)
     ipc = get_ipc(run_directory)
     print(ipc)
-    data['IPC'].append(ipc)
     log_compression_stats(run_directory, "{}.log".format(result_filename), program_command, config_param, val)
     # subprocess.call("rm -r {}".format(run_directory), shell=True)
+    return ipc
 
 def run_experiment(x_axis, x_axis_init, result_filename, config_name, config_param, program_command, cwd):
-
-    data = {x_axis:x_axis_init,
-            'IPC':[]}
-
-    thread_pool = []
-    for val in x_axis_init:
-        t = threading.Thread(target=sweep_thread, args=(data, result_filename, config_name, config_param, val, program_command, cwd))
-        thread_pool.append(t)
-        t.start()
-
-    for t in thread_pool:
-        t.join()
+    # IPC of each value of x_axis_init, in sweep order
+    state_filename = sweep_state_filename("{}-{}".format(result_filename, config_param.split("/")[-1]), config_name, [config_param], program_command, cwd)
+    run = functools.partial(sweep_thread, result_filename, config_name, config_param, program_command, cwd)
+    results = executor.run_sweep(x_axis_init, run, state_filename)
 
     # df = pd.DataFrame(data)
     # graph = df.plot(x=x_axis, y="IPC")
     # fig = graph.get_figure()
     # fig.savefig(result_filename)
 
-    return data['IPC']
+    return [results[val] for val in x_axis_init]
 
 def thread_experiment(x_axis, x_axis_init, result_filename, config_name, config_param, program_command, res, cwd
 ):
@@ -139,7 +232,7 @@ def run_compression_queue_experiment(x_axis, x_axis_label, x_axis_config_param,
         'C: Off, P: On': no_compression_yes_partition_queues,
         'C: On, P: On': yes_compression_yes_partition_queues
     }
-    df = pd.DataFrame(data)
+    df = sweep_frame(data)
     graph = df.plot(x=x_axis_label, y=["C: Off, P: Off", "C: Off, P: On", "C: On, P: On"], kind="bar")
     fig = graph.get_figure()
     fig.savefig(result_name)
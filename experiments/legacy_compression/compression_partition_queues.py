@@ -30,7 +30,7 @@ def run_compression_queue_experiment(x_axis, x_axis_label, x_axis_config_param,
         'C: Off, P: On': no_compression_yes_partition_queues,
         'C: On, P: On': yes_compression_yes_partition_queues
     }
-    df = pd.DataFrame(data)
+    df = sweep_frame(data)
     graph = df.plot(x=x_axis_label, y=["C: Off, P: Off", "C: Off, P: On", "C: On, P: On"], kind="bar")
     fig = graph.get_figure()
     fig.savefig(result_name)
@@ -22,7 +22,7 @@ def run_compression_vs_no_compression_experiment(x_axis, x_axis_label, x_axis_co
         'C: Off': no_compression,
         'C: On': yes_compression
     }
-    df = pd.DataFrame(data)
+    df = sweep_frame(data)
     graph = df.plot(x=x_axis_label, y=["C: Off", "C: On"], kind="bar")
     fig = graph.get_figure()
     fig.savefig(result_name)
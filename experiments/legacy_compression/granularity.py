@@ -16,7 +16,7 @@ def run_gran(config_name, compression_name, benchmark_name, x_axis, x_axis_label
         x_axis_label: x_axis,
         'IPC': bdi
     }
-    df = pd.DataFrame(data)
+    df = sweep_frame(data)
     graph = df.plot(x=x_axis_label, y="IPC")
     fig = graph.get_figure()
     fig.savefig("{}.png".format(result_name))
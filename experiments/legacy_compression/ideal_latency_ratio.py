@@ -1,39 +1,25 @@
 #!/usr/bin/env python
 from base import *
 
-def sweep_thread_two_config(data, result_filename, config_name, config_param1, config_param2, val, program_command, cwd):
+def sweep_thread_two_config(result_filename, config_name, config_param1, config_param2, program_command, cwd, val, timeout=None):
     run_directory = "./{}-{}-{}".format(result_filename, config_param1.split("/")[-1], val)
-    sniper_path = os.path.abspath("../../run-sniper")
-    output_directory = os.path.abspath("./{}".format(run_directory))
-    if not cwd: cwd = run_directory
-    command = "{} -v -n 1 -c {} -g --{}={} -g --{}={} -d {} -- {}".format(sniper_path, config_name, config_param1, val, config_param2, val, output_directory, program_command)
-    subprocess.call("mkdir {}".format(run_directory), shell=True)
-    subprocess.call(command, shell=True, cwd=cwd)
+    run_sniper(run_directory, config_name, [(config_param1, val), (config_param2, val)], program_command, cwd, timeout)
     ipc = get_ipc(run_directory)
     print(ipc)
-    data['IPC'].append(ipc)
     log_compression_stats(run_directory, "{}.log".format(result_filename), program_command, config_param1, val)
+    return ipc
 
 def run_experiment_two_config(x_axis, x_axis_init, result_filename, config_name, config_param1, config_param2, program_command, cwd):
-
-    data = {x_axis:x_axis_init,
-            'IPC':[]}
-
-    thread_pool = []
-    for val in x_axis_init:
-        t = threading.Thread(target=sweep_thread_two_config, args=(data, result_filename, config_name, config_param1, config_param2, val, program_command, cwd))
-        thread_pool.append(t)
-        t.start()
-
-    for t in thread_pool:
-        t.join()
+    state_filename = sweep_state_filename("{}-{}".format(result_filename, config_param1.split("/")[-1]), config_name, [config_param1, config_param2], program_command, cwd)
+    run = functools.partial(sweep_thread_two_config, result_filename, config_name, config_param1, config_param2, program_command, cwd)
+    results = executor.run_sweep(x_axis_init, run, state_filename)
 
     # df = pd.DataFrame(data)
     # graph = df.plot(x=x_axis, y="IPC")
     # fig = graph.get_figure()
     # fig.savefig(result_filename)
 
-    return data['IPC']
+    return [results[val] for val in x_axis_init]
 
 def thread_experiment_two_config(x_axis, x_axis_init, result_filename, config_name, config_param1, config_param2, program_command, res, cwd
 ):
@@ -58,7 +44,7 @@ def run_ideal_ratio(x_axis, x_axis_label, x_axis_config_param, x_axis_config_par
         x_axis_label: x_axis,
         'C: On': yes_compression,
     }
-    df = pd.DataFrame(data)
+    df = sweep_frame(data)
     graph = df.plot(x=x_axis_label, y=["C: On"], kind="bar")
     fig = graph.get_figure()
     fig.savefig(result_name)
@@ -81,7 +67,7 @@ def run_ideal_latency(x_axis, x_axis_label, x_axis_config_param, program_command
         x_axis_label: x_axis,
         'C: On': yes_compression,
     }
-    df = pd.DataFrame(data)
+    df = sweep_frame(data)
     graph = df.plot(x=x_axis_label, y=["C: On"], kind="bar")
     fig = graph.get_figure()
     fig.savefig(result_name)
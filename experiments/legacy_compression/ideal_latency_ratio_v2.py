@@ -1,40 +1,28 @@
 #!/usr/bin/env python
 from base import *
 
-def sweep_thread_two_config(data, result_filename, config_name, config_param1, config_param2, config_param3, val1, val2, program_command, bench_name, cwd):
+def sweep_thread_two_config(result_filename, config_name, config_param1, config_param2, config_param3, program_command, bench_name, cwd, vals, timeout=None):
+    val1, val2 = vals
     run_directory = "./{}-{}-{}-{}-{}-{}".format(bench_name, result_filename, config_param1.split("/")[-1], val1, config_param3.split("/")[-1], val2)
-    sniper_path = os.path.abspath("../../run-sniper")
-    output_directory = os.path.abspath("./{}".format(run_directory))
-    if not cwd: cwd = run_directory
-    command = "{} -v -n 1 -c {} -g --{}={} -g --{}={} -g --{}={} -d {} -- {}".format(sniper_path, config_name, config_param1, val1, config_param2, val1, config_param3, val2, output_directory, program_command)
-    subprocess.call("mkdir {}".format(run_directory), shell=True)
-    subprocess.call(command, shell=True, cwd=cwd)
+    run_sniper(run_directory, config_name, [(config_param1, val1), (config_param2, val1), (config_param3, val2)], program_command, cwd, timeout)
     ipc = get_ipc(run_directory)
     print(ipc)
-    data['IPC'].append(ipc)
     #log_compression_stats(run_directory, "{}.log".format(result_filename), program_command, config_param1, val1, config_param3, val2)
+    return ipc
 
 def run_experiment_two_config(x_axis, x_axis1, x_axis2, result_filename, config_name, config_param1, config_param2, config_param3, program_command, bench_name, cwd):
-
-    data = {x_axis:x_axis1,
-            'IPC':[]}
-
-    thread_pool = []
-    for val1 in x_axis1:
-        for val2 in x_axis2:
-            t = threading.Thread(target=sweep_thread_two_config, args=(data, result_filename, config_name, config_param1, config_param2, config_param3, val1, val2, program_command, bench_name, cwd))
-            thread_pool.append(t)
-            t.start()
-
-    for t in thread_pool:
-        t.join()
+    # IPC of all (val1, val2) combinations, val2 varying fastest
+    values = [(val1, val2) for val1 in x_axis1 for val2 in x_axis2]
+    state_filename = sweep_state_filename("{}-{}-{}-{}".format(bench_name, result_filename, config_param1.split("/")[-1], config_param3.split("/")[-1]), config_name, [config_param1, config_param2, config_param3], program_command, cwd)
+    run = functools.partial(sweep_thread_two_config, result_filename, config_name, config_param1, config_param2, config_param3, program_command, bench_name, cwd)
+    results = executor.run_sweep(values, run, state_filename)
 
     # df = pd.DataFrame(data)
     # graph = df.plot(x=x_axis, y="IPC")
     # fig = graph.get_figure()
     # fig.savefig(result_filename)
 
-    return data['IPC']
+    return [results[vals] for vals in values]
 
 def thread_experiment_two_config(x_axis, x_axis1, x_axis2, result_filename, config_name, config_param1, config_param2, config_param3, program_command, res, bench_name, cwd
 ):
@@ -59,7 +47,7 @@ def run_ideal_ratio(x_axis1, x_axis2, x_axis_label, x_axis_config_param, x_axis_
         x_axis_label: x_axis,
         'C: On': yes_compression,
     }
-    df = pd.DataFrame(data)
+    df = sweep_frame(data)
     graph = df.plot(x=x_axis_label, y=["C: On"], kind="bar")
     fig = graph.get_figure()
     fig.savefig(result_name)
@@ -82,7 +70,7 @@ def run_ideal_latency(x_axis, x_axis_label, x_axis_config_param, program_command
         x_axis_label: x_axis,
         'C: On': yes_compression,
     }
-    df = pd.DataFrame(data)
+    df = sweep_frame(data)
     graph = df.plot(x=x_axis_label, y=["C: On"], kind="bar")
     fig = graph.get_figure()
     fig.savefig(result_name)
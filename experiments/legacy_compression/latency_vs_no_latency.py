@@ -22,7 +22,7 @@ def run_latency_vs_no_latency(x_axis, x_axis_label, x_axis_config_param, program
         'CL: Off': no_compression_latency,
         'CL: On': yes_compression_latency,
     }
-    df = pd.DataFrame(data)
+    df = sweep_frame(data)
     graph = df.plot(x=x_axis_label, y=["CL: Off", "CL: On"], kind="bar")
     fig = graph.get_figure()
     fig.savefig(result_name)
@@ -25,7 +25,7 @@ def run_gran(compression_name, benchmark_name, x_axis, x_axis_label, x_axis_conf
         'C: On, CL: Off': multipage_yes_compression_no_latency,
         'C: On, CL: On': multipage_yes_compression_yes_latency
     }
-    df = pd.DataFrame(data)
+    df = sweep_frame(data)
     graph = df.plot(x=x_axis_label, y=["C: Off", "C: On, CL: Off", "C: On, CL: On"], kind="bar")
     fig = graph.get_figure()
     fig.savefig("{}-{}".format(benchmark_name, result_name))
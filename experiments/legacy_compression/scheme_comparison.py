@@ -31,7 +31,7 @@ def run_gran(benchmark_name, x_axis, x_axis_label, x_axis_config_param, program_
         'lz4': lz4,
         'fve': fve
     }
-    df = pd.DataFrame(data)
+    df = sweep_frame(data)
     graph = df.plot(x=x_axis_label, y=["c0", "bdi", "fpc", "lz4", "fve"], kind="bar")
     fig = graph.get_figure()
     fig.savefig("{}-{}".format(benchmark_name, result_name))
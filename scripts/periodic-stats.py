@@ -4,6 +4,8 @@ periodic-stats.py
 Periodically write out all statistics
 1st argument is the interval size in nanoseconds (default is 1e9 = 1 second of simulated time)
 2rd argument, if present will limit the number of snapshots and dynamically remove itermediate data
+3rd argument, if "delta", stores each snapshot as the difference to the previous one (only changed values are written);
+  intermediate snapshots are then merged into the next one instead of deleted
 """
 
 import sim
@@ -12,7 +14,12 @@ class PeriodicStats:
   def setup(self, args):
     args = dict(enumerate((args or '').split(':')))
     interval = long(args.get(0, '') or 1000000000)
-    self.max_snapshots = long(args.get(1, 0))
+    self.max_snapshots = long(args.get(1, '') or 0)
+    self.delta = args.get(2, '') == 'delta'
+    if self.delta:
+      self.write, self.remove = sim.stats.write_delta, sim.util.db_merge_delta
+    else:
+      self.write, self.remove = sim.stats.write, sim.util.db_delete
     self.num_snapshots = 0
     self.interval = long(interval * sim.util.Time.NS)
     self.next_interval = float('inf')
@@ -22,7 +29,7 @@ class PeriodicStats:
   def hook_roi_begin(self):
     self.in_roi = True
     self.next_interval = sim.stats.time() + self.interval
-    sim.stats.write('periodic-0')
+    self.write('periodic-0')
 
   def hook_roi_end(self):
     self.next_interval = float('inf')
@@ -32,12 +39,12 @@ class PeriodicStats:
     if self.max_snapshots and self.num_snapshots > self.max_snapshots:
       self.num_snapshots /= 2
       for t in range(self.interval, time, self.interval * 2):
-        sim.util.db_delete('periodic-%d' % t)
+        self.remove('periodic-%d' % t)
       self.interval *= 2
 
     if time >= self.next_interval:
       self.num_snapshots += 1
-      sim.stats.write('periodic-%d' % (self.num_snapshots * self.interval))
+      self.write('periodic-%d' % (self.num_snapshots * self.interval))
       self.next_interval += self.interval
 
 sim.util.register(PeriodicStats())
@@ -1,15 +1,31 @@
 """
 Write out all statistics every 1M cycles and run a partial McPAT
+1st argument is the interval size in nanoseconds (default is 1000000)
+2nd argument is the number of background McPAT processes (default is 2). The statistics of each interval are handed
+  to a background process so the simulation does not wait for McPAT, all results are collected in power-trace.py
+  at the end of the simulation. Use 0 to run McPAT at every interval while the simulation waits.
+3rd argument, if "model", evaluates a per-architecture energy model instead of running McPAT for every interval
+  (see tools/mcpat.py --model)
 """
 
-import sys, os, sim
+import sys, os, collections, cPickle, subprocess, pprint, sim
 
 class PowerTrace:
   def setup(self, args):
     args = dict(enumerate((args or '').split(':')))
     interval_ns = long(args.get(0, '') or 1000000)
+    self.max_workers = int(args.get(1, '') or 2)
+    self.model = args.get(2, '') == 'model'
     sim.util.Every(interval_ns * sim.util.Time.NS, self.periodic, roi_only = True)
     self.t_last = 0
+    self.names = {}
+    self.topology = None
+    self.snapshot_last = None # (prefix, values) of the end of the last interval
+    self.pending = collections.deque() # McPAT commands waiting for a free worker
+    self.running = []
+    self.intervals = [] # (t0, t1, outputbase) of all intervals handed to the workers
+    self.worker_env = dict(os.environ)
+    self.worker_env.pop('PYTHONHOME', None)
 
   def periodic(self, time, time_delta):
     time = long(time/1e6) # fs to ns
@@ -25,16 +41,86 @@ class PowerTrace:
 
   def hook_sim_end(self):
     self.do_power(self.t_last, None)
+    if self.max_workers:
+      self.collect()
 
   def do_power(self, t0, t1):
     _t0 = t0 or 'roi-begin'
     _t1 = t1 or 'roi-end'
     if not t1: t1 = self.t_roi_end
-    os.system('unset PYTHONHOME; %s -d %s -o %s --partial=%s:%s --no-graph' % (
-      os.path.join(os.getenv('SNIPER_ROOT'), 'tools/mcpat.py'),
-      sim.config.output_dir,
-      os.path.join(sim.config.output_dir, 'power-%s-%s-%s' % (t0, t1, t1 - t0)),
-      _t0, _t1
-    ))
+    outputbase = os.path.join(sim.config.output_dir, 'power-%s-%s-%s' % (t0, t1, t1 - t0))
+    if self.max_workers:
+      snapshotfile = outputbase + '.snapshot'
+      self.write_snapshot(snapshotfile, str(_t0), str(_t1))
+      self.intervals.append((t0, t1, outputbase))
+      self.pending.append([
+        os.path.join(os.getenv('SNIPER_ROOT'), 'tools/mcpat.py'),
+        '-d', sim.config.output_dir,
+        '-o', outputbase,
+        '--partial=%s:%s' % (_t0, _t1),
+        '--snapshot=%s' % snapshotfile,
+        '--no-graph', '--no-text',
+      ] + (self.model and [ '--model' ] or []))
+      self.start_workers()
+    else:
+      os.system('unset PYTHONHOME; %s -d %s -o %s --partial=%s:%s --no-graph%s' % (
+        os.path.join(os.getenv('SNIPER_ROOT'), 'tools/mcpat.py'),
+        sim.config.output_dir,
+        outputbase,
+        _t0, _t1,
+        self.model and ' --model' or ''
+      ))
+
+  def read_snapshot(self, prefix):
+    values = {}
+    for nameid, core, value in sim.stats.db.execute('SELECT nameid, core, value FROM `values` WHERE prefixid IN (SELECT prefixid FROM prefixes WHERE prefixname = ?)', (prefix,)):
+      values.setdefault(nameid, {})[core] = value
+    return values
+
+  def write_snapshot(self, filename, prefix0, prefix1):
+    # Hand the begin and end statistics of this interval to the worker (see tools/sniper_stats_snapshot.py),
+    # the end of this interval is the begin of the next one so each snapshot is only read once
+    if not self.snapshot_last or self.snapshot_last[0] != prefix0:
+      self.snapshot_last = (prefix0, self.read_snapshot(prefix0))
+    snapshot = (prefix1, self.read_snapshot(prefix1))
+    if [ nameid for nameid in snapshot[1] if nameid not in self.names ]:
+      # Metrics can be registered at any time, reread the names only when new ones appear
+      self.names = dict([ (nameid, (str(objectname), str(metricname))) for nameid, objectname, metricname in sim.stats.db.execute('SELECT nameid, objectname, metricname FROM names') ])
+    if self.topology is None:
+      self.topology = [ (str(name), coreid, masterid) for name, coreid, masterid in sim.stats.db.execute('SELECT componentname, coreid, masterid FROM topology') ]
+    data = {
+      'names': self.names,
+      'prefixes': [ prefix0, prefix1 ],
+      'snapshots': dict([ self.snapshot_last, snapshot ]),
+      'topology': self.topology,
+    }
+    fp = open(filename, 'wb')
+    cPickle.dump(data, fp, cPickle.HIGHEST_PROTOCOL)
+    fp.close()
+    self.snapshot_last = snapshot
+
+  def start_workers(self):
+    # Forget about finished workers and start pending intervals on the free slots, without waiting for anything
+    self.running = [ proc for proc in self.running if proc.poll() is None ]
+    while self.pending and len(self.running) < self.max_workers:
+      self.running.append(subprocess.Popen(self.pending.popleft(), env = self.worker_env))
+
+  def collect(self):
+    while self.pending or self.running:
+      self.start_workers()
+      if self.running:
+        self.running[0].wait()
+    trace = []
+    for t0, t1, outputbase in self.intervals:
+      # All workers have finished, so the snapshot is no longer needed, also when McPAT failed
+      os.unlink(outputbase + '.snapshot')
+      result = {}
+      try:
+        execfile(outputbase + '.py', {}, result)
+      except (IOError, SyntaxError):
+        print >> sys.stderr, '[POWERTRACE] McPAT failed for interval %s-%s' % (t0, t1)
+        continue
+      trace.append({ 't0': t0, 't1': t1, 'power': result['power'] })
+    open(os.path.join(sim.config.output_dir, 'power-trace.py'), 'w').write('trace = ' + pprint.pformat(trace))
 
 sim.util.register(PowerTrace())
@@ -1,4 +1,4 @@
-import sys, sim
+import sys, array, sim
 
 """
 Conversion factors for subsecondtime (femtoseconds) to other units
@@ -52,7 +52,8 @@ def register_command(mycmd, func):
 """
 Delta manager for statistics.
   StatsDeltaMetric keeps the current, last, and delta value for a given statistic
-  StatsDelta keeps a list of StatsDeltaMetric metrics and updates them all at once
+  StatsDelta keeps a list of StatsDeltaMetric metrics and updates them all at once,
+    reading all their values with a single sim.stats.getter_group call
 
 Example usage:
 
@@ -72,22 +73,34 @@ Example usage:
   simutil.register(PrintIpc())
 """
 
+# array.array type code for the 64-bit unsigned integers filled in by sim.stats.getter_group
+STATS_TYPECODE = array.array('L').itemsize == 8 and 'L' or 'Q'
+
 class StatsDelta:
 
-  class StatsDeltaMetric:
+  class StatsDeltaMetric(object):
     """Internal object to store current, last and delta stats value.
+    The values live in the arrays of the owning StatsDelta, which reads them for all metrics at once.
 
     Do not instantiate directly, use StatsDelta.getter() instead."""
-    def __init__(self, objectName, index, metricName):
+    def __init__(self, statsdelta, position, objectName, index, metricName):
       self.getter = sim.stats.getter(objectName, index, metricName)
-      self.last = None
-      self.delta = None
-
-    def update(self):
-      now = float(self.getter())
-      if self.last is not None:
-        self.delta = now - self.last
-      self.last = now
+      self.metric = (objectName, index, metricName)
+      self.statsdelta = statsdelta
+      self.position = position
+      self.since = None # Number of StatsDelta updates before this metric was first read
+
+    @property
+    def last(self):
+      if self.since is None:
+        return None
+      return float(self.statsdelta.values[self.position])
+
+    @property
+    def delta(self):
+      if self.since is None or self.statsdelta.nupdates - self.since < 2:
+        return None
+      return float(self.statsdelta.values[self.position]) - float(self.statsdelta.lastvalues[self.position])
 
   class StatsDeltaMetricGet:
     """Internal object to store current, last and delta stats value.
@@ -107,11 +120,17 @@ class StatsDelta:
 
   def __init__(self):
     self.isFirst = True
-    self.members = []
+    self.members = [] # StatsDeltaMetricGet objects, updated one at a time
+    self.metrics = [] # StatsDeltaMetric objects, read together through self.group
+    self.group = None
+    self.values = array.array(STATS_TYPECODE)
+    self.lastvalues = array.array(STATS_TYPECODE)
+    self.nupdates = 0
 
   def getter(self, objectName, index, metricName):
-    getter = self.StatsDeltaMetric(objectName, index, metricName)
-    self.members.append(getter)
+    getter = self.StatsDeltaMetric(self, len(self.metrics), objectName, index, metricName)
+    self.metrics.append(getter)
+    self.group = None # Rebuild the getter group on the next update
     return getter
 
   # Uncached version of getter(). Can be used if a statistic hasn't been registered yet.
@@ -121,6 +140,18 @@ class StatsDelta:
     return get
 
   def update(self):
+    if self.group is None and self.metrics:
+      self.group = sim.stats.getter_group([ metric.metric for metric in self.metrics ])
+      for values in (self.values, self.lastvalues):
+        values.extend([0] * (len(self.metrics) - len(values)))
+      for metric in self.metrics:
+        if metric.since is None:
+          metric.since = self.nupdates
+    # Keep the previous values to compute deltas, and read all current ones in one call
+    self.values, self.lastvalues = self.lastvalues, self.values
+    if self.group is not None:
+      self.group.read(self.values)
+    self.nupdates += 1
     for member in self.members:
       member.update()
     if self.isFirst:
@@ -196,14 +227,47 @@ class EveryIns:
 
 
 have_deleted_stats = False
+have_merged_stats = False
 def db_delete(prefix, in_sim_end = False):
-  global have_deleted_stats
   cursor = sim.stats.db.cursor()
   prefixid = sim.stats.db.execute('SELECT prefixid FROM prefixes WHERE prefixname = ?', (prefix,)).fetchall()
   if prefixid:
     cursor.execute('DELETE FROM prefixes WHERE prefixid = ?', (prefixid[0][0],))
     cursor.execute('DELETE FROM `values` WHERE prefixid = ?', (prefixid[0][0],))
   sim.stats.db.commit()
+  db_register_vacuum(in_sim_end)
+
+def db_merge_delta(prefix, in_sim_end = False):
+  # Remove a snapshot written by sim.stats.write_delta. Later snapshots are stored relative to this one,
+  # so its deltas are added to the next delta snapshot instead of being deleted.
+  global have_merged_stats
+  cursor = sim.stats.db.cursor()
+  prefixid = sim.stats.db.execute('SELECT prefixid FROM deltaprefixes WHERE prefixid IN (SELECT prefixid FROM prefixes WHERE prefixname = ?)', (prefix,)).fetchall()
+  if not prefixid:
+    return db_delete(prefix, in_sim_end = in_sim_end)
+  prefixid = prefixid[0][0]
+  nextid = sim.stats.db.execute('SELECT MIN(prefixid) FROM deltaprefixes WHERE prefixid > ?', (prefixid,)).fetchall()[0][0]
+  if nextid is not None:
+    cursor.execute('UPDATE deltavalues SET prefixid = ? WHERE prefixid = ?', (nextid, prefixid))
+    cursor.execute('DELETE FROM deltaprefixes WHERE prefixid = ?', (prefixid,))
+  # else: this is the most recent delta snapshot, keep its deltas (and deltaprefixes entry) for the next one to build upon
+  cursor.execute('DELETE FROM prefixes WHERE prefixid = ?', (prefixid,))
+  sim.stats.db.commit()
+  have_merged_stats = True
+  db_register_vacuum(in_sim_end)
+
+def db_compact_deltas():
+  # Merged snapshots leave multiple rows per (prefixid, nameid, core), sum them into one.
+  # Only modify rows, not the schema: the simulator holds prepared statements on the deltavalues table.
+  cursor = sim.stats.db.cursor()
+  cursor.execute('CREATE TEMP TABLE deltavalues_compact AS SELECT prefixid, nameid, core, SUM(value) AS value FROM deltavalues GROUP BY prefixid, nameid, core HAVING SUM(value) != 0')
+  cursor.execute('DELETE FROM deltavalues')
+  cursor.execute('INSERT INTO deltavalues (prefixid, nameid, core, value) SELECT prefixid, nameid, core, value FROM temp.deltavalues_compact')
+  cursor.execute('DROP TABLE temp.deltavalues_compact')
+  sim.stats.db.commit()
+
+def db_register_vacuum(in_sim_end = False):
+  global have_deleted_stats
   if not have_deleted_stats:
     if in_sim_end:
       # We shouldn't be registering a new sim_end hook while in sim_end
@@ -214,6 +278,8 @@ def db_delete(prefix, in_sim_end = False):
       have_deleted_stats = True
 
 def db_delete_sim_end_vacuum():
+  if have_merged_stats:
+    db_compact_deltas()
   # We have deleted entries from the database, reclaim free space now
   sim.stats.db.cursor().execute('VACUUM')
   sim.stats.db.commit()
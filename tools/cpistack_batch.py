@@ -0,0 +1,135 @@
+import sys, collections, numpy, sniper_config, cpistack_data, cpistack_items
+
+# CPI stacks of many intervals of the same simulation (e.g. all periodic-* snapshots for viz/level2.py).
+# Calling cpistack.cpistack_compute(partial = ...) for each interval reads two snapshots and rebuilds the per-core
+# dictionaries every time. Here, the metrics making up the CPI stack are read for all snapshots at once
+# (stats.read_timeseries), and the steps of CpiData.parse, filter and aggregate and of CpiResults(no_collapse = True)
+# are done on [interval, core] arrays.
+
+CpiBatchResult = collections.namedtuple('CpiBatchResult', ('labels', 'cpi'))
+
+
+def get_leaves(items, prefix = ''):
+  # (label, keys) of all leaves of the contributor list, labeled like buildstack.merge_items does with nocollapse
+  leaves = []
+  for name, threshold, key_or_items in items:
+    if type(key_or_items) is list:
+      leaves += get_leaves(key_or_items, prefix+name+'-')
+    else:
+      if type(key_or_items) is not tuple:
+        key_or_items = (key_or_items,)
+      leaves.append((prefix+name, key_or_items))
+  return leaves
+
+
+class CpiBatch:
+
+  def __init__(self, config, stats, prefixes = None):
+    self.config = config
+    self.ncores = int(config['general/total_cores'])
+    self.prefixes = prefixes or stats.get_snapshots()
+    self.rows = dict([ (prefix, row) for row, prefix in enumerate(self.prefixes) ])
+    self.metricnames = set([ '%s.%s' % name for name in stats.names.values() ])
+    self.cpimetrics = sorted([ name for name in self.metricnames
+                               if '.cpi' in name and not name.startswith('thread.') and name != 'performance_model.cpiFastforwardTime' ])
+    self.issuemetrics = sorted([ name for name in self.metricnames
+                                 if name.startswith('interval_timer.detailed-cpiBase-') and 'DispatchWidth' in name and 'DispatchRate' not in name ])
+    for name in sorted(self.metricnames):
+      if name.startswith('interval_timer.cpContr_') and name not in cpistack_data.CP_CONTR_MAP:
+        print 'Missing in cpContrMap: ', name
+    metrics = self.cpimetrics + self.issuemetrics + cpistack_data.CP_CONTR_MAP.keys() + [
+      'performance_model.instruction_count', 'core.instructions', 'performance_model.elapsed_time', 'barrier.global_time' ]
+    self.values = {}
+    for name, values in stats.read_timeseries(metrics, self.prefixes).items():
+      # Same shape for all metrics, missing cores read as zero
+      self.values[name] = numpy.zeros((len(self.prefixes), self.ncores), dtype = numpy.int64)
+      self.values[name][:, :min(self.ncores, values.shape[1])] = values[:, :self.ncores]
+
+  def get(self, name, rows):
+    if name in self.values:
+      return self.values[name][rows]
+    else:
+      return numpy.zeros((len(rows), self.ncores), dtype = numpy.int64)
+
+  def compute(self, intervals, cores_list = None, items = None, groups = None, use_simple = False, use_simple_mem = True):
+    # Returns a CpiBatchResult(labels, { label: cpi }) per (prefix_begin, prefix_end) in intervals, aggregated over
+    # cores_list, or None where cpistack_compute(aggregate = True, no_collapse = True) would raise a ValueError
+    results = [ None ] * len(intervals)
+    valid = [ idx for idx, (k1, k2) in enumerate(intervals) if k1 in self.rows and k2 in self.rows ]
+    if not valid or not self.cpimetrics:
+      return results
+    begin = numpy.array([ self.rows[intervals[idx][0]] for idx in valid ])
+    end = numpy.array([ self.rows[intervals[idx][1]] for idx in valid ])
+    delta = lambda name: self.get(name, end) - self.get(name, begin)
+    zeros = numpy.zeros((len(valid), self.ncores))
+
+    instrs = delta('performance_model.instruction_count')
+    instrs = numpy.where(instrs.sum(axis = 1)[:, None] != 0, instrs, delta('core.instructions'))
+    if 'performance_model.elapsed_time' in self.metricnames:
+      cycles_scale = numpy.array([ 1e9 * float(sniper_config.get_config(self.config, 'perf_model/core/frequency', core)) / 1e15 for core in range(self.ncores) ])
+    else:
+      cycles_scale = numpy.ones(self.ncores)
+    time_begin, time_end = self.get('performance_model.elapsed_time', begin), self.get('performance_model.elapsed_time', end)
+    if 'barrier.global_time' in self.metricnames:
+      time0_begin = self.get('barrier.global_time', begin)[:, 0]
+    else:
+      time0_begin = time_begin.max(axis = 1)
+    times = time_end - time0_begin[:, None]
+
+    data = {}
+    for name in self.cpimetrics:
+      key = name.split('.cpi')[1]
+      data[key] = data.get(key, zeros) + delta(name) * cycles_scale
+
+    # Work around the iGraphite SyncMemAccess bug, see CpiData.parse
+    memaccess = data.get('SyncMemAccess', zeros)
+    data['SyncMemAccess'] = numpy.where(memaccess == data.get('SyncPthreadBarrier', zeros), 0., memaccess)
+    # Critical path accounting
+    dispatch_width = numpy.array([ float(sniper_config.get_config(self.config, 'perf_model/core/interval_timer/dispatch_width', core)) for core in range(self.ncores) ])
+    base = data.get('Base', zeros)
+    scale = (base - instrs / dispatch_width) / numpy.where(base != 0, base, 1)
+    for cpName, cpiName in cpistack_data.CP_CONTR_MAP.items():
+      val = delta(cpName) / 1e6
+      base = base - val * scale
+      data[cpiName] = data.get(cpiName, zeros) + val * scale
+    data['Base'] = base
+    # Issue width
+    for name in self.issuemetrics:
+      data['Base'] = data['Base'] - delta(name)
+      data['Issue'] = data.get('Issue', 0) + delta(name)
+    # Fix up large cpiSync fractions that started before but ended inside our interval
+    cycles_extra = (time0_begin[:, None] - time_begin) * cycles_scale
+    late = time_begin < time0_begin[:, None]
+    sync_keys = [ key for key in data if key.startswith('Sync') or key == 'StartTime' ]
+    sync_masks = dict([ (key, late & (data[key] > cycles_extra)) for key in sync_keys ])
+    sync_total = sum([ numpy.where(sync_masks[key], data[key], 0.) for key in sync_keys ], zeros)
+    for key in sync_keys:
+      data[key] = numpy.where(sync_masks[key], data[key] - cycles_extra * data[key] / numpy.where(sync_masks[key], sync_total, 1.), data[key])
+    data['Imbalance'] = cycles_scale * times.max(axis = 1)[:, None] - sum(data.values(), zeros)
+    max_cycles = cycles_scale[0] * times.max(axis = 1)
+
+    # Filter and aggregate, components that are still integers are averaged using integer division as in CpiData.aggregate
+    cores_list = list(cores_list or range(self.ncores))
+    data = dict([ (key, value[:, cores_list].sum(axis = 1) // len(cores_list) if value.dtype.kind == 'i' else value[:, cores_list].sum(axis = 1) / len(cores_list))
+                  for key, value in data.items() ])
+    instrs = instrs[:, cores_list].sum(axis = 1) // len(cores_list)
+    instrs = numpy.where(instrs != 0, instrs, 1).astype(float)
+
+    # Group data according to descriptor, all leaves are kept as with no_collapse
+    cpiitems = cpistack_items.CpiItems(items = items, groups = groups, use_simple = use_simple, use_simple_mem = use_simple_mem)
+    stack = []
+    for label, keys in get_leaves(cpiitems.items):
+      keys = [ key for key in keys if key in data ]
+      stack.append((label, sum([ data.pop(key) for key in keys ], numpy.zeros(len(valid)))))
+    if data:
+      sys.stderr.write('Also found but not in all_items: %s\n' % sorted(data.keys()))
+    stack.append(('other', sum(data.values(), numpy.zeros(len(valid)))))
+    stack = [ (label, (value / instrs).tolist()) for label, value in stack ]
+
+    for row, idx in enumerate(valid):
+      if not max_cycles[row]:
+        # No cycles accounted during interval
+        continue
+      cpi = dict([ (label, values[row]) for label, values in stack if label != 'other' or values[row] ])
+      results[idx] = CpiBatchResult([ label for label in cpiitems.names if label in cpi ], cpi)
+    return results
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+# CPI stacks of many simulations side by side (e.g. all runs of a sweep), as a [run, component] matrix.
+# Runs are loaded in parallel (sniper_lib.load_results_parallel), reading only the statistics needed for a CPI stack.
+# Each run is aggregated over its cores, the components of all runs are grouped using the same CpiItems.
+
+import sys, collections, functools, getopt, numpy, gnuplot, buildstack, sniper_lib, sniper_stats
+import cpistack_data, cpistack_items
+
+# Aggregated CPI data of one run: { component: cycles }, instructions, total cycles, and the scale factors for abstime
+CpiRun = collections.namedtuple('CpiRun', ('data', 'instrs', 'max_cycles', 'cycles_scale', 'fastforward_scale'))
+
+
+def load_run(resultsdir, partial = None, cores_list = None, core_mincomp = 0.):
+  stats = sniper_stats.SniperStats(resultsdir)
+  metrics = cpistack_data.get_metrics([ '%s.%s' % name for name in stats.names.values() ])
+  cpidata = cpistack_data.CpiData(data = sniper_lib.get_results(resultsdir = resultsdir, partial = partial, metrics = metrics))
+  max_cycles = cpidata.cycles_scale[0] * max(cpidata.times)
+  if not max_cycles:
+    raise ValueError('No cycles accounted during interval')
+  cpidata.filter(cores_list = cores_list, core_mincomp = core_mincomp)
+  cpidata.aggregate()
+  return CpiRun(dict(cpidata.data[0]), cpidata.instrs[0], max_cycles, cpidata.cycles_scale[0], cpidata.fastforward_scale)
+
+
+class CpiCompare:
+  def __init__(self, runs, names = None, items = None, groups = None, use_simple = False, use_simple_mem = True, no_collapse = False):
+    # runs is a list of CpiRun, names their labels (default: run index)
+    self.runs = runs
+    self.names = names or [ str(idx) for idx in range(len(runs)) ]
+    self.cpiitems = cpistack_items.CpiItems(items = items, groups = groups, use_simple = use_simple, use_simple_mem = use_simple_mem)
+    # Runs are grouped like the cores of a single CPI stack: components are collapsed per run,
+    # a component is shown for all runs as long as it is above its threshold in at least one of them
+    results = buildstack.merge_items(dict([ (idx, dict(run.data)) for idx, run in enumerate(runs) ]), self.cpiitems.items, nocollapse = no_collapse)
+    labels = set([ name for res, total, other, scale in results.values() for name, value in res ])
+    self.labels = [ label for label in self.cpiitems.names if label in labels ]
+    columns = dict([ (label, column) for column, label in enumerate(self.labels) ])
+    self.cycles = numpy.zeros((len(runs), len(self.labels)))
+    for idx, (res, total, other, scale) in results.items():
+      for name, value in res:
+        self.cycles[idx, columns[name]] += value
+
+  def get_data(self, metric = 'cpi'):
+    # [run, component] matrix, columns follow self.labels
+    if metric == 'cpi':
+      return self.cycles / numpy.array([ float(run.instrs or 1) for run in self.runs ])[:, None]
+    elif metric == 'abstime':
+      return self.cycles * numpy.array([ run.fastforward_scale / run.cycles_scale / 1e15 for run in self.runs ])[:, None]
+    elif metric == 'time':
+      return self.cycles / numpy.array([ float(run.max_cycles) for run in self.runs ])[:, None]
+    else:
+      raise ValueError('Invalid metric %s' % metric)
+
+  def get_colors(self):
+    return self.cpiitems.get_colors(self.labels)
+
+
+def cpistack_compare(resultsdirs, names = None, partial = None, cores_list = None, core_mincomp = 0., workers = None,
+                     items = None, groups = None, use_simple = False, use_simple_mem = True, no_collapse = False):
+  # Returns a CpiCompare of all runs that could be loaded, runs that failed are reported and left out
+  names = names or resultsdirs
+  runs = sniper_lib.load_results_parallel(resultsdirs, workers = workers,
+                                          loader = functools.partial(load_run, partial = partial, cores_list = cores_list, core_mincomp = core_mincomp))
+  valid = []
+  for resultsdir, name in zip(resultsdirs, names):
+    if isinstance(runs[resultsdir], Exception):
+      print >> sys.stderr, 'Warning: Skipping results directory [%s]: %s' % (resultsdir, runs[resultsdir])
+    else:
+      valid.append((runs[resultsdir], name))
+  return CpiCompare([ run for run, name in valid ], [ name for run, name in valid ], items = items, groups = groups,
+                    use_simple = use_simple, use_simple_mem = use_simple_mem, no_collapse = no_collapse)
+
+
+def output_compare_table(results, metric = 'cpi', csv = False):
+  data = results.get_data(metric)
+  if csv:
+    print ','.join([ 'run' ] + results.labels + [ 'total' ])
+    for name, values in zip(results.names, data.tolist()):
+      print ','.join([ name ] + [ '%g' % value for value in values ] + [ '%g' % sum(values) ])
+    return
+
+  if metric == 'time':
+    format = lambda v: '%.2f%%' % (100 * v)
+    title = 'Time (%)'
+  elif metric == 'abstime':
+    format = lambda v: '%.3g' % v
+    title = 'Time (s)'
+  else:
+    format = lambda v: '%.2f' % v
+    title = 'CPI'
+  labels = results.labels + [ 'total' ]
+  widths = [ max(len(label), 9) for label in labels ]
+  namelen = max([ len(name) for name in results.names ] + [ len(title) ])
+  print '%-*s' % (namelen, title), ' '.join([ '%*s' % (width, label) for width, label in zip(widths, labels) ])
+  for name, values in zip(results.names, data.tolist()):
+    print '%-*s' % (namelen, name), ' '.join([ '%*s' % (width, format(value)) for width, value in zip(widths, values + [ sum(values) ]) ])
+
+
+def output_compare_gnuplot(results, metric = 'time', outputfile = 'cpi-stack-compare', title = '', size = None, save_gnuplot_input = False):
+  # One bar per run, all in a single graph
+  data = results.get_data(metric).tolist()
+  plot_data = collections.OrderedDict([ (name, dict(zip(results.labels, values))) for name, values in zip(results.names, data) ])
+  colors = results.get_colors()
+  plot_labels_with_color = [ (label, 'rgb "#%02x%02x%02x"' % colors[label]) for label in results.labels ]
+  gnuplot.make_stacked_bargraph(outputfile, plot_labels_with_color, plot_data, size = size or (max(640, 160 + 24 * len(data)), 480), title = title, xlabel = 'Run',
+    ylabel = metric == 'cpi' and 'Cycles per instruction' or (metric == 'abstime' and 'Time (seconds)' or 'Fraction of time'), save_gnuplot_input = save_gnuplot_input)
+
+
+if __name__ == '__main__':
+  def usage():
+    print 'Usage:', sys.argv[0], '[-h|--help (help)] [-o <output-filename (cpi-stack-compare)>] [-j <workers (default: #cpus)>] [--title=""] [--partial=<from>:<to>] [--simplified] [--no-collapse] [--no-simple-mem] [--time|--cpi|--abstime (default: cpi)] [--csv] [--names=<name1>,<name2>,...] <dir> [<dirN>]'
+
+  outputfile = 'cpi-stack-compare'
+  title = ''
+  partial = None
+  metric = 'cpi'
+  use_simple = False
+  use_simple_mem = True
+  no_collapse = False
+  csv = False
+  names = None
+  workers = None
+  save_gnuplot_input = False
+
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], "ho:j:", [ "help", "title=", "partial=", "simplified", "no-collapse", "no-simple-mem", "cpi", "time", "abstime", "csv", "names=", "save-gnuplot-input" ])
+  except getopt.GetoptError, e:
+    print e
+    usage()
+    sys.exit(1)
+  for o, a in opts:
+    if o == '-h' or o == '--help':
+      usage()
+      sys.exit()
+    if o == '-o':
+      outputfile = a
+    if o == '-j':
+      workers = int(a)
+    if o == '--title':
+      title = a
+    if o == '--partial':
+      if ':' not in a:
+        sys.stderr.write('--partial=<from>:<to>\n')
+        usage()
+        sys.exit(1)
+      partial = a.split(':')
+    if o == '--simplified':
+      use_simple = True
+    if o == '--no-collapse':
+      no_collapse = True
+    if o == '--no-simple-mem':
+      use_simple_mem = False
+    if o == '--time':
+      metric = 'time'
+    if o == '--cpi':
+      metric = 'cpi'
+    if o == '--abstime':
+      metric = 'abstime'
+    if o == '--csv':
+      csv = True
+    if o == '--names':
+      names = a.split(',')
+    if o == '--save-gnuplot-input':
+      save_gnuplot_input = True
+
+  if not args:
+    usage()
+    sys.exit(1)
+  if names and len(names) != len(args):
+    sys.stderr.write('--names needs one name per results directory\n')
+    sys.exit(1)
+
+  results = cpistack_compare(args, names = names, partial = partial, workers = workers,
+                             groups = use_simple and cpistack_items.build_grouplist(legacy = True) or None,
+                             use_simple = use_simple, use_simple_mem = use_simple_mem, no_collapse = no_collapse)
+  if not results.runs:
+    sys.stderr.write('No results could be loaded\n')
+    sys.exit(1)
+
+  output_compare_table(results, metric = metric, csv = csv)
+  output_compare_gnuplot(results, metric = metric, outputfile = outputfile, title = title, save_gnuplot_input = save_gnuplot_input)
@@ -1,5 +1,40 @@
 import collections, sniper_lib, sniper_config
 
+# Critical path contributors and the CPI component they are accounted to
+CP_CONTR_MAP = {
+    # critical path components
+    'interval_timer.cpContr_generic': 'PathInt',
+    'interval_timer.cpContr_store': 'PathStore',
+    'interval_timer.cpContr_load_other': 'PathLoadX',
+    'interval_timer.cpContr_branch': 'PathBranch',
+    'interval_timer.cpContr_load_l1': 'DataCacheL1',
+    'interval_timer.cpContr_load_l2': 'DataCacheL2',
+    'interval_timer.cpContr_load_l3': 'DataCacheL3',
+    'interval_timer.cpContr_fp_addsub': 'PathFP',
+    'interval_timer.cpContr_fp_muldiv': 'PathFP',
+    # issue ports
+    'interval_timer.cpContr_port0': 'PathP0',
+    'interval_timer.cpContr_port1': 'PathP1',
+    'interval_timer.cpContr_port2': 'PathP2',
+    'interval_timer.cpContr_port34': 'PathP34',
+    'interval_timer.cpContr_port5': 'PathP5',
+    'interval_timer.cpContr_port05': 'PathP05',
+    'interval_timer.cpContr_port015': 'PathP015',
+  }
+
+# Statistics read by CpiData.parse besides the .cpi* components, critical path contributors and issue width components
+CPI_METRICS = (
+    'performance_model.instruction_count', 'core.instructions',
+    'performance_model.elapsed_time', 'performance_model.idle_elapsed_time', 'performance_model.cycle_count',
+    'barrier.global_time',
+  )
+
+def get_metrics(metricnames):
+  # Subset of metricnames needed to build a CPI stack, for use with sniper_lib.get_results(metrics = ...)
+  return [ name for name in metricnames
+           if name in CPI_METRICS or '.cpi' in name or name in CP_CONTR_MAP or name.startswith('interval_timer.detailed-cpiBase-') ]
+
+
 class CpiData:
 
   def __init__(self, jobid = '', resultsdir = '', config = None, stats = None, data = None, partial = None):
@@ -69,36 +104,16 @@ class CpiData:
                                   data[core]['SyncPthreadCond'] - data[core]['SyncPthreadBarrier']  - \
                                   data[core]['Recv']
       # Critical path accounting
-      cpContrMap = {
-        # critical path components
-        'interval_timer.cpContr_generic': 'PathInt',
-        'interval_timer.cpContr_store': 'PathStore',
-        'interval_timer.cpContr_load_other': 'PathLoadX',
-        'interval_timer.cpContr_branch': 'PathBranch',
-        'interval_timer.cpContr_load_l1': 'DataCacheL1',
-        'interval_timer.cpContr_load_l2': 'DataCacheL2',
-        'interval_timer.cpContr_load_l3': 'DataCacheL3',
-        'interval_timer.cpContr_fp_addsub': 'PathFP',
-        'interval_timer.cpContr_fp_muldiv': 'PathFP',
-        # issue ports
-        'interval_timer.cpContr_port0': 'PathP0',
-        'interval_timer.cpContr_port1': 'PathP1',
-        'interval_timer.cpContr_port2': 'PathP2',
-        'interval_timer.cpContr_port34': 'PathP34',
-        'interval_timer.cpContr_port5': 'PathP5',
-        'interval_timer.cpContr_port05': 'PathP05',
-        'interval_timer.cpContr_port015': 'PathP015',
-      }
       for k in self.stats:
         if k.startswith('interval_timer.cpContr_'):
-          if k not in cpContrMap.keys():
+          if k not in CP_CONTR_MAP.keys():
             print 'Missing in cpContrMap: ', k
       # Keep 1/width as base CPI component, break down the remainder according to critical path contributors
       BaseBest = instrs[core] / float(sniper_config.get_config(self.config, 'perf_model/core/interval_timer/dispatch_width', core))
       BaseAct = data[core]['Base']
       BaseCp = BaseAct - BaseBest
       scale = BaseCp / (BaseAct or 1)
-      for cpName, cpiName in cpContrMap.items():
+      for cpName, cpiName in CP_CONTR_MAP.items():
         val = float(self.stats.get(cpName, [0]*ncores)[core]) / 1e6
         data[core]['Base'] -= val * scale
         data[core][cpiName] = data[core].get(cpiName, 0) + val * scale
@@ -142,18 +142,16 @@ if do_stats:
   if through_time:
     import sniper_stats
     stats = sniper_stats.SniperStats(resultsdir = resultsdir, jobid = jobid)
-    names = stats.read_metricnames()
     metrics = [ metric[1:] if metric[0] in '-' else metric for metric in through_time ]
-    nameids = dict([ ('%s.%s' % (objectname, metricname), nameid) for nameid, (objectname, metricname) in names.items() if '%s.%s' % (objectname, metricname) in metrics ])
     prefixes = stats.get_snapshots()
     prefixes_len = max(map(len, prefixes))
-    data = dict([ (prefix, stats.read_snapshot(prefix, metrics)) for prefix in prefixes ])
+    data = stats.read_timeseries(metrics, prefixes)
 
-    def do_op(op, state, v):
+    def do_op(op, v):
       if op == '-':
-        for i, _v in enumerate(v):
-          v[i], state[i] = v[i] - state.get(i, 0), v[i]
-        return v
+        d = v.copy()
+        d[1:] -= v[:-1]
+        return d
       else:
         return v
 
@@ -161,12 +159,8 @@ if do_stats:
       for metric, _metric in zip(metrics, through_time):
         op = _metric[0]
         print '==', metric, '=='
-        state = {}
-        for prefix in prefixes:
-          v = data[prefix].get(nameids[metric], {})
-          v = [ v.get(i, 0) for i in range(max(v.keys() or [0])+1) ]
-          v = do_op(op, state, v)
-          print_result('%-*s' % (prefixes_len, prefix), v)
+        for prefix, v in zip(prefixes, do_op(op, data[metric])):
+          print_result('%-*s' % (prefixes_len, prefix), v.tolist())
 
   else:
     results = sniper_lib.get_results(jobid, resultsdir, partial = partial)
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-import sys, os, re, collections, subprocess, sniper_lib, sniper_config
+import sys, os, re, collections, subprocess, numpy, sniper_lib, sniper_config
 
 
 def ex_ret(cmd):
@@ -17,9 +17,9 @@ def get_source_line(filename, linenr):
 
 
 class Function:
-  def __init__(self, eip, name, location):
+  def __init__(self, eip, name, location, demangle = True):
     self.eip = eip
-    self.name = cppfilt(name).strip()
+    self.name = cppfilt(name).strip() if demangle else name
     self.location = location.split(':')
     self.imgname = self.location[0]
     self.sourcefile = self.location[2]
@@ -34,13 +34,8 @@ class Function:
     return '[%12s]  %-20s %s' % (self.eip, self.name, self.locationshort)
 
 
-def dirSum(a, b):
-  for k, v in b.items():
-    a[k] = a.get(k, 0) + v
-  return a
-
-
 class AllocationSite:
+  # View of one allocation site of a MemoryTracker, hitwhere* are { hitwhere: count }, evictedby is { siteid: count }
   def __init__(self, stack, numallocations, totalallocated, hitwhereload, hitwherestore, evictedby):
     self.stack = stack
     self.numallocations = numallocations
@@ -50,14 +45,6 @@ class AllocationSite:
     self.totalstores = sum(hitwherestore.values())
     self.hitwherestore = hitwherestore
     self.evictedby = evictedby
-  def update(self, numallocations, totalallocated, hitwhereload, hitwherestore, evictedby):
-    self.numallocations += numallocations
-    self.totalallocated += totalallocated
-    self.totalloads += sum(hitwhereload.values())
-    self.hitwhereload = dirSum(self.hitwhereload, hitwhereload)
-    self.totalstores += sum(hitwherestore.values())
-    self.hitwherestore = dirSum(self.hitwherestore, hitwherestore)
-    self.evictedby = dirSum(self.evictedby, evictedby)
 
 def format_abs_ratio(val, tot):
   if tot:
@@ -67,6 +54,11 @@ def format_abs_ratio(val, tot):
 
 
 class MemoryTracker:
+  # Sites are numbered in the order they first appear, hit-where categories get a fixed column.
+  # Per-site counts are kept in arrays: hit-where load and store counts as [site, column],
+  # evicted-by counts as (site, evicting siteid, count) triplets with evicting siteids numbered in order of appearance.
+  CHUNK_SIZE = 1 << 22 # bytes of sim.memorytracker parsed at once
+
   def __init__(self, resultsdir = '.'):
     filename = os.path.join(resultsdir, 'sim.memorytracker')
     if not os.path.exists(filename):
@@ -77,58 +69,110 @@ class MemoryTracker:
     stats = results['results']
 
     self.hitwhere_load_global = dict([ (k.split('-', 3)[3], sum(v)) for k, v in stats.items() if k.startswith('L1-D.loads-where-') ])
-    self.hitwhere_load_unknown = self.hitwhere_load_global.copy()
     self.hitwhere_store_global = dict([ (k.split('-', 3)[3], sum(v)) for k, v in stats.items() if k.startswith('L1-D.stores-where-') ])
-    self.hitwhere_store_unknown = self.hitwhere_store_global.copy()
 
     llc_level = int(sniper_config.get_config(config, 'perf_model/cache/levels'))
     self.evicts_global = sum([ sum(v) for k, v in stats.items() if re.match('L%d.evict-.$' % llc_level, k) ])
-    self.evicts_unknown = self.evicts_global
 
     self.functions = {}
-    self.sites = {}
-    self.siteids = {}
-
-    fp = open(filename)
-    for line in fp:
-      if line.startswith('W\t'):
-        self.hitwheres = line.strip().split('\t')[1].strip(',').split(',')
-      elif line.startswith('F\t'):
-        _, eip, name, location = line.strip().split('\t')
-        self.functions[eip] = Function(eip, name, location)
-      elif line.startswith('S\t'):
-        line = line.strip().split('\t')
-        siteid = line[1]
-        stack = line[2].strip(':').split(':')
-        stack = self.collapseStack(stack)
-        results = { 'numallocations': 0, 'totalallocated': 0, 'hitwhereload': {}, 'hitwherestore': {}, 'evictedby': {} }
-        for data in line[3:]:
-          key, value = data.split('=')
-          if key == 'num-allocations':
-            results['numallocations'] = long(value)
-          if key == 'total-allocated':
-            results['totalallocated'] = long(value)
-          elif key == 'hit-where':
-            entries = map(lambda s: s.split(':'), value.strip(',').split(','))
-            results['hitwhereload'] = dict([ (s[1:], long(v)) for s, v in entries if s.startswith('L') ])
-            for k, v in results['hitwhereload'].items():
-              self.hitwhere_load_unknown[k] -= v
-            results['hitwherestore'] = dict([ (s[1:], long(v)) for s, v in entries if s.startswith('S') ])
-            for k, v in results['hitwherestore'].items():
-              self.hitwhere_store_unknown[k] -= v
-          elif key == 'evicted-by':
-            results['evictedby'] = dict(map(lambda (s, v): (s, long(v)), map(lambda s: s.split(':'), value.strip(',').split(','))))
-            self.evicts_unknown -= sum(results['evictedby'].values())
-        self.siteids[siteid] = stack
-        if stack in self.sites:
-          self.sites[stack].update(**results)
+    self.hitwheres = []
+    self.readTrace(open(filename))
+
+    # Demangle all function names at once
+    functions = self.functions.values()
+    for function, name in zip(functions, sniper_lib.cppfilt_all([ function.name for function in functions ])):
+      function.name = name.strip()
+
+    # Whatever is not accounted to a site
+    loads, stores = self.hitwhereload.sum(axis = 0).tolist(), self.hitwherestore.sum(axis = 0).tolist()
+    self.hitwhere_load_unknown = dict([ (k, v - loads[self.columns[k]] if k in self.columns else v) for k, v in self.hitwhere_load_global.items() ])
+    self.hitwhere_store_unknown = dict([ (k, v - stores[self.columns[k]] if k in self.columns else v) for k, v in self.hitwhere_store_global.items() ])
+    self.evicts_unknown = self.evicts_global - long(self.evict_count.sum())
+
+  def readTrace(self, fp):
+    self.stacks = []          # site -> collapsed call stack
+    sites = {}                # collapsed call stack -> site
+    self.siteids = {}         # siteid -> collapsed call stack
+    self.evictors = []        # evicting siteid index -> siteid
+    evictoridx = {}
+    self.columns = {}         # hitwhere -> column
+    entrycolumns = {}         # 'L<hitwhere>' or 'S<hitwhere>' -> (0 for loads or 1 for stores, column)
+    numallocations, totalallocated = [], []
+    hitwhere, evicts = [], [] # per chunk: (kind, site, column, count) and (site, evictor, count) arrays
+
+    def get_column(entry):
+      if entry not in entrycolumns:
+        self.columns[entry[1:]] = len(self.columns)
+        entrycolumns['L' + entry[1:]] = (0, self.columns[entry[1:]])
+        entrycolumns['S' + entry[1:]] = (1, self.columns[entry[1:]])
+      return entrycolumns[entry]
+
+    while True:
+      lines = fp.readlines(self.CHUNK_SIZE)
+      if not lines:
+        break
+      hitwhere_index, hitwhere_values = [], []
+      evict_index, evict_values = [], []
+      for line in lines:
+        if line.startswith('W\t'):
+          self.hitwheres = line.strip().split('\t')[1].strip(',').split(',')
+          for _hitwhere in self.hitwheres:
+            get_column('L' + _hitwhere)
+        elif line.startswith('F\t'):
+          _, eip, name, location = line.strip().split('\t')
+          self.functions[eip] = Function(eip, name, location, demangle = False)
+        elif line.startswith('S\t'):
+          line = line.strip().split('\t')
+          siteid = line[1]
+          stack = self.collapseStack(line[2].strip(':').split(':'))
+          if stack not in sites:
+            sites[stack] = len(self.stacks)
+            self.stacks.append(stack)
+            numallocations.append(0)
+            totalallocated.append(0)
+          site = sites[stack]
+          self.siteids[siteid] = stack
+          for data in line[3:]:
+            key, value = data.split('=')
+            if key == 'num-allocations':
+              numallocations[site] += long(value)
+            elif key == 'total-allocated':
+              totalallocated[site] += long(value)
+            elif key == 'hit-where':
+              for entry in value.strip(',').split(','):
+                entry, count = entry.split(':')
+                hitwhere_index.append((site,) + get_column(entry))
+                hitwhere_values.append(count)
+            elif key == 'evicted-by':
+              for entry in value.strip(',').split(','):
+                evictor, count = entry.split(':')
+                if evictor not in evictoridx:
+                  evictoridx[evictor] = len(self.evictors)
+                  self.evictors.append(evictor)
+                evict_index.append((site, evictoridx[evictor]))
+                evict_values.append(count)
         else:
-          self.sites[stack] = AllocationSite(stack, **results)
-      else:
-        raise ValueError('Invalid format %s' % line)
-    #print ', '.join([ '%s:%d' % (k, v) for k, v in hitwhere_global.items() if v ])
-    #print ', '.join([ '%s:%d' % (k, v) for k, v in hitwhere_unknown.items() if v ])
-    #print evicts_global, evicts_unknown
+          raise ValueError('Invalid format %s' % line)
+      # Convert this chunk's counts to arrays
+      if hitwhere_index:
+        hitwhere.append((numpy.array(hitwhere_index, dtype = numpy.int64), numpy.fromstring(' '.join(hitwhere_values), dtype = numpy.int64, sep = ' ')))
+      if evict_index:
+        evicts.append((numpy.array(evict_index, dtype = numpy.int64), numpy.fromstring(' '.join(evict_values), dtype = numpy.int64, sep = ' ')))
+
+    self.numallocations = numpy.array(numallocations, dtype = numpy.int64)
+    self.totalallocated = numpy.array(totalallocated, dtype = numpy.int64)
+    data = numpy.zeros((2, len(self.stacks), len(self.columns)), dtype = numpy.int64)
+    for index, values in hitwhere:
+      numpy.add.at(data, (index[:, 1], index[:, 0], index[:, 2]), values)
+    self.hitwhereload, self.hitwherestore = data[0], data[1]
+    self.totalloads = self.hitwhereload.sum(axis = 1)
+    self.totalstores = self.hitwherestore.sum(axis = 1)
+    # Merge evicted-by entries of the same (site, evicting siteid) pair
+    index = numpy.concatenate([ index for index, values in evicts ] or [ numpy.zeros((0, 2), dtype = numpy.int64) ])
+    keys, inverse = numpy.unique(index[:, 0] * len(self.evictors) + index[:, 1], return_inverse = True)
+    self.evict_count = numpy.zeros(len(keys), dtype = numpy.int64)
+    numpy.add.at(self.evict_count, inverse, numpy.concatenate([ values for index, values in evicts ] or [ numpy.zeros(0, dtype = numpy.int64) ]))
+    self.evict_site, self.evict_evictor = (keys // len(self.evictors), keys % len(self.evictors)) if self.evictors else (keys, keys)
 
   def collapseStack(self, stack):
     _stack = []
@@ -143,13 +187,34 @@ class MemoryTracker:
       _stack.append(eip)
     return tuple(_stack)
 
-  def write(self, obj):
-    sites_sorted = sorted(self.sites.items(), key = lambda (k, v): v.totalloads + v.totalstores, reverse = True)
-    site_names = dict([ (stack, '#%d' % (idx+1)) for idx, (stack, site) in enumerate(sites_sorted) ])
+  def getSiteOrder(self):
+    # Site indices sorted by number of accesses, most accessed first
+    return numpy.argsort(-(self.totalloads + self.totalstores), kind = 'mergesort')
+
+  def getSite(self, idx):
+    loads, stores = self.hitwhereload[idx].tolist(), self.hitwherestore[idx].tolist()
+    evicts = numpy.flatnonzero(self.evict_site == idx)
+    return AllocationSite(self.stacks[idx], long(self.numallocations[idx]), long(self.totalallocated[idx]),
+                          dict([ (hitwhere, loads[column]) for hitwhere, column in self.columns.items() ]),
+                          dict([ (hitwhere, stores[column]) for hitwhere, column in self.columns.items() ]),
+                          dict(zip([ self.evictors[evictor] for evictor in self.evict_evictor[evicts].tolist() ], self.evict_count[evicts].tolist())))
+
+  def getTopSites(self, n = None):
+    # The n most accessed sites as AllocationSite objects, only these are materialized
+    return [ self.getSite(idx) for idx in self.getSiteOrder()[:n].tolist() ]
+
+  def write(self, obj, top = None):
+    order = self.getSiteOrder().tolist()
+    site_names = dict([ (self.stacks[idx], '#%d' % (rank+1)) for rank, idx in enumerate(order) ])
     totalloads = sum(self.hitwhere_load_global.values())
     totalstores = sum(self.hitwhere_store_global.values())
+    # Site of the evictor of each evicted-by entry, -1 if unknown
+    siteidx = dict([ (stack, idx) for idx, stack in enumerate(self.stacks) ])
+    evictor_sites = numpy.array([ siteidx.get(self.siteids.get(siteid), -1) for siteid in self.evictors ] + [ -1 ], dtype = numpy.int64)[self.evict_evictor]
 
-    for stack, site in sites_sorted:
+    for idx in order[:top]:
+      stack = self.stacks[idx]
+      site = self.getSite(idx)
       print >> obj, 'Site %s:' % site_names[stack]
       print >> obj, '\tCall stack:'
       for eip in site.stack:
@@ -168,15 +233,14 @@ class MemoryTracker:
           print >> obj, '\t  %-15s: %s' % (hitwhere, format_abs_ratio(cnt, site.totalstores))
 
       print >> obj, '\tEvicts:'
-      evicts = {}
-      for _stack, _site in self.sites.items():
-        for _siteid, _cnt in _site.evictedby.items():
-          if self.siteids.get(_siteid) == stack:
-            evicts[_stack] = evicts.get(_stack, 0) + _cnt
-      evicts = sorted(evicts.items(), key = lambda (_stack, _cnt): _cnt, reverse = True)
-      for _stack, cnt in evicts[:10]:
-        name = site_names.get(_stack, 'other') if _stack != stack else 'self'
-        print >> obj, '\t\t%-15s: %12d' % (name, cnt)
+      # Sum, per evicted site, the evicted-by entries pointing to this site
+      entries = evictor_sites == idx
+      evicts = numpy.zeros(len(self.stacks), dtype = numpy.int64)
+      numpy.add.at(evicts, self.evict_site[entries], self.evict_count[entries])
+      evicted = numpy.unique(self.evict_site[entries])
+      for _idx in evicted[numpy.argsort(-evicts[evicted], kind = 'mergesort')][:10].tolist():
+        name = site_names.get(self.stacks[_idx], 'other') if _idx != idx else 'self'
+        print >> obj, '\t\t%-15s: %12d' % (name, evicts[_idx])
 
       print >> obj, '\tEvicted-by:'
       evicts = {}
@@ -197,10 +261,11 @@ class MemoryTracker:
         print >> obj, '\t%s:' % hitwhere
         print >> obj, '\t\t%-15s: %s' % ('Loads', format_abs_ratio(totalloadhere, totalloads)),
         print >> obj, '\t%-15s: %s' % ('Stores', format_abs_ratio(totalstorehere, totalstores))
-        for stack, site in sorted(self.sites.items(), key = lambda (k, v): v.hitwhereload.get(hitwhere, 0) + v.hitwherestore.get(hitwhere, 0), reverse = True):
-          if site.hitwhereload.get(hitwhere) > .001 * totalloadhere or site.hitwherestore.get(hitwhere) > .001 * totalstorehere:
-            print >> obj, '\t\t  %-15s: %s' % (site_names[stack], format_abs_ratio(site.hitwhereload.get(hitwhere), totalloadhere)),
-            print >> obj, '\t  %-15s: %s' % (site_names[stack], format_abs_ratio(site.hitwherestore.get(hitwhere), totalstorehere))
+        loads, stores = self.hitwhereload[:, self.columns[hitwhere]], self.hitwherestore[:, self.columns[hitwhere]]
+        for idx in numpy.argsort(-(loads + stores), kind = 'mergesort').tolist():
+          if loads[idx] > .001 * totalloadhere or stores[idx] > .001 * totalstorehere:
+            print >> obj, '\t\t  %-15s: %s' % (site_names[self.stacks[idx]], format_abs_ratio(loads[idx], totalloadhere)),
+            print >> obj, '\t  %-15s: %s' % (site_names[self.stacks[idx]], format_abs_ratio(stores[idx], totalstorehere))
         if self.hitwhere_load_unknown.get(hitwhere) > .001 * totalloadhere or self.hitwhere_store_unknown.get(hitwhere) > .001 * totalstorehere:
           print >> obj, '\t\t  %-15s: %s' % ('other', format_abs_ratio(self.hitwhere_load_unknown.get(hitwhere), totalloadhere)),
           print >> obj, '\t  %-15s: %s' % ('other', format_abs_ratio(self.hitwhere_store_unknown.get(hitwhere), totalstorehere))
@@ -210,15 +275,16 @@ if __name__ == '__main__':
   import getopt
 
   def usage():
-    print '%s  [-d <resultsdir (.)> | -o <outputdir>]' % sys.argv[0]
+    print '%s  [-d <resultsdir (.)> | -o <outputdir>] [-n <number of sites to list (default: all)>]' % sys.argv[0]
     sys.exit(1)
 
   HOME = os.path.dirname(__file__)
   resultsdir = '.'
   outputdir = None
+  top = None
 
   try:
-    opts, cmdline = getopt.getopt(sys.argv[1:], "hd:o:")
+    opts, cmdline = getopt.getopt(sys.argv[1:], "hd:o:n:")
   except getopt.GetoptError, e:
     # print help information and exit:
     print >> sys.stderr, e
@@ -231,6 +297,8 @@ if __name__ == '__main__':
       resultsdir = a
     if o == '-o':
       outputdir = a
+    if o == '-n':
+      top = int(a)
 
   result = MemoryTracker(resultsdir)
-  result.write(file(os.path.join(outputdir, 'sim.memoryprofile'), 'w') if outputdir else sys.stdout)
+  result.write(file(os.path.join(outputdir, 'sim.memoryprofile'), 'w') if outputdir else sys.stdout, top = top)
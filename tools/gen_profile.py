@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-import sys, os, collections, subprocess, sniper_lib, sniper_config
+import sys, os, collections, subprocess, numpy, sniper_lib, sniper_config
 
 
 def ex_ret(cmd):
@@ -10,9 +10,9 @@ def cppfilt(name):
 
 
 class Function:
-  def __init__(self, eip, name, location):
+  def __init__(self, eip, name, location, demangle = True):
     self.eip = eip
-    self.name = cppfilt(name).strip()
+    self.name = cppfilt(name).strip() if demangle else name
     self.location = location.split(':')
     self.img = self.location[0]
     self.offset = long(self.location[1])
@@ -24,42 +24,25 @@ class Function:
 
 
 class Call:
-  def __init__(self, name, eip, stack, data):
+  # View of one call stack of a Profile, data and total are { header: value } dictionaries
+  def __init__(self, name, eip, stack, data, total = None, children = (), folded = False):
     self.name = name
     self.eip = eip
     self.stack = stack
     self.data = data
-  def add(self, data):
-    for k, v in data.items():
-      self.data[k] = self.data.get(k, 0) + v
-  def buildTotal(self, prof):
-    # Assumes all children have already been visited!
-    self.children = prof.children[self.stack]
-    # Add self to global total
-    for k, v in self.data.items():
-      prof.totals[k] = prof.totals.get(k, 0) + v
-    # Add all children to our total
-    self.total = dict(self.data)
-    for stack in self.children.copy():
-      for k, v in prof.calls[stack].total.items():
-        self.total[k] += v
-      # Child is to be folded: add it to self, remove from list of children
-      if prof.calls[stack].folded:
-        for k, v in prof.calls[stack].data.items():
-          if k != 'calls':
-            self.data[k] += v
-        self.children.remove(stack)
-        for grandchild in prof.calls[stack].children:
-          self.children.add(grandchild)
-    # Fold into parents?
-    self.folded = prof.foldCall(self)
-
-
-class Category(Call):
+    self.total = total
+    self.children = children
+    self.folded = folded
+
+
+class Category:
   def __init__(self, name):
     self.name = name
     self.stack = ''
     self.data = {}
+  def add(self, data):
+    for k, v in data.items():
+      self.data[k] = self.data.get(k, 0) + v
   def printLine(self, prof, obj):
     print >> obj, '%6.2f%%\t' % (100 * self.data['nonidle_elapsed_time'] / float(prof.totals['nonidle_elapsed_time'])) + \
                   '%6.2f%%\t' % (100 * self.data['instruction_count'] / float(prof.totals['instruction_count'])) + \
@@ -73,11 +56,12 @@ class CallPrinter:
     self.prof = prof
     self.obj = obj
     self.opt_cutoff = opt_cutoff
-  def printTree(self, stack, offset = 0):
-    call = self.prof.calls[stack]
+  def printTree(self, stackid, offset = 0):
+    call = self.prof.getCall(stackid)
     self.printLine(call, offset = offset)
-    for child in sorted(call.children, key = lambda stack: self.prof.calls[stack].total['nonidle_elapsed_time'], reverse = True):
-      child_time = self.prof.calls[child].total['nonidle_elapsed_time'] + self.prof.calls[child].total['waiting_cost']
+    time, waiting_cost = self.prof.columns['nonidle_elapsed_time'], self.prof.columns['waiting_cost']
+    for child in sorted(call.children, key = lambda stackid: self.prof.total[stackid, time], reverse = True):
+      child_time = self.prof.total[child, time] + self.prof.total[child, waiting_cost]
       if child_time / float(self.prof.totals['nonidle_elapsed_time']) < self.opt_cutoff:
         break
       self.printTree(child, offset = offset + 1)
@@ -112,6 +96,10 @@ class CallPrinterAbsolute(CallPrinter):
 
 
 class Profile:
+  # Call stacks are interned: every distinct stack (and every prefix of one) gets an integer id, and is stored as its
+  # parent's id plus its last (link-time) eip. Counters are kept in [stack, header] arrays rather than per-stack dictionaries.
+  CHUNK_SIZE = 1 << 22 # bytes of sim.rtntracefull parsed at once
+
   def __init__(self, resultsdir = '.'):
     filename = os.path.join(resultsdir, 'sim.rtntracefull')
     if not os.path.exists(filename):
@@ -124,53 +112,132 @@ class Profile:
     self.fs_to_cycles = freq / 1e15
 
     self.functions = {}
-    self.calls = {}
-    self.children = collections.defaultdict(set)
-    self.roots = set()
     self.totals = {}
 
     fp = open(filename)
     self.headers = fp.readline().strip().split('\t')
+    self.columns = dict([ (name, idx) for idx, name in enumerate(self.headers[1:]) ])
+    self.readTrace(fp)
 
-    for line in fp:
-      if line.startswith(':'):
-        eip, name, location = line.strip().split('\t')
-        eip = eip[1:]
-        self.functions[eip] = Function(eip, name, location)
-      else:
-        line = line.strip().split('\t')
-        stack = line[0].split(':')
-        eip = stack[-1]
-        stack = ':'.join(map(self.translateEip, stack))
-        data = dict(zip(self.headers[1:], map(long, line[1:])))
-        if stack in self.calls:
-          self.calls[stack].add(data)
-        else:
-          self.calls[stack] = Call(str(self.functions[eip]), eip, stack, data)
-          parent = stack.rpartition(':')[0]
-          self.children[parent].add(stack)
-
-    self.roots = set(self.calls.keys())
-    for parent in self.calls:
-      for child in self.children[parent]:
-        self.roots.remove(child)
-
-    # Construct a list of calls where each child is ordered before its parent.
-    calls_ordered = collections.deque()
-    calls_tovisit = collections.deque(self.roots)
-    while calls_tovisit:
-      stack = calls_tovisit.pop()
-      calls_ordered.appendleft(stack)
-      calls_tovisit.extend(self.children[stack])
-    # Now implement a non-recursive version of buildTotal, which requires that each
-    # function's children have been visited before processing the parent,
-    # by visiting calls_ordered in left-to-right order.
-    for stack in calls_ordered:
-      self.calls[stack].buildTotal(self)
+    # Demangle all function names at once
+    functions = self.functions.values()
+    for function, name in zip(functions, sniper_lib.cppfilt_all([ function.name for function in functions ])):
+      function.name = name.strip()
+
+    self.buildTotals()
 
     ncores = int(config['general/total_cores'])
     self.totals['total_coretime'] = ncores * stats['barrier.global_time'][0]
 
+  def readTrace(self, fp):
+    stackids = {}       # (parent id, eip) -> stack id
+    self.parent = []    # stack id -> id of the stack without its last function, -1 for top-level functions
+    self.last = []      # stack id -> last (link-time) eip of the stack
+    self.eip = []       # stack id -> eip of the function called, None for stacks that are only a prefix of a call stack
+    self.depth = []     # stack id -> number of functions on the stack, minus one
+    self.calls = []     # ids of all call stacks, in the order they first appear in the trace
+    self.data = numpy.zeros((1024, len(self.headers) - 1), dtype = numpy.int64)
+    while True:
+      lines = fp.readlines(self.CHUNK_SIZE)
+      if not lines:
+        break
+      ids, values = [], []
+      for line in lines:
+        if line.startswith(':'):
+          eip, name, location = line.strip().split('\t')
+          eip = eip[1:]
+          self.functions[eip] = Function(eip, name, location, demangle = False)
+        else:
+          stack, _, line = line.partition('\t')
+          stack = stack.split(':')
+          stackid = -1
+          for depth, eip in enumerate(stack):
+            key = (stackid, self.translateEip(eip))
+            if key not in stackids:
+              stackids[key] = len(self.parent)
+              self.parent.append(stackid)
+              self.last.append(key[1])
+              self.eip.append(None)
+              self.depth.append(depth)
+            stackid = stackids[key]
+          if self.eip[stackid] is None:
+            self.eip[stackid] = stack[-1]
+            self.calls.append(stackid)
+          ids.append(stackid)
+          values.append(line)
+      if ids:
+        # Parse all counters of this chunk at once, and add them to the (growing) per-stack array
+        values = numpy.fromstring(' '.join(values), dtype = numpy.int64, sep = ' ')
+        if len(values) != len(ids) * self.data.shape[1]:
+          raise ValueError('Invalid line in sim.rtntracefull, expected %d values per line' % self.data.shape[1])
+        if len(self.parent) > len(self.data):
+          self.data = numpy.concatenate((self.data, numpy.zeros((max(len(self.parent), 2 * len(self.data)) - len(self.data), self.data.shape[1]), dtype = numpy.int64)))
+        numpy.add.at(self.data, numpy.array(ids), values.reshape(len(ids), self.data.shape[1]))
+    self.data = self.data[:len(self.parent)]
+
+  def buildTotals(self):
+    nstacks = len(self.parent)
+    parent = numpy.array(self.parent, dtype = numpy.int64)
+    depth = numpy.array(self.depth, dtype = numpy.int64)
+    self.iscall = numpy.array([ eip is not None for eip in self.eip ], dtype = bool)
+    # A call's parent is the call one function up its stack, if that was itself called; if not, the call is a root
+    self.callparent = numpy.where(parent >= 0, parent, 0)
+    self.callparent = numpy.where((parent >= 0) & self.iscall[self.callparent], parent, -1)
+    calls = numpy.flatnonzero(self.iscall)
+    self.roots = calls[self.callparent[calls] < 0].tolist()
+
+    # Folding is decided per function
+    folded = {}
+    for eip in set(self.eip):
+      if eip is not None:
+        folded[eip] = self.foldCall(Call(str(self.functions[eip]), eip, None, None))
+    self.folded = numpy.array([ eip is not None and folded[eip] for eip in self.eip ], dtype = bool)
+
+    # Bottom-up over the call tree, deepest calls first: total includes all callees,
+    # data of folded calls is added to their caller (except for the number of calls)
+    for name, idx in self.columns.items():
+      self.totals[name] = long(self.data[:, idx].sum())
+    self.total = self.data.copy()
+    nocalls = [ idx for name, idx in sorted(self.columns.items()) if name != 'calls' ]
+    haveparent = calls[self.callparent[calls] >= 0]
+    for level in sorted(set(depth[haveparent].tolist()), reverse = True):
+      children = haveparent[depth[haveparent] == level]
+      numpy.add.at(self.total, self.callparent[children], self.total[children])
+      children = children[self.folded[children]]
+      if len(children):
+        numpy.add.at(self.data, (self.callparent[children][:, None], nocalls), self.data[children][:, nocalls])
+
+    # Children of each call: callees that are not folded, plus the children of folded callees
+    pairs_parent, pairs_child = [ self.callparent[haveparent] ], [ haveparent ]
+    while True:
+      fold = self.folded[pairs_parent[-1]] & (self.callparent[pairs_parent[-1]] >= 0)
+      if not fold.any():
+        break
+      pairs_parent.append(self.callparent[pairs_parent[-1][fold]])
+      pairs_child.append(pairs_child[-1][fold])
+    pairs_parent, pairs_child = numpy.concatenate(pairs_parent), numpy.concatenate(pairs_child)
+    keep = ~self.folded[pairs_child]
+    pairs_parent, pairs_child = pairs_parent[keep], pairs_child[keep]
+    order = numpy.lexsort((pairs_child, pairs_parent))
+    self.children = pairs_child[order]
+    self.children_start = numpy.searchsorted(pairs_parent[order], numpy.arange(nstacks + 1))
+
+  def getChildren(self, stackid):
+    return self.children[self.children_start[stackid]:self.children_start[stackid+1]].tolist()
+
+  def getStack(self, stackid):
+    stack = []
+    while stackid >= 0:
+      stack.append(self.last[stackid])
+      stackid = self.parent[stackid]
+    return ':'.join(reversed(stack))
+
+  def getCall(self, stackid):
+    return Call(str(self.functions[self.eip[stackid]]), self.eip[stackid], self.getStack(stackid),
+                dict(zip(self.headers[1:], self.data[stackid].tolist())),
+                dict(zip(self.headers[1:], self.total[stackid].tolist())),
+                self.getChildren(stackid), bool(self.folded[stackid]))
+
   def translateEip(self, eip):
     if eip in self.functions:
       return self.functions[eip].ieip
@@ -189,22 +256,32 @@ class Profile:
     else:
       printer = CallPrinterDefault(self, obj, opt_cutoff = opt_cutoff)
     printer.printHeader()
-    for stack in sorted(self.roots, key = lambda stack: self.calls[stack].total['nonidle_elapsed_time'], reverse = True):
-      printer.printTree(stack)
+    time = self.columns['nonidle_elapsed_time']
+    for stackid in sorted(self.roots, key = lambda stackid: self.total[stackid, time], reverse = True):
+      printer.printTree(stackid)
 
   def writeCallgrind(self, obj):
     bystatic = dict([ (fn.ieip, Category(fn.eip)) for fn in self.functions.values() ])
-    for stack in self.calls:
-      fn = self.functions[self.calls[stack].eip]
-      bystatic[fn.ieip].add(self.calls[stack].data)
+    ieips = bystatic.keys()
+    ieipidx = dict([ (ieip, idx) for idx, ieip in enumerate(ieips) ])
+    calls = numpy.array(self.calls, dtype = numpy.int64)
+    callieip = numpy.array([ ieipidx[self.functions[self.eip[stackid]].ieip] for stackid in self.calls ], dtype = numpy.int64)
+    # Exclusive data of each function, summed over all of its call stacks
+    data = numpy.zeros((len(ieips), self.data.shape[1]), dtype = numpy.int64)
+    numpy.add.at(data, callieip, self.data[calls])
+    for idx in numpy.unique(callieip).tolist():
+      bystatic[ieips[idx]].data = dict(zip(self.headers[1:], data[idx].tolist()))
+    # Callees of each function are those of its call stack that appears last in the trace
+    last = dict(zip(callieip.tolist(), calls.tolist()))
+    for idx, stackid in last.items():
       children = {}
-      for _stack in self.children[stack]:
-        _ieip = self.functions[self.calls[_stack].eip].ieip
+      for _stackid in self.getChildren(stackid):
+        _ieip = self.functions[self.eip[_stackid]].ieip
         if _ieip not in children:
-          children[_ieip] = Category(self.calls[_stack].eip)
-        children[_ieip].add(self.calls[_stack].total)
-        children[_ieip].calls = self.calls[_stack].data['calls']
-      bystatic[fn.ieip].children = children
+          children[_ieip] = Category(self.eip[_stackid])
+        children[_ieip].add(dict(zip(self.headers[1:], self.total[_stackid].tolist())))
+        children[_ieip].calls = long(self.data[_stackid, self.columns['calls']])
+      bystatic[ieips[idx]].children = children
 
     costs = (
       ('Cycles', 'Cycles',               lambda data: long(self.fs_to_cycles * data['nonidle_elapsed_time'])),
@@ -242,13 +319,15 @@ class Profile:
       print >> obj
 
   def summarize(self, catnames, catfilters, obj = sys.stdout):
-    def get_catname(func):
-      stack = func.stack
-      while stack:
-        has_parent = (':' in stack)
+    def get_catname(stackid):
+      while stackid >= 0:
+        if not self.iscall[stackid]:
+          stackid = self.parent[stackid]
+          continue
+        has_parent = (self.parent[stackid] >= 0)
         # Find category for this function by trying a match against all filters in catfilters
         for catname, catfilter in catfilters:
-          if catfilter(self.calls[stack], self):
+          if catfilter(self.getCall(stackid), self):
             if catname:
               return catname
             elif has_parent:
@@ -259,12 +338,11 @@ class Profile:
               # Ignore fold matches for root functions, try to match with another category
               continue
         # Visit parent function
-        stack = stack.rpartition(':')[0]
+        stackid = self.parent[stackid]
     bytype = dict([ (name, Category(name)) for name in catnames ])
-    for func in self.calls.values():
-      if not func.folded:
-        catname = get_catname(func)
-        bytype[catname].add(func.data)
+    for stackid in numpy.flatnonzero(self.iscall & ~self.folded).tolist():
+      catname = get_catname(stackid)
+      bytype[catname].add(dict(zip(self.headers[1:], self.data[stackid].tolist())))
     print >> obj, '%7s\t%7s\t%7s\t%7s' % ('time', 'icount', 'ipc', 'l2.mpki')
     for name in catnames:
       if bytype[name].data:
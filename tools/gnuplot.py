@@ -1,6 +1,6 @@
 import sys, subprocess
 
-def make_stacked_bargraph(outfile, titles, data, ylabel = 'Percent of Cycles', size = (640, 480), title = '', save_gnuplot_input = False):
+def make_stacked_bargraph(outfile, titles, data, ylabel = 'Percent of Cycles', size = (640, 480), title = '', save_gnuplot_input = False, xlabel = 'Core'):
 
   gnuplot_cmd_list = []
 
@@ -15,8 +15,8 @@ set key invert reverse Left outside
 set mxtics 2
 set mytics 2
 set ylabel "%s"
-set xlabel "Core"
-''' % (size[0], size[1], outfile, ylabel)
+set xlabel "%s"
+''' % (size[0], size[1], outfile, ylabel, xlabel)
   gnuplot_cmd_list.append(header)
 
   if title:
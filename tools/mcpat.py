@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-import os, sys, math, re, collections, buildstack, gnuplot, getopt, pprint, sniper_lib, sniper_config, sniper_stats
+import os, sys, math, re, collections, hashlib, shutil, buildstack, gnuplot, getopt, pprint, sniper_lib, sniper_config, sniper_stats
 import math
 
 #ISSUE_WIDTH = 4
@@ -95,56 +95,43 @@ def mcpat_bin():
   else:
     os.path.join(mcpatdir, 'mcpat-1.0')
 
-def mcpat_run(inputfile, outputfile):
+def mcpat_bin_signature():
+  # Path, size and modification time of the McPAT binary, so cached results are not reused after rebuilding McPAT
+  bin = mcpat_bin()
+  try:
+    st = os.stat(bin)
+    return '%s:%d:%d' % (bin, st.st_size, st.st_mtime)
+  except (OSError, TypeError):
+    return str(bin)
+
+def mcpat_run(inputfile, outputfile, cache_dir = None):
+  # With a cache directory, McPAT outputs are stored by a hash of their input XML (and the McPAT binary),
+  # so identical power models (e.g. repeated runs of a sweep) are only computed once
+  if cache_dir:
+    key = hashlib.sha1('%s\0%s' % (mcpat_bin_signature(), file(inputfile).read())).hexdigest()
+    cachefile = os.path.join(cache_dir, key[:2], key + '.txt')
+    if os.path.exists(cachefile):
+      shutil.copyfile(cachefile, outputfile)
+      return
   os.system("LD_LIBRARY_PATH=$LD_LIBRARY_PATH:%s %s -print_level 5 -opt_for_clk 1 -infile %s > %s" % \
     (mcpat_path(), mcpat_bin(), inputfile, outputfile))
+  if cache_dir and len(mcpat_parse(file(outputfile).read())):
+    if not os.path.exists(os.path.dirname(cachefile)):
+      try:
+        os.makedirs(os.path.dirname(cachefile))
+      except OSError:
+        pass # Created concurrently
+    shutil.copyfile(outputfile, cachefile + '.%d' % os.getpid())
+    os.rename(cachefile + '.%d' % os.getpid(), cachefile)
 
+def mcpat_cache_dir(cache_dir = None):
+  return cache_dir or os.getenv('SNIPER_MCPAT_CACHE') or None
 
-all_items = [
-  [ 'core',     .01,    [
-    [ 'core',     .01,    'core' ],
-    [ 'ifetch',   .01,    'core-ifetch' ],
-    [ 'alu',      .01,    'core-alu-complex' ],
-    [ 'int',      .01,    'core-alu-int' ],
-    [ 'fp',       .01,    'core-alu-fp' ],
-    [ 'mem',      .01,    'core-mem' ],
-    [ 'other',    .01,    'core-other' ],
-  ] ],
-  [ 'icache',   .01,    'icache' ],
-  [ 'dcache',   .01,    'dcache' ],
-  [ 'l2',       .01,    'l2' ],
-  [ 'l3',       .01,    'l3' ],
-  [ 'nuca',     .01,    'nuca' ],
-  [ 'noc',      .01,    'noc' ],
-  [ 'dram',     .01,    'dram' ],
-]
-
-all_names = buildstack.get_names(all_items)
-
-def get_all_names():
-  return all_names
 
-def main(jobid, resultsdir, outputfile, powertype = 'dynamic', config = None, no_graph = False, partial = None, print_stack = True, return_data = False):
-  tempfile = outputfile + '.xml'
-
-  results = sniper_lib.get_results(jobid, resultsdir, partial = partial)
-  if config:
-    results['config'] = sniper_config.parse_config(file(config).read(), results['config'])
-  stats = sniper_stats.SniperStats(resultsdir = resultsdir, jobid = jobid)
-
-  power, nuca_at_level = edit_XML(stats, results['results'], results['config'])
-  power = map(lambda v: v[0], power)
-  file(tempfile, "w").write('\n'.join(power))
-
-  # Run McPAT
-  mcpat_run(tempfile, outputfile + '.txt')
-
-  # Parse output
-  power_txt = file(outputfile + '.txt')
-  power_dat = {}
-
-  components = power_txt.read().split('*'*89)[2:-1]
-  for component in components:
+def mcpat_parse(text):
+  # Parse McPAT output into a list of (componentname, { 'path/to/value': value }) in output order
+  components = []
+  for component in text.split('*'*89)[2:-1]:
     lines = component.strip().split('\n')
     componentname = lines[0].strip().strip(':')
     values = {}
@@ -177,6 +164,12 @@ def main(jobid, resultsdir, outputfile, powertype = 'dynamic', config = None, no
           spaces.append(j)
           name = res.group(2).strip()
           prefix.append(name)
+    components.append((componentname, values))
+  return components
+
+def mcpat_power_dat(components, nuca_at_level):
+  power_dat = {}
+  for componentname, values in components:
     if componentname in ('Core', 'L2', 'L3'):
       # Translate whatever level we used for NUCA back into NUCA
       if componentname == 'L%d' % nuca_at_level:
@@ -189,6 +182,242 @@ def main(jobid, resultsdir, outputfile, powertype = 'dynamic', config = None, no
     else:
       assert componentname not in power_dat
       power_dat[componentname] = values
+  return power_dat
+
+
+# Energy model: McPAT's runtime dynamic power is (close to) linear in the activity counters of the XML input,
+# while leakage, peak power and area only depend on the architecture. For each architecture (the XML with all
+# <stat> values removed), McPAT is run once with the activity of the first interval or run that uses it, and once
+# for each counter with that counter perturbed, to obtain the runtime dynamic power per unit of each counter.
+# Later intervals and runs are evaluated as a dot product of their (cycle-normalized) counters with these coefficients.
+# Perturbing the same counter of all cores (caches, ...) at once, and attributing each instance's output to that
+# instance's counter, keeps the number of McPAT runs independent of the number of cores.
+
+MODEL_VERSION = 1
+model_stat_re = re.compile(r'^(\s*<stat name="([^"]*)"\s+value=")([^"]*)(".*)$')
+model_component_re = re.compile(r'<component id="([^"]*)"')
+model_instance_re = re.compile(r'^system\.(core|L2|L3)(\d+)$')
+
+def model_split_xml(xml):
+  # Return (architecture template, stat values, group of each stat, instance of each stat)
+  lines = xml.split('\n')
+  values, groups, instances = [], [], []
+  components = []
+  for i, line in enumerate(lines):
+    lines[i] = line.replace('%', '%%')
+    res = model_component_re.search(line)
+    if res:
+      components.append(res.group(1))
+    elif '</component>' in line:
+      components.pop()
+    res = model_stat_re.match(line)
+    if res:
+      instance = None
+      for component in components:
+        match = model_instance_re.match(component)
+        if match:
+          instance = ({ 'core': 'Core' }.get(match.group(1), match.group(1)), int(match.group(2)))
+      values.append(float(res.group(3)))
+      groups.append((re.sub(r'^(system\.(core|L2|L3))\d+', r'\1#', components[-1]), res.group(2)))
+      instances.append(instance)
+      lines[i] = res.group(1).replace('%', '%%') + '%s' + res.group(4).replace('%', '%%')
+  return '\n'.join(lines), values, groups, instances
+
+def model_make_xml(template, values):
+  return template % tuple([ ('%d' % v) if v == int(v) else ('%f' % v) for v in values ])
+
+def model_flatten(components):
+  # { (componentname, instance, valuename): value }
+  counts = collections.defaultdict(int)
+  fields = {}
+  for componentname, values in components:
+    for name, value in values.items():
+      fields[(componentname, counts[componentname], name)] = value
+    counts[componentname] += 1
+  return fields
+
+def model_unflatten(fields):
+  components = collections.OrderedDict()
+  for (componentname, instance, name), value in sorted(fields.items()):
+    components.setdefault((componentname, instance), {})[name] = value
+  return [ (componentname, values) for (componentname, instance), values in components.items() ]
+
+def model_is_cycles(group):
+  return group[1] in ('total_cycles',)
+
+def model_cycles_index(groups):
+  # Index of the first total_cycles stat, used to normalize the other counters
+  cycles = [ j for j, group in enumerate(groups) if model_is_cycles(group) ]
+  if not cycles:
+    raise ValueError('McPAT input has no total_cycles stat, cannot normalize counters for the energy model')
+  return cycles[0]
+
+def model_scale_mask(groups):
+  # Counters scale with the length of the interval, duty cycles are already rates
+  return [ not group[1].endswith('duty_cycle') for group in groups ]
+
+def model_run_worker((template, values, cache_dir)):
+  import tempfile
+  fd, inputfile = tempfile.mkstemp(suffix = '.xml')
+  os.write(fd, model_make_xml(template, values))
+  os.close(fd)
+  try:
+    mcpat_run(inputfile, inputfile + '.txt', cache_dir)
+    return mcpat_parse(file(inputfile + '.txt').read())
+  finally:
+    for filename in (inputfile, inputfile + '.txt'):
+      if os.path.exists(filename):
+        os.unlink(filename)
+
+def model_calibrate(template, values, groups, instances, cache_dir, workers = None):
+  import numpy, multiprocessing
+  values = numpy.array(values)
+  groupnames = sorted(set([ group for group in groups if not model_is_cycles(group) ]))
+  runs = [ values ]
+  deltas = []
+  for groupname in groupnames:
+    members = numpy.array([ group == groupname for group in groups ])
+    # Double event counts, halve cycle counts and duty cycles as those are bounded by the total
+    if groupname[1].endswith('duty_cycle'):
+      delta = numpy.where(values > 0, -values / 2., .5)
+    elif groupname[1].endswith('cycles'):
+      delta = numpy.round(-values / 2.)
+    else:
+      delta = numpy.maximum(values, 1000.)
+    delta = numpy.where(members, delta, 0.)
+    deltas.append(delta)
+    runs.append(values + delta)
+  pool = multiprocessing.Pool(workers or multiprocessing.cpu_count())
+  try:
+    outputs = pool.map(model_run_worker, [ (template, list(run), cache_dir) for run in runs ])
+  finally:
+    pool.close()
+  base = model_flatten(outputs[0])
+  if not base:
+    raise ValueError('No valid McPAT output found')
+  fieldnames = sorted(base.keys())
+  fieldindex = dict([ (field, i) for i, field in enumerate(fieldnames) ])
+  y0 = numpy.array([ base[field] for field in fieldnames ])
+  dynamic = numpy.array([ field[2].endswith('Runtime Dynamic') for field in fieldnames ])
+  coefficients = numpy.zeros((len(fieldnames), len(values)))
+  for output, delta in zip(outputs[1:], deltas):
+    fields = model_flatten(output)
+    dy = numpy.array([ fields.get(field, base[field]) for field in fieldnames ]) - y0
+    dy[~dynamic] = 0
+    members = [ j for j in range(len(values)) if delta[j] ]
+    if not members:
+      continue
+    # Response of each perturbed counter's own instance, used to apportion the response of shared components
+    own = {}
+    for j in members:
+      if instances[j] and (instances[j][0], instances[j][1], 'Runtime Dynamic') in fieldindex:
+        own[j] = abs(dy[fieldindex[(instances[j][0], instances[j][1], 'Runtime Dynamic')]])
+    total = sum(own.values())
+    weights = dict([ (j, own.get(j, 0) / total if total else 1. / len(members)) for j in members ])
+    bymember = dict([ (instances[j], j) for j in members if instances[j] ])
+    for f in numpy.flatnonzero(dy):
+      j = bymember.get(fieldnames[f][:2])
+      if j is not None:
+        coefficients[f, j] = dy[f] / delta[j]
+      else:
+        for j in members:
+          coefficients[f, j] = dy[f] * weights[j] / delta[j]
+  return { 'version': MODEL_VERSION, 'fields': fieldnames, 'base': y0, 'values': values, 'coefficients': coefficients }
+
+def model_get(template, values, groups, instances, cache_dir):
+  import cPickle, fcntl
+  key = hashlib.sha1('%s\0%s' % (mcpat_bin_signature(), template)).hexdigest()
+  modelfile = os.path.join(cache_dir, 'model', key + '.pickle')
+  if not os.path.exists(os.path.dirname(modelfile)):
+    try:
+      os.makedirs(os.path.dirname(modelfile))
+    except OSError:
+      pass # Created concurrently
+  # Concurrent users of the same architecture (e.g. powertrace.py workers) wait for a single calibration
+  lock = open(modelfile + '.lock', 'w')
+  fcntl.flock(lock, fcntl.LOCK_EX)
+  try:
+    if os.path.exists(modelfile):
+      model = cPickle.load(open(modelfile, 'rb'))
+      if model.get('version') == MODEL_VERSION:
+        return model
+    model = model_calibrate(template, values, groups, instances, cache_dir)
+    cPickle.dump(model, open(modelfile + '.tmp', 'wb'), cPickle.HIGHEST_PROTOCOL)
+    os.rename(modelfile + '.tmp', modelfile)
+    return model
+  finally:
+    fcntl.flock(lock, fcntl.LOCK_UN)
+    lock.close()
+
+def model_evaluate(model, values, groups):
+  # Normalize counters to the length of the calibration interval: runtime dynamic power is energy per second,
+  # so scaling all counters and cycles by the same factor does not change it
+  import numpy
+  values = numpy.array(values)
+  cycles = model_cycles_index(groups)
+  scale = numpy.where(model_scale_mask(groups), model['values'][cycles] / (values[cycles] or 1), 1.)
+  y = model['base'] + model['coefficients'].dot(values * scale - model['values'])
+  return model_unflatten(dict(zip(model['fields'], y)))
+
+def mcpat_model(xml, cache_dir):
+  template, values, groups, instances = model_split_xml(xml)
+  model_cycles_index(groups) # Fail before calibrating
+  model = model_get(template, values, groups, instances, cache_dir)
+  return model_evaluate(model, values, groups)
+
+
+all_items = [
+  [ 'core',     .01,    [
+    [ 'core',     .01,    'core' ],
+    [ 'ifetch',   .01,    'core-ifetch' ],
+    [ 'alu',      .01,    'core-alu-complex' ],
+    [ 'int',      .01,    'core-alu-int' ],
+    [ 'fp',       .01,    'core-alu-fp' ],
+    [ 'mem',      .01,    'core-mem' ],
+    [ 'other',    .01,    'core-other' ],
+  ] ],
+  [ 'icache',   .01,    'icache' ],
+  [ 'dcache',   .01,    'dcache' ],
+  [ 'l2',       .01,    'l2' ],
+  [ 'l3',       .01,    'l3' ],
+  [ 'nuca',     .01,    'nuca' ],
+  [ 'noc',      .01,    'noc' ],
+  [ 'dram',     .01,    'dram' ],
+]
+
+all_names = buildstack.get_names(all_items)
+
+def get_all_names():
+  return all_names
+
+def main(jobid, resultsdir, outputfile, powertype = 'dynamic', config = None, no_graph = False, partial = None, print_stack = True, return_data = False, snapshot = None, cache_dir = None, model = False):
+  tempfile = outputfile + '.xml'
+
+  if snapshot:
+    # Statistics were handed over by the simulator (scripts/powertrace.py), don't open the statistics database
+    import sniper_stats_snapshot
+    stats = sniper_stats_snapshot.SniperStatsSnapshot(snapshot)
+    results = sniper_lib.get_results(config = sniper_lib.get_config(jobid, resultsdir), stats = stats, partial = partial)
+  else:
+    results = sniper_lib.get_results(jobid, resultsdir, partial = partial)
+    stats = sniper_stats.SniperStats(resultsdir = resultsdir, jobid = jobid)
+  if config:
+    results['config'] = sniper_config.parse_config(file(config).read(), results['config'])
+
+  power, nuca_at_level = edit_XML(stats, results['results'], results['config'])
+  power = map(lambda v: v[0], power)
+  file(tempfile, "w").write('\n'.join(power))
+
+  cache_dir = mcpat_cache_dir(cache_dir)
+  if model:
+    # Evaluate the energy model of this architecture instead of running McPAT
+    components = mcpat_model('\n'.join(power), cache_dir or os.path.join(os.path.dirname(os.path.abspath(outputfile)), 'mcpat-cache'))
+  else:
+    # Run McPAT
+    mcpat_run(tempfile, outputfile + '.txt', cache_dir)
+    # Parse output
+    components = mcpat_parse(file(outputfile + '.txt').read())
+  power_dat = mcpat_power_dat(components, nuca_at_level)
 
   if not power_dat:
     raise ValueError('No valid McPAT output found')
@@ -1256,7 +1485,7 @@ def readTemplate(ncores, num_l2s, private_l2s, num_l3s, technology_node):
 
 if __name__ == '__main__':
   def usage():
-    print 'Usage:', sys.argv[0], '[-h (help)] [-j <jobid> | -d <resultsdir (default: .)>] [-t <type: %s>] [-c <override-config>] [-o <output-file (power{.png,.txt,.py})>]' % '|'.join(powertypes)
+    print 'Usage:', sys.argv[0], '[-h (help)] [-j <jobid> | -d <resultsdir (default: .)>] [-t <type: %s>] [-c <override-config>] [-o <output-file (power{.png,.txt,.py})>] [--partial=<from>:<to>] [--snapshot=<statistics snapshot file>] [--cache=<McPAT result cache directory (default: $SNIPER_MCPAT_CACHE)>] [--model (use a per-architecture energy model instead of running McPAT)]' % '|'.join(powertypes)
     sys.exit(-1)
 
   jobid = 0
@@ -1268,9 +1497,12 @@ if __name__ == '__main__':
   no_graph = False
   no_text = False
   partial = None
+  snapshot = None
+  cache_dir = None
+  model = False
 
   try:
-    opts, args = getopt.getopt(sys.argv[1:], "hj:t:c:d:o:", [ 'no-graph', 'no-text', 'partial=' ])
+    opts, args = getopt.getopt(sys.argv[1:], "hj:t:c:d:o:", [ 'no-graph', 'no-text', 'partial=', 'snapshot=', 'cache=', 'model' ])
   except getopt.GetoptError, e:
     print e
     usage()
@@ -1299,6 +1531,12 @@ if __name__ == '__main__':
         sys.stderr.write('--partial=<from>:<to>\n')
         usage()
       partial = a.split(':')
+    if o == '--snapshot':
+      snapshot = a
+    if o == '--cache':
+      cache_dir = a
+    if o == '--model':
+      model = True
 
 
-  main(jobid = jobid, resultsdir = resultsdir, powertype = powertype, config = config, outputfile = outputfile, no_graph = no_graph, print_stack = not no_text, partial = partial)
+  main(jobid = jobid, resultsdir = resultsdir, powertype = powertype, config = config, outputfile = outputfile, no_graph = no_graph, print_stack = not no_text, partial = partial, snapshot = snapshot, cache_dir = cache_dir, model = model)
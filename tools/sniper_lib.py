@@ -1,6 +1,6 @@
 # A copy of this file is distributed with the binaries of Sniper and Benchmarks
 
-import sys, os, re, subprocess, cStringIO, sniper_stats, sniper_config
+import sys, os, re, copy, functools, subprocess, cStringIO, cPickle, sniper_stats, sniper_config
 try:
   import json
 except ImportError:
@@ -37,27 +37,194 @@ def get_config(jobid = None, resultsdir = None, force_deleted = True):
   return config
 
 
-def get_results(jobid = None, resultsdir = None, config = None, stats = None, partial = None, force = False, metrics = None):
+# Statistics computed by parse_results_from_dir and stats_process rather than read from sim.stats, and what they need.
+# get_results(outputs = [...]) uses this to read only the metrics (and files) the requested outputs depend on,
+# and to run only the derivations that produce them. A name depending on itself also needs the raw metric of that name,
+# names not listed here (e.g. dram.remote-reads) are raw sim.stats metrics. Statistics from power.py are named power.*.
+STATS_DEPENDENCIES = {
+  'ncores': (),
+  'corefreq': (),
+  'walltime': (), # sim.info
+  'vmem': (),     # sim.info
+  'roi.walltime': ('time.walltime', 'core.instructions'),
+  'roi.instrs': ('time.walltime', 'core.instructions'),
+  'roi.ipstotal': ('time.walltime', 'core.instructions'),
+  'roi.ipscore': ('time.walltime', 'core.instructions'),
+  'barrier.global_time_begin': ('barrier.global_time',),
+  'barrier.global_time_end': ('barrier.global_time',),
+  'performance_model.elapsed_time_begin': ('performance_model.elapsed_time',),
+  'performance_model.elapsed_time_end': ('performance_model.elapsed_time',),
+  'global.time': ('barrier.global_time', 'performance_model.elapsed_time'),
+  'global.time_begin': ('global.time',),
+  'global.time_end': ('global.time',),
+  'l1misslat': ('L1-D.load-misses', 'L1-D.store-misses', 'L1-D.total-latency'),
+  'pthread_locks_contended': ('pthread.pthread_mutex_lock_contended', 'pthread.pthread_mutex_lock_count'),
+  'fs_to_cycles_cores': (),
+  'fs_to_cycles': ('fs_to_cycles_cores',),
+  'performance_model.elapsed_time': ('performance_model.elapsed_time', 'performance_model.idle_elapsed_time', 'global.time'),
+  'performance_model.idle_elapsed_time': ('performance_model.elapsed_time', 'performance_model.idle_elapsed_time', 'global.time'),
+  'performance_model.nonidle_elapsed_time': ('performance_model.elapsed_time', 'performance_model.idle_elapsed_time'),
+  'performance_model.cycle_count': ('performance_model.cycle_count', 'performance_model.elapsed_time', 'fs_to_cycles_cores'),
+  'thread.nonidle_cycle_count': ('thread.nonidle_cycle_count', 'thread.nonidle_elapsed_time', 'fs_to_cycles'),
+  'ipc': ('performance_model.instruction_count', 'performance_model.cycle_count'),
+}
+
+def resolve_outputs(outputs):
+  # Returns (metrics, derived): the sim.stats metrics to read and the derived statistics to compute for outputs
+  metrics, derived = set(), set()
+  def resolve(name):
+    if name in derived:
+      return
+    if name in STATS_DEPENDENCIES:
+      derived.add(name)
+      for dep in STATS_DEPENDENCIES[name]:
+        if dep == name:
+          metrics.add(name)
+        else:
+          resolve(dep)
+    elif name.startswith('power.'):
+      derived.add(name)
+    else:
+      metrics.add(name)
+  for name in outputs:
+    resolve(name)
+  return metrics, derived
+
+def is_wanted(derived, *names):
+  # Whether any of names is to be computed, derived is the second result of resolve_outputs (None: compute everything)
+  return derived is None or any([ name in derived for name in names ])
+
+def get_metrics(metrics = None, outputs = None):
+  # Metric filter to pass to parse_stats: metrics plus whatever outputs need, None to read everything
+  if outputs is None:
+    return metrics
+  return sorted(set(metrics or []) | resolve_outputs(outputs)[0])
+
+
+# Results of get_results(resultsdir = ...) are cached in memory, and optionally in a sidecar file in the results directory
+# (set SNIPER_RESULTS_CACHE=1 in the environment, or results_cache_persistent = True).
+# Cache entries are invalidated when the modification time or size of any of the files that were parsed changes.
+# The Python 3 copy of this module (disaggr_scripts/sniper_lib.py) computes some statistics differently, so it uses its own sidecar.
+RESULTS_CACHE_FILENAME = 'sim.results.py2.cache'
+RESULTS_CACHE_INPUTS = ('sim.cfg', 'sim.info', 'graphite.out', 'sim.stats.sqlite3', 'sim.stats.db', 'sim.stats', 'sim.stats.delta', 'sim.stats.base', 'power.py')
+results_cache_persistent = os.environ.get('SNIPER_RESULTS_CACHE', '0') not in ('', '0')
+_results_cache = {}
+
+def results_cache_key(resultsdir, partial = None, metrics = None, outputs = None):
+  return (os.path.realpath(resultsdir), tuple(partial[:2]) if partial else None, tuple(sorted(metrics)) if metrics else None,
+          tuple(sorted(outputs)) if outputs is not None else None)
+
+def results_cache_signature(resultsdir):
+  signature = []
+  for filename in RESULTS_CACHE_INPUTS:
+    try:
+      st = os.stat(os.path.join(resultsdir, filename))
+    except OSError:
+      continue
+    signature.append((filename, st.st_mtime, st.st_size))
+  return tuple(signature)
+
+def results_cache_read(resultsdir):
+  try:
+    return cPickle.load(open(os.path.join(resultsdir, RESULTS_CACHE_FILENAME), 'rb'))
+  except Exception:
+    # Missing, stale format or corrupt: treat as empty
+    return {}
+
+def results_cache_write(resultsdir, key, signature, data):
+  entries = results_cache_read(resultsdir)
+  entries[key[1:]] = (signature, data)
+  filename = os.path.join(resultsdir, RESULTS_CACHE_FILENAME)
+  try:
+    fp = open(filename + '.tmp', 'wb')
+    cPickle.dump(entries, fp, cPickle.HIGHEST_PROTOCOL)
+    fp.close()
+    os.rename(filename + '.tmp', filename)
+  except (IOError, OSError):
+    # Results directory may not be writable, the cache is only an optimization
+    pass
+
+def results_cache_clear():
+  _results_cache.clear()
+
+def get_results_cached(resultsdir, partial = None, metrics = None, outputs = None):
+  key = results_cache_key(resultsdir, partial, metrics, outputs)
+  signature = results_cache_signature(resultsdir)
+  if key in _results_cache and _results_cache[key][0] == signature:
+    data = _results_cache[key][1]
+  else:
+    data = None
+    if results_cache_persistent:
+      entry = results_cache_read(resultsdir).get(key[1:])
+      if entry and entry[0] == signature:
+        data = entry[1]
+    if data is None:
+      results = parse_results_from_dir(resultsdir, partial = partial, metrics = metrics, outputs = outputs)
+      config = get_config(resultsdir = resultsdir)
+      data = {
+        'config': config,
+        'results': stats_process(config, results, outputs = outputs),
+      }
+      if results_cache_persistent:
+        results_cache_write(resultsdir, key, signature, data)
+    _results_cache[key] = (signature, data)
+  # Callers are free to modify the returned dictionaries, so never hand out the cached copy
+  return copy.deepcopy(data)
+
+
+def get_results(jobid = None, resultsdir = None, config = None, stats = None, partial = None, force = False, metrics = None, cache = True, outputs = None):
+  # outputs: only read and compute what is needed for these statistics (see STATS_DEPENDENCIES), default is everything
   if jobid:
     if ic_invalid:
       raise RuntimeError('Cannot fetch results from server, make sure BENCHMARKS_ROOT points to a valid copy of benchmarks+iqlib')
-    results = ic.graphite_results(jobid, partial, metrics)
+    results = ic.graphite_results(jobid, partial, get_metrics(metrics, outputs))
     config = get_config(jobid = jobid, force_deleted = force)
+  elif resultsdir and cache:
+    return get_results_cached(resultsdir, partial = partial, metrics = metrics, outputs = outputs)
   elif resultsdir:
-    results = parse_results_from_dir(resultsdir, partial = partial, metrics = metrics)
+    results = parse_results_from_dir(resultsdir, partial = partial, metrics = metrics, outputs = outputs)
     config = get_config(resultsdir = resultsdir)
   elif stats:
     config = config or stats.config
-    results = stats.parse_stats(partial or ('roi-begin', 'roi-end'), int(config['general/total_cores']), metrics = metrics)
+    results = stats.parse_stats(partial or ('roi-begin', 'roi-end'), int(config['general/total_cores']), metrics = get_metrics(metrics, outputs))
   else:
     raise ValueError('Need either jobid or resultsdir')
 
   return {
     'config': config,
-    'results': stats_process(config, results),
+    'results': stats_process(config, results, outputs = outputs),
   }
 
 
+def load_results_one(resultsdir, partial = None, metrics = None, outputs = None):
+  return get_results(resultsdir = resultsdir, partial = partial, metrics = metrics, outputs = outputs)
+
+def load_results_worker((loader, resultsdir)):
+  try:
+    return resultsdir, loader(resultsdir)
+  except Exception, e:
+    # Not all exceptions can be pickled back to the parent, pass on the message only
+    return resultsdir, SniperResultsException('%s: %s' % (resultsdir, e))
+
+def load_results_parallel(resultsdirs, partial = None, metrics = None, workers = None, loader = None, outputs = None):
+  # Load the results of many runs using a pool of worker processes (default: one per CPU).
+  # Returns { resultsdir: results }, runs that could not be loaded map to a SniperResultsException instead of aborting the batch.
+  # By default results are read using get_results(resultsdir, partial, metrics), pass loader(resultsdir) to read something else.
+  import multiprocessing # module does not exist in Python <= 2.5, import only when needed
+  if loader is None:
+    loader = functools.partial(load_results_one, partial = partial, metrics = metrics, outputs = outputs)
+  tasks = [ (loader, resultsdir) for resultsdir in resultsdirs ]
+  workers = min(workers or multiprocessing.cpu_count(), len(tasks))
+  if workers <= 1:
+    return dict(map(load_results_worker, tasks))
+  pool = multiprocessing.Pool(workers)
+  try:
+    # map_async().get() with a timeout keeps the parent responsive to Ctrl-C
+    return dict(pool.map_async(load_results_worker, tasks, chunksize = 1).get(1 << 31))
+  finally:
+    pool.terminate()
+
+
 def get_name(jobid = None, resultsdir = None):
   name = None
   if jobid:
@@ -75,8 +242,9 @@ def get_name(jobid = None, resultsdir = None):
   }
 
 
-def stats_process(config, results):
+def stats_process(config, results, outputs = None):
   ncores = int(config['general/total_cores'])
+  derived = resolve_outputs(outputs)[1] if outputs is not None else None
   stats = {}
   for key, core, value in results:
      if core == -1:
@@ -93,31 +261,35 @@ def stats_process(config, results):
   # Since cores can account for time in chunks, per-core time can be
   # both before (``wakeup at future time X'') or after (``sleep until woken up'')
   # the current time.
-  if 'barrier.global_time_begin' in stats:
-    # Most accurate: ask the barrier
-    time0_begin = stats['barrier.global_time_begin'][0]
-    time0_end = stats['barrier.global_time_end'][0]
-    stats.update({'global.time_begin': time0_begin, 'global.time_end': time0_end, 'global.time': time0_end - time0_begin})
-  elif 'performance_model.elapsed_time_begin' in stats:
-    # Guess based on core that has the latest time (future wakeup is less common than sleep on futex)
-    time0_begin = max(stats['performance_model.elapsed_time_begin'])
-    time0_end = max(stats['performance_model.elapsed_time_end'])
-    stats.update({'global.time_begin': time0_begin, 'global.time_end': time0_end, 'global.time': time0_end - time0_begin})
+  if is_wanted(derived, 'global.time'):
+    if 'barrier.global_time_begin' in stats:
+      # Most accurate: ask the barrier
+      time0_begin = stats['barrier.global_time_begin'][0]
+      time0_end = stats['barrier.global_time_end'][0]
+      stats.update({'global.time_begin': time0_begin, 'global.time_end': time0_end, 'global.time': time0_end - time0_begin})
+    elif 'performance_model.elapsed_time_begin' in stats:
+      # Guess based on core that has the latest time (future wakeup is less common than sleep on futex)
+      time0_begin = max(stats['performance_model.elapsed_time_begin'])
+      time0_end = max(stats['performance_model.elapsed_time_end'])
+      stats.update({'global.time_begin': time0_begin, 'global.time_end': time0_end, 'global.time': time0_end - time0_begin})
   # add computed stats
-  try:
-    l1access = sum(stats['L1-D.load-misses']) + sum(stats['L1-D.store-misses'])
-    l1time = sum(stats['L1-D.total-latency'])
-    stats['l1misslat'] = l1time / float(l1access or 1)
-  except KeyError:
-    pass
-  stats['pthread_locks_contended'] = float(sum(stats.get('pthread.pthread_mutex_lock_contended', [0]))) / (sum(stats.get('pthread.pthread_mutex_lock_count', [0])) or 1)
+  if is_wanted(derived, 'l1misslat'):
+    try:
+      l1access = sum(stats['L1-D.load-misses']) + sum(stats['L1-D.store-misses'])
+      l1time = sum(stats['L1-D.total-latency'])
+      stats['l1misslat'] = l1time / float(l1access or 1)
+    except KeyError:
+      pass
+  if is_wanted(derived, 'pthread_locks_contended'):
+    stats['pthread_locks_contended'] = float(sum(stats.get('pthread.pthread_mutex_lock_contended', [0]))) / (sum(stats.get('pthread.pthread_mutex_lock_count', [0])) or 1)
   # femtosecond to cycles conversion
-  freq = [ 1e9 * float(sniper_config.get_config(config, 'perf_model/core/frequency', idx)) for idx in range(ncores) ]
-  stats['fs_to_cycles_cores'] = map(lambda f: f / 1e15, freq)
-  # Backwards compatible version returning fs_to_cycles for core 0, for heterogeneous configurations fs_to_cycles_cores needs to be used
-  stats['fs_to_cycles'] = stats['fs_to_cycles_cores'][0]
+  if is_wanted(derived, 'fs_to_cycles_cores'):
+    freq = [ 1e9 * float(sniper_config.get_config(config, 'perf_model/core/frequency', idx)) for idx in range(ncores) ]
+    stats['fs_to_cycles_cores'] = map(lambda f: f / 1e15, freq)
+    # Backwards compatible version returning fs_to_cycles for core 0, for heterogeneous configurations fs_to_cycles_cores needs to be used
+    stats['fs_to_cycles'] = stats['fs_to_cycles_cores'][0]
   # Fixed versions of [idle|nonidle] elapsed time
-  if 'performance_model.elapsed_time' in stats and 'performance_model.idle_elapsed_time' in stats:
+  if is_wanted(derived, 'performance_model.elapsed_time') and 'performance_model.elapsed_time' in stats and 'performance_model.idle_elapsed_time' in stats:
     stats['performance_model.nonidle_elapsed_time'] = [
       stats['performance_model.elapsed_time'][c] - stats['performance_model.idle_elapsed_time'][c]
       for c in range(ncores)
@@ -128,12 +300,12 @@ def stats_process(config, results):
     ]
     stats['performance_model.elapsed_time'] = [ time0_end - time0_begin for c in range(ncores) ]
   # DVFS-enabled runs: emulate cycle_count asuming constant (initial) frequency
-  if 'performance_model.elapsed_time' in stats and 'performance_model.cycle_count' not in stats:
+  if is_wanted(derived, 'performance_model.cycle_count') and 'performance_model.elapsed_time' in stats and 'performance_model.cycle_count' not in stats:
     stats['performance_model.cycle_count'] = [ stats['fs_to_cycles_cores'][idx] * stats['performance_model.elapsed_time'][idx] for idx in range(ncores) ]
-  if 'thread.nonidle_elapsed_time' in stats and 'thread.nonidle_cycle_count' not in stats:
+  if is_wanted(derived, 'thread.nonidle_cycle_count') and 'thread.nonidle_elapsed_time' in stats and 'thread.nonidle_cycle_count' not in stats:
     stats['thread.nonidle_cycle_count'] = [ long(stats['fs_to_cycles'] * t) for t in stats['thread.nonidle_elapsed_time'] ]
   # IPC
-  if 'performance_model.cycle_count' in stats:
+  if is_wanted(derived, 'ipc') and 'performance_model.cycle_count' in stats:
     stats['ipc'] = [
       i / (c or 1)
       for i, c in zip(stats['performance_model.instruction_count'], stats['performance_model.cycle_count'])
@@ -142,8 +314,9 @@ def stats_process(config, results):
   return stats
 
 
-def parse_results_from_dir(resultsdir, partial = None, metrics = None):
+def parse_results_from_dir(resultsdir, partial = None, metrics = None, outputs = None):
   results = []
+  derived = resolve_outputs(outputs)[1] if outputs is not None else None
 
   ## sim.cfg
   simcfg = os.path.join(resultsdir, 'sim.cfg')
@@ -158,7 +331,9 @@ def parse_results_from_dir(resultsdir, partial = None, metrics = None):
   ## sim.info or graphite.out
   siminfo = os.path.join(resultsdir, 'sim.info')
   graphiteout = os.path.join(resultsdir, 'graphite.out')
-  if os.path.exists(siminfo):
+  if not is_wanted(derived, 'walltime', 'vmem'):
+    siminfo = None
+  elif os.path.exists(siminfo):
     siminfo = eval(open(siminfo).read())
   elif os.path.exists(graphiteout):
     siminfo = eval(open(graphiteout).read())
@@ -175,10 +350,12 @@ def parse_results_from_dir(resultsdir, partial = None, metrics = None):
   else:
     k1, k2 = 'roi-begin', 'roi-end'
 
-  stats = sniper_stats.SniperStats(resultsdir)
-  results += stats.parse_stats((k1, k2), ncores, metrics = metrics)
+  metrics = get_metrics(metrics, outputs)
+  if outputs is None or metrics:
+    stats = sniper_stats.SniperStats(resultsdir)
+    results += stats.parse_stats((k1, k2), ncores, metrics = metrics)
 
-  if not partial:
+  if not partial and is_wanted(derived, 'roi.walltime', 'roi.instrs', 'roi.ipstotal', 'roi.ipscore'):
     walltime = [ v for k, _, v in results if k == 'time.walltime' ]
     instrs = [ v for k, _, v in results if k == 'core.instructions' ]
     if walltime and instrs:
@@ -192,7 +369,7 @@ def parse_results_from_dir(resultsdir, partial = None, metrics = None):
   ## power.py
   power = {}
   powerfile = os.path.join(resultsdir, 'power.py')
-  if os.path.exists(powerfile):
+  if os.path.exists(powerfile) and (derived is None or [ name for name in derived if name.startswith('power.') ]):
     exec(open(powerfile).read())
     for key, value in power.items():
       results.append(('power.%s' % key, -1, value))
@@ -219,6 +396,12 @@ def format_size(size, digits = 1):
   return '%.*f%sB' % (digits, size, [' ', 'K', 'M', 'G', 'T', 'P', 'E'][i])
 
 
+def cppfilt_all(names):
+  # Demangle many names with a single c++filt process, one name per line
+  output = subprocess.Popen([ 'c++filt' ], stdin = subprocess.PIPE, stdout = subprocess.PIPE).communicate(''.join([ name + '\n' for name in names ]))[0]
+  return output.split('\n')[:len(names)]
+
+
 def sign(x):
   if x > 0:
     return 1
@@ -24,6 +24,28 @@ class SniperStatsBase:
         results += [ ('barrier.global_time_end', idx, vals2.get(idx, 0)) for idx in range(ncores) ]
     return results
 
+  def read_timeseries(self, metrics, prefixes = None):
+    # Return the value of each metric at every snapshot in prefixes (default: all snapshots, in get_snapshots() order)
+    # as a { metric: numpy.array([len(prefixes), ncores]) } dictionary. Metrics that do not exist are omitted.
+    # Backends that can read all snapshots in one go should override this, this version reads one snapshot at a time.
+    import numpy
+    if prefixes is None:
+      prefixes = self.get_snapshots()
+    nameids = dict([ (nameid, '%s.%s' % name) for nameid, name in self.names.items() if '%s.%s' % name in metrics ])
+    snapshots = [ self.read_snapshot(prefix, metrics = metrics) for prefix in prefixes ]
+    results = {}
+    for nameid, name in nameids.items():
+      ncores = max([ max(v.get(nameid, {}).keys() or [-1]) for v in snapshots ] or [-1]) + 1
+      if not ncores:
+        continue
+      values = numpy.zeros((len(prefixes), ncores), dtype = numpy.int64)
+      for row, v in enumerate(snapshots):
+        for core, value in v.get(nameid, {}).items():
+          if core >= 0:
+            values[row, core] = value
+      results[name] = values
+    return results
+
   def get_topology(self):
     raise ValueError("Topology information not available from statistics of this type")
 
@@ -1,26 +1,108 @@
-import os, re, sniper_stats
+import os, re, cPickle, sniper_stats
+
+INDEX_VERSION = 1
 
 class SniperStatsCompat(sniper_stats.SniperStatsBase):
   def __init__(self, resultsdir):
     self.resultsdir = resultsdir
+    self.index = None
+    self.keys = {}
 
-  def parse_stats(self, (k1, k2), ncores, metrics = None):
-    simstats = os.path.join(self.resultsdir, 'sim.stats')
-    simstats = os.path.exists(simstats) and open(simstats) or None
+  def get_statsfile(self):
+    simstatsdelta = os.path.join(self.resultsdir, 'sim.stats.delta')
+    if os.path.exists(simstatsdelta):
+      return simstatsdelta
+    return os.path.join(self.resultsdir, 'sim.stats')
+
+  def split_key(self, key):
+    # 'performance_model[0].elapsed_time' -> ('performance_model.elapsed_time', 0), memoized as keys repeat in every snapshot
+    if key not in self.keys:
+      if '[' in key:
+        parts = re.match('(.*)\[(.*)\](.*)', key).groups()
+        self.keys[key] = (parts[0] + parts[2], int(parts[1]))
+      else:
+        self.keys[key] = (key, -1)
+    return self.keys[key]
+
+  def build_index(self, filename):
+    # Single pass over the file: (offset, length) of each run of lines belonging to the same prefix,
+    # and the names of all metrics. Prefixes are everything before the first dot.
+    prefixes = []
+    ranges = {}
+    metricnames = set()
+    current, start, offset = None, 0, 0
+    for line in open(filename, 'rb'):
+      fields = line.split(None, 1)
+      if fields and '.' in fields[0]:
+        prefix, key = fields[0].split('.', 1)
+      else:
+        prefix = None
+      if prefix != current:
+        if current is not None:
+          ranges[current].append((start, offset - start))
+        if prefix is not None and prefix not in ranges:
+          ranges[prefix] = []
+          prefixes.append(prefix)
+        current, start = prefix, offset
+      if prefix is not None:
+        metricnames.add(self.split_key(key)[0])
+      offset += len(line)
+    if current is not None:
+      ranges[current].append((start, offset - start))
+    return { 'prefixes': prefixes, 'ranges': ranges, 'metricnames': sorted(metricnames) }
+
+  def get_index(self):
+    # Built lazily on first use, and cached beside the statistics file
+    if self.index is None:
+      filename = self.get_statsfile()
+      st = os.stat(filename)
+      signature = (INDEX_VERSION, st.st_size, st.st_mtime)
+      indexfile = filename + '.index'
+      try:
+        index_signature, index = cPickle.load(open(indexfile, 'rb'))
+        if index_signature == signature:
+          self.index = index
+      except Exception:
+        # Missing, stale format or corrupt: rebuild
+        pass
+      if self.index is None:
+        self.index = self.build_index(filename)
+        try:
+          fp = open(indexfile + '.tmp', 'wb')
+          cPickle.dump((signature, self.index), fp, cPickle.HIGHEST_PROTOCOL)
+          fp.close()
+          os.rename(indexfile + '.tmp', indexfile)
+        except (IOError, OSError):
+          # Results directory may not be writable, the index cache is only an optimization
+          pass
+      self.names = dict([ (nameid, tuple(name.split('.', 1))) for nameid, name in enumerate(self.index['metricnames']) ])
+    return self.index
 
+  def read_prefix(self, prefix, metrics = None):
+    # Return { key: value } for all statistics of one prefix, with key as in the file (e.g. 'performance_model[0].elapsed_time')
+    ranges = self.get_index()['ranges'].get(prefix, [])
+    values = {}
+    if not ranges:
+      return values
+    skip = len(prefix) + 1
+    fp = open(self.get_statsfile(), 'rb')
+    for offset, length in ranges:
+      fp.seek(offset)
+      for line in fp.read(length).splitlines():
+        fields = line.split()
+        key = fields[0][skip:]
+        if metrics and self.split_key(key)[0] not in metrics:
+          continue
+        values[key] = long(fields[1])
+    fp.close()
+    return values
+
+  def parse_stats(self, (k1, k2), ncores, metrics = None):
     simstatsbase = os.path.join(self.resultsdir, 'sim.stats.base')
     simstatsbase = os.path.exists(simstatsbase) and open(simstatsbase) or None
 
-    simstatsdelta = os.path.join(self.resultsdir, 'sim.stats.delta')
-    simstatsdelta = os.path.exists(simstatsdelta) and open(simstatsdelta) or None
-
-    stats_begin = {}
-    stats = {}
-    for line in (simstatsdelta or simstats):
-      if line.startswith(k1+'.'):
-        stats_begin[line.split()[0][len(k1+'.'):]] = long(line.split()[1])
-      if line.startswith(k2+'.'):
-        stats[line.split()[0][len(k2+'.'):]] = long(line.split()[1])
+    stats_begin = self.read_prefix(k1, metrics = metrics)
+    stats = self.read_prefix(k2, metrics = metrics)
 
     if simstatsbase:
       # End stats may not be empty, check before adding the defaults
@@ -31,6 +113,8 @@ class SniperStatsCompat(sniper_stats.SniperStatsBase):
         if not line: continue
         for c in range(ncores):
           key = line.split('[]')[0] + ('[%u]' % c) + line.split('[]', 1)[1]
+          if metrics and self.split_key(key)[0] not in metrics:
+            continue
           stats_begin.setdefault(key, 0)
           stats.setdefault(key, 0)
     else:
@@ -50,15 +134,26 @@ class SniperStatsCompat(sniper_stats.SniperStatsBase):
       if key in stats_begin:
         value -= stats_begin[key]
         stats[key] = value
-      if '[' in key:
-        key = re.match('(.*)\[(.*)\](.*)', key).groups()
-        key, core = key[0] + key[2], int(key[1])
-      else:
-        core = -1
+      key, core = self.split_key(key)
       results.append((key, core, value))
 
     return results
 
   def get_snapshots(self):
-    # Should be easily parseable from sim.stats.delta, but who cares
-    raise NotImplementedError
+    return list(self.get_index()['prefixes'])
+
+  def read_timeseries(self, metrics, prefixes = None):
+    self.get_index() # Sets self.names
+    return sniper_stats.SniperStatsBase.read_timeseries(self, metrics, prefixes)
+
+  def read_snapshot(self, prefix, metrics = None):
+    if prefix not in self.get_index()['ranges']:
+      raise ValueError('Invalid prefix %s' % prefix)
+    nameids = dict([ ('.'.join(name), nameid) for nameid, name in self.names.items() ])
+    values = {}
+    for key, value in self.read_prefix(prefix, metrics = metrics).items():
+      name, core = self.split_key(key)
+      nameid = nameids[name]
+      if nameid not in values: values[nameid] = {}
+      values[nameid][core] = value
+    return values
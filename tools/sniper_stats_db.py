@@ -1,4 +1,77 @@
-import os, bsddb, struct, zlib, sniper_stats
+import os, sys, mmap, struct, zlib, collections, numpy, sniper_stats
+
+# Read-only access to the Berkeley DB hash files written by older Sniper versions, without needing the bsddb module
+# (which was removed from Python). Only what sim.stats.db uses is supported: no duplicates, no encryption.
+
+DB_HASHMAGIC = 0x061561
+P_HASH_UNSORTED, P_OVERFLOW, P_HASH = 2, 7, 13
+H_KEYDATA, H_OFFPAGE = 1, 3
+DBMETA_CHKSUM = 0x01
+SIZEOF_PAGE = 26
+SIZEOF_PG_CHKSUM = 6
+
+class BerkeleyDbHash:
+  def __init__(self, filename):
+    self.fp = open(filename, 'rb')
+    self.data = mmap.mmap(self.fp.fileno(), 0, access = mmap.ACCESS_READ)
+    for self.endian in ('<', '>'):
+      if struct.unpack_from(self.endian + 'I', self.data, 12)[0] == DB_HASHMAGIC:
+        break
+    else:
+      raise ValueError('%s is not a Berkeley DB hash file' % filename)
+    self.pagesize = self.unpack('I', 20)
+    encrypt_alg, metaflags = struct.unpack_from('BxB', self.data, 24)
+    if encrypt_alg:
+      raise ValueError('Encrypted Berkeley DB files are not supported')
+    self.overhead = SIZEOF_PAGE + (metaflags & DBMETA_CHKSUM and SIZEOF_PG_CHKSUM or 0)
+    self.items = collections.OrderedDict()
+    self.read_items()
+
+  def unpack(self, fmt, offset):
+    return struct.unpack_from(self.endian + fmt, self.data, offset)[0]
+
+  def read_items(self):
+    # Scan all hash pages once, remembering where each key's data lives. Keys and data alternate on each page,
+    # items are stored from the end of the page downwards so an item's length follows from the previous item's offset.
+    for pgno in range(1, len(self.data) // self.pagesize):
+      page = pgno * self.pagesize
+      if ord(self.data[page+25:page+26]) not in (P_HASH_UNSORTED, P_HASH):
+        continue
+      entries = self.unpack('H', page + 20)
+      offsets = [ self.unpack('H', page + self.overhead + 2*i) for i in range(entries) ]
+      ends = [ self.pagesize ] + offsets[:-1]
+      for i in range(0, entries - 1, 2):
+        key = self.read_item(page, offsets[i], ends[i])
+        if not isinstance(key, str):
+          key = key.decode('latin-1')
+        self.items[key] = (page, offsets[i+1], ends[i+1])
+
+  def read_item(self, page, offset, end):
+    itemtype = ord(self.data[page+offset:page+offset+1])
+    if itemtype == H_KEYDATA:
+      return self.data[page+offset+1:page+end]
+    elif itemtype == H_OFFPAGE:
+      # Follow the chain of overflow pages
+      pgno, tlen = self.unpack('I', page + offset + 4), self.unpack('I', page + offset + 8)
+      chunks = []
+      while pgno:
+        ovpage = pgno * self.pagesize
+        length = self.unpack('H', ovpage + 22)
+        chunks.append(self.data[ovpage+self.overhead:ovpage+self.overhead+length])
+        pgno = self.unpack('I', ovpage + 16)
+      return b''.join(chunks)[:tlen]
+    else:
+      raise ValueError('Unsupported Berkeley DB item type %d' % itemtype)
+
+  def keys(self):
+    return list(self.items.keys())
+
+  def __contains__(self, key):
+    return key in self.items
+
+  def __getitem__(self, key):
+    return self.read_item(*self.items[key])
+
 
 class SniperStatsDbObject:
   def __init__(self, data):
@@ -11,20 +84,62 @@ class SniperStatsDbObject:
     self.offset += 4
     return value
   def read_uint64(self):
-    (value,) = struct.unpack_from("L", self.data, self.offset)
+    (value,) = struct.unpack_from("Q", self.data, self.offset)
     self.offset += 8
     return value
   def read_string(self):
     size = self.read_int32()
     (value,) = struct.unpack_from("%ds" % size, self.data, self.offset)
     self.offset += size
+    if not isinstance(value, str):
+      value = value.decode('latin-1')
     return value
 
 
+SniperStatsDbSnapshot = collections.namedtuple('SniperStatsDbSnapshot', ('metricids', 'counts', 'indexes', 'values'))
+
+def decode_snapshot(data):
+  # A snapshot is an int32 count followed by, for each metric, its int32 metric id, (int32 index, uint64 value) pairs
+  # and an int32 -12345 terminator. Every field is 4-byte aligned, so view the buffer as int32 words:
+  # a -12345 word is a terminator only if it is at an index position, i.e. a multiple of 3 words after the metric id.
+  words = numpy.frombuffer(data, dtype = numpy.int32, offset = 4)
+  candidates = numpy.flatnonzero(words == -12345)
+  # Usually every -12345 word is a terminator, check that assumption for all metrics at once
+  starts = numpy.concatenate(([0], candidates[:-1] + 1))
+  if not (len(candidates) and candidates[-1] == len(words) - 1 and not ((candidates - starts - 1) % 3).any()):
+    # Some values contain -12345 words: walk the metrics, skipping candidates at value positions
+    candidates = candidates.tolist()
+    starts, ends = [], []
+    start, i = 0, 0
+    try:
+      while start < len(words):
+        while (candidates[i] - start - 1) % 3 or candidates[i] <= start:
+          i += 1
+        starts.append(start)
+        ends.append(candidates[i])
+        start = candidates[i] + 1
+        i += 1
+    except IndexError:
+      raise ValueError('Corrupt snapshot in sim.stats.db')
+    candidates = ends
+  starts = numpy.array(starts, dtype = numpy.int64)
+  counts = (numpy.array(candidates, dtype = numpy.int64) - starts - 1) // 3
+  # Word position of each (index, value) pair
+  first = numpy.cumsum(counts) - counts
+  positions = numpy.repeat(starts + 1 - 3 * first, counts) + 3 * numpy.arange(counts.sum(), dtype = numpy.int64)
+  uwords = words.view(numpy.uint32)
+  lo, hi = (positions + 1, positions + 2) if sys.byteorder == 'little' else (positions + 2, positions + 1)
+  values = uwords[lo].astype(numpy.uint64) | (uwords[hi].astype(numpy.uint64) << numpy.uint64(32))
+  return SniperStatsDbSnapshot(words[starts], counts, words[positions], values)
+
+
 class SniperStatsDb(sniper_stats.SniperStatsBase):
-  def __init__(self, filename = 'sim.stats.db'):
-    self.db = bsddb.hashopen(filename, 'r')
+  def __init__(self, filename = 'sim.stats.db', cache_size = 16):
+    self.db = BerkeleyDbHash(filename)
     self.names = self.read_metricnames()
+    # Decoded snapshots, least recently used first
+    self.cache = collections.OrderedDict()
+    self.cache_size = cache_size
 
   def get_snapshots(self):
     return [ key[1:] for key in self.db.keys() if key.startswith('d') ]
@@ -39,24 +154,57 @@ class SniperStatsDb(sniper_stats.SniperStatsBase):
       names[keyid] = (object, metric)
     return names
 
+  def read_snapshot_arrays(self, prefix):
+    if prefix in self.cache:
+      snapshot = self.cache.pop(prefix)
+    else:
+      key = 'd%s' % prefix
+      if key not in self.db:
+        raise ValueError('Invalid prefix %s' % prefix)
+      snapshot = decode_snapshot(zlib.decompress(self.db[key]))
+      if len(self.cache) >= self.cache_size:
+        self.cache.popitem(last = False)
+    self.cache[prefix] = snapshot
+    return snapshot
+
   def read_snapshot(self, prefix, metrics = None):
+    snapshot = self.read_snapshot_arrays(prefix)
+    if metrics:
+      nameids = set([ nameid for nameid, name in self.names.items() if '%s.%s' % name in metrics ])
     values = {}
-    data = SniperStatsDbObject(self.db['d%s' % prefix])
-    num = data.read_int32()
-    while not data.end():
-      metricid = data.read_int32()
-      items = {}
-      while True:
-        index = data.read_int32()
-        if index == -12345: break
-        value = data.read_uint64()
-        items[index] = value
-      values[metricid] = items
+    indexes, items = snapshot.indexes.tolist(), snapshot.values.tolist()
+    offset = 0
+    for metricid, count in zip(snapshot.metricids.tolist(), snapshot.counts.tolist()):
+      if not metrics or metricid in nameids:
+        values[metricid] = dict(zip(indexes[offset:offset+count], items[offset:offset+count]))
+      offset += count
     return values
 
+  def read_timeseries(self, metrics, prefixes = None):
+    if prefixes is None:
+      prefixes = self.get_snapshots()
+    nameids = dict([ (nameid, '%s.%s' % name) for nameid, name in self.names.items() if '%s.%s' % name in metrics ])
+    selected = []
+    for row, prefix in enumerate(prefixes):
+      snapshot = self.read_snapshot_arrays(prefix)
+      metricids = numpy.repeat(snapshot.metricids, snapshot.counts)
+      mask = numpy.isin(metricids, list(nameids.keys())) & (snapshot.indexes >= 0)
+      selected.append((row, metricids[mask], snapshot.indexes[mask], snapshot.values[mask]))
+    results = {}
+    for nameid, name in nameids.items():
+      parts = [ (row, indexes[metricids == nameid], values[metricids == nameid]) for row, metricids, indexes, values in selected ]
+      ncores = max([ indexes.max() + 1 for row, indexes, values in parts if len(indexes) ] or [0])
+      if not ncores:
+        continue
+      data = numpy.zeros((len(prefixes), ncores), dtype = numpy.int64)
+      for row, indexes, values in parts:
+        data[row, indexes] = values.astype(numpy.int64)
+      results[name] = data
+    return results
+
 
 if __name__ == '__main__':
   stats = SniperStatsDb()
-  print stats.get_snapshots()
+  print(stats.get_snapshots())
   names = stats.read_metricnames()
-  print stats.read_snapshot('roi-end')
+  print(stats.read_snapshot('roi-end'))
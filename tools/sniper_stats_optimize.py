@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+# Post-process sim.stats.sqlite3 for faster querying:
+#  - add covering indexes on the `values` table (the simulator only creates one on prefixid)
+#  - precompute end-minus-begin deltas for roi-begin:roi-end and all consecutive periodic-* snapshots
+#  - VACUUM to reclaim space and defragment the file
+# SniperStatsSqlite detects the `deltapairs` / `deltas` tables and uses them automatically.
+
+import sys, os, re, getopt, sqlite3
+
+create_stmts = [
+  'CREATE INDEX IF NOT EXISTS `idx_value_prefix_name` ON `values`(`prefixid`, `nameid`, `core`, `value`);',
+  'CREATE INDEX IF NOT EXISTS `idx_value_name` ON `values`(`nameid`, `prefixid`, `core`, `value`);',
+  'DROP TABLE IF EXISTS `deltapairs`;',
+  'DROP TABLE IF EXISTS `deltas`;',
+  'CREATE TABLE `deltapairs` (prefixid0 INTEGER, prefixid1 INTEGER);',
+  'CREATE TABLE `deltas` (prefixid0 INTEGER, prefixid1 INTEGER, nameid INTEGER, core INTEGER, value INTEGER);',
+]
+
+index_stmts = [
+  'CREATE UNIQUE INDEX `idx_deltapairs` ON `deltapairs`(`prefixid0`, `prefixid1`);',
+  'CREATE INDEX `idx_deltas` ON `deltas`(`prefixid0`, `prefixid1`, `nameid`, `core`, `value`);',
+]
+
+# All (nameid, core) entries of the end snapshot, minus the begin value if it exists,
+# plus (nameid, core) entries that only exist in the begin snapshot
+insert_delta_stmt = '''INSERT INTO `deltas` (prefixid0, prefixid1, nameid, core, value)
+  SELECT :begin, :end, e.nameid, e.core, e.value - IFNULL(b.value, 0) FROM `values` e
+    LEFT JOIN `values` b ON b.prefixid = :begin AND b.nameid = e.nameid AND b.core = e.core
+    WHERE e.prefixid = :end
+  UNION ALL
+  SELECT :begin, :end, b.nameid, b.core, -b.value FROM `values` b
+    WHERE b.prefixid = :begin AND NOT EXISTS
+      (SELECT 1 FROM `values` e WHERE e.prefixid = :end AND e.nameid = b.nameid AND e.core = b.core);'''
+
+
+def get_delta_pairs(prefixes):
+  # prefixes: { prefixname: prefixid }
+  pairs = []
+  if 'roi-begin' in prefixes and 'roi-end' in prefixes:
+    pairs.append(('roi-begin', 'roi-end'))
+  periodic = sorted([ (long(name.split('-')[1]), name) for name in prefixes if re.match(r'^periodic-[0-9]+$', name) ])
+  pairs += [ (k1, k2) for (_, k1), (_, k2) in zip(periodic[:-1], periodic[1:]) ]
+  return pairs
+
+
+def optimize(filename = 'sim.stats.sqlite3', vacuum = True, verbose = False):
+  db = sqlite3.connect(filename)
+  db.text_factory = str
+  c = db.cursor()
+  for stmt in create_stmts:
+    c.execute(stmt)
+  prefixes = dict(c.execute('SELECT prefixname, prefixid FROM `prefixes`').fetchall())
+  # Delta-encoded snapshots (sim.stats.write_delta) have no rows in `values`, leave those to SniperStatsSqlite
+  if c.execute('SELECT name FROM sqlite_master WHERE type="table" AND name="deltaprefixes"').fetchall():
+    deltaprefixids = set([ prefixid for (prefixid,) in c.execute('SELECT prefixid FROM `deltaprefixes`') ])
+    prefixes = dict([ (name, prefixid) for name, prefixid in prefixes.items() if prefixid not in deltaprefixids ])
+  pairs = get_delta_pairs(prefixes)
+  for k1, k2 in pairs:
+    params = { 'begin': prefixes[k1], 'end': prefixes[k2] }
+    c.execute(insert_delta_stmt, params)
+    c.execute('INSERT INTO `deltapairs` (prefixid0, prefixid1) VALUES (:begin, :end)', params)
+  for stmt in index_stmts:
+    c.execute(stmt)
+  db.commit()
+  if verbose:
+    print 'Precomputed deltas for %d snapshot pairs' % len(pairs)
+  if vacuum:
+    c.execute('VACUUM')
+    db.commit()
+  db.close()
+
+
+if __name__ == '__main__':
+  def usage():
+    print 'Usage:', sys.argv[0], '[-h (help)] [-v (verbose)] [--no-vacuum] [-d <resultsdir (default: .)>]'
+
+  resultsdir = '.'
+  vacuum = True
+  verbose = False
+
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], "hvd:", [ 'no-vacuum' ])
+  except getopt.GetoptError, e:
+    print e
+    usage()
+    sys.exit()
+  for o, a in opts:
+    if o == '-h':
+      usage()
+      sys.exit()
+    if o == '-v':
+      verbose = True
+    if o == '-d':
+      resultsdir = a
+    if o == '--no-vacuum':
+      vacuum = False
+
+  if args:
+    usage()
+    sys.exit(-1)
+
+  filename = os.path.join(resultsdir, 'sim.stats.sqlite3')
+  if not os.path.exists(filename):
+    print >> sys.stderr, 'Cannot find %s' % filename
+    sys.exit(1)
+
+  optimize(filename, vacuum = vacuum, verbose = verbose)
@@ -0,0 +1,35 @@
+import cPickle, sniper_stats
+
+# Statistics handed over in a single file by a script running inside the simulator (e.g. scripts/powertrace.py),
+# so tools like mcpat.py do not have to reopen the statistics database of a simulation that is still running.
+# The file is a pickled dictionary with keys
+#   names:     { nameid: (objectname, metricname) }
+#   prefixes:  [ prefix, ... ]
+#   snapshots: { prefix: { nameid: { core: value } } }
+#   topology:  [ (componentname, coreid, masterid), ... ]
+
+class SniperStatsSnapshot(sniper_stats.SniperStatsBase):
+  def __init__(self, filename):
+    data = cPickle.load(open(filename, 'rb'))
+    self.names = data['names']
+    self.prefixes = data['prefixes']
+    self.snapshots = data['snapshots']
+    self.topology = data.get('topology', [])
+
+  def get_snapshots(self):
+    return list(self.prefixes)
+
+  def read_metricnames(self):
+    return dict(self.names)
+
+  def read_snapshot(self, prefix, metrics = None):
+    if prefix not in self.snapshots:
+      raise ValueError('Invalid prefix %s' % prefix)
+    snapshot = self.snapshots[prefix]
+    if metrics:
+      return dict([ (nameid, dict(values)) for nameid, values in snapshot.items() if '%s.%s' % self.names[nameid] in metrics ])
+    else:
+      return dict([ (nameid, dict(values)) for nameid, values in snapshot.items() ])
+
+  def get_topology(self):
+    return self.topology
@@ -76,7 +76,7 @@ def format_diff(d):
   else:
     return format_percent(d)
 
-def print_diff(parmsort = None, restype = 'results', resultdirs = [], partial = None, print_alldiffs = True, print_average = False, average_nz = True):
+def print_diff(parmsort = None, restype = 'results', resultdirs = [], partial = None, print_alldiffs = True, print_average = False, average_nz = True, workers = None):
 
   jobs = []
   stats = {}
@@ -85,8 +85,12 @@ def print_diff(parmsort = None, restype = 'results', resultdirs = [], partial =
   max_cores = 0
   keys = []
 
+  allresults = sniper_lib.load_results_parallel(resultdirs, partial = partial, workers = workers)
   for resultdir in resultdirs:
-    res = sniper_lib.get_results(resultsdir = resultdir, partial = partial)
+    res = allresults[resultdir]
+    if isinstance(res, Exception):
+      print >> sys.stderr, 'Warning: Skipping results directory [%s]: %s' % (resultdir, res)
+      continue
     stats[resultdir] = res[restype]
     jobs.append(resultdir)
 
@@ -191,13 +195,14 @@ if __name__ == "__main__":
   partial = None
   print_alldiffs = True
   print_average = False
+  workers = None
 
 
   def usage():
-    print 'Usage:', sys.argv[0], '[-h|--help (help)] [--sort-abs] [--sort-percent] [--max-diff] [--average] [--config] [--partial=roi-begin:roi-end] [--] [<dir> [<dirN>]]'
+    print 'Usage:', sys.argv[0], '[-h|--help (help)] [--sort-abs] [--sort-percent] [--max-diff] [--average] [--config] [--partial=roi-begin:roi-end] [-j <workers (default: #cpus)>] [--] [<dir> [<dirN>]]'
 
   try:
-    opts, args = getopt.getopt(sys.argv[1:], 'h', [ 'help', 'sort-abs', 'sort-percent', 'max-diff', 'average', 'config', 'partial=' ])
+    opts, args = getopt.getopt(sys.argv[1:], 'hj:', [ 'help', 'sort-abs', 'sort-percent', 'max-diff', 'average', 'config', 'partial=' ])
   except getopt.GetoptError, e:
     print e
     usage()
@@ -218,6 +223,8 @@ if __name__ == "__main__":
       restype = 'config'
     if o == '--partial':
       partial = tuple(a.split(':'))[0:2]
+    if o == '-j':
+      workers = int(a)
 
   if args:
     for arg in args:
@@ -231,4 +238,4 @@ if __name__ == "__main__":
     sys.exit(1)
 
   with sniper_lib.OutputToLess():
-    print_diff(parmsort = parmsort, restype = restype, resultdirs = resultdirs, partial = partial, print_alldiffs = print_alldiffs, print_average = print_average, average_nz = True)
+    print_diff(parmsort = parmsort, restype = restype, resultdirs = resultdirs, partial = partial, print_alldiffs = print_alldiffs, print_average = print_average, average_nz = True, workers = workers)
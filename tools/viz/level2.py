@@ -4,7 +4,7 @@
 import os, sys, getopt, re, math, subprocess
 HOME = os.path.abspath(os.path.dirname(__file__))
 sys.path.extend( [os.path.abspath(os.path.join(HOME, '..'))] )
-import sniper_lib, sniper_config, sniper_stats, cpistack, cpistack_items, mcpat, json
+import sniper_lib, sniper_config, sniper_stats, cpistack_batch, cpistack_items, mcpat, json
 
 
 # From http://stackoverflow.com/questions/600268/mkdir-p-functionality-in-python
@@ -30,6 +30,9 @@ def initialize():
   #this list keeps the partial sum of the instruction count, indexed by interval number
   global instructioncountsumlist
   instructioncountsumlist = []
+  #instruction count of each snapshot (summed over all cores), indexed by snapshot name
+  global instructioncountsnapshots
+  instructioncountsnapshots = None
 
   global cpicomponents, simplifiedcpicomponents, mcpatcomponents, cpificcomponents, simplifiedcpificcomponents
   cpicomponents = {}
@@ -98,59 +101,40 @@ def collectCPIStackDataFIC(verbose=False, requested_cores_list = []):
     cpificcomponents[key] = [[0 for x in xrange(2)] for x in xrange(len(groupedintervals))]
   for key in simplifiedcpificcomponents.keys():
     simplifiedcpificcomponents[key] = [[0 for x in xrange(2)] for x in xrange(len(groupedintervals))]
+  #compute the CPI stacks of all intervals at once
+  intervals = [ (groupedintervals[i-1]["intervalname"], groupedintervals[i]["intervalname"]) for i in range(1, len(groupedintervals)) ]
+  stacks = [ None ] + cpibatch.compute(intervals, cores_list = requested_cores_list, use_simple = False, use_simple_mem = True)
   for i in range (1, len(groupedintervals)):
     if verbose:
       print 'Collect CPI stack info for intervals with a fixed instruction count (interval '+str(i+1)+' / '+str(len(groupedintervals))+')'+"\r",
     cyclecountstart = groupedintervals[i-1]["cyclecount"]
     instructioncount = groupedintervals[i]["instructioncount"]
-    nameintervalstart = groupedintervals[i-1]["intervalname"]
-    nameintervalstop = groupedintervals[i]["intervalname"]
-    currentinterval = (nameintervalstart, nameintervalstop)
-
-    num_exceptions = 0
-    simple=False
-
-    try:
-      results = cpistack.cpistack_compute(
-        config = config,
-        stats = stats,
-        partial = currentinterval,
-        use_simple = simple,
-        use_simple_mem = True,
-        no_collapse = True,
-        aggregate = True,
-        cores_list = requested_cores_list,
-      )
-      data = results.get_data('cpi')
-
-      totalcpi=sum(data[0].itervalues())
-      if totalcpi > 0:
-        ipc = 1./totalcpi
-      else:
-        ipc = 0
-      ipcvaluesfic[0]["data"][i]=dict(x=cyclecountstart/1e9, y=ipc)
-
-
-      for key in results.labels:
-        cpi = data[0][key]
-        ipc = 0
-        if cpi > 0.0:
-          usedcomponents[key]=1
-        cpificcomponents[key][i][0]=cpi
-        cpificcomponents[key][i][1]=cyclecountstart/1e9 #now in microseconds
-        simplecomponent = cpiitems.names_to_contributions[key]
-        simplifiedcpificcomponents[simplecomponent][i][0]+=cpi
-        simplifiedcpificcomponents[simplecomponent][i][1]=cyclecountstart/1e9 #now in microseconds
-        if not simplecomponent in usedsimplecomponents:
-          usedsimplecomponents.append(simplecomponent)
-
-      totalinstructioncount+=instructioncount
-
-    except ValueError:
-      num_exceptions += 1
-      totalinstructioncount+=instructioncount
+    totalinstructioncount+=instructioncount
+
+    results = stacks[i]
+    if results is None:
       continue
 
+    totalcpi=sum(results.cpi.itervalues())
+    if totalcpi > 0:
+      ipc = 1./totalcpi
+    else:
+      ipc = 0
+    ipcvaluesfic[0]["data"][i]=dict(x=cyclecountstart/1e9, y=ipc)
+
+
+    for key in results.labels:
+      cpi = results.cpi[key]
+      if cpi > 0.0:
+        usedcomponents[key]=1
+      cpificcomponents[key][i][0]=cpi
+      cpificcomponents[key][i][1]=cyclecountstart/1e9 #now in microseconds
+      simplecomponent = cpiitems.names_to_contributions[key]
+      simplifiedcpificcomponents[simplecomponent][i][0]+=cpi
+      simplifiedcpificcomponents[simplecomponent][i][1]=cyclecountstart/1e9 #now in microseconds
+      if not simplecomponent in usedsimplecomponents:
+        usedsimplecomponents.append(simplecomponent)
+
   for component in cpiitems.names:
     if usedcomponents[component]==1:
       usedcpificcomponents.append(component)
@@ -168,7 +152,7 @@ def collectCPIStackDataFIC(verbose=False, requested_cores_list = []):
         yvalue = str(components[key][i][0])
         jsonoutput[index]["data"][i]=dict(x=xvalue, y=yvalue)
       index+=1
-    output = re.sub(r'("[xy]": )"([^\"]*)"',r'\1\2',json.dumps(jsonoutput, indent=4))
+    output = re.sub(r'("[xy]": )"([^\"]*)"',r'\1\2',json.dumps(jsonoutput))
     mkdir_p(os.path.join(outputdir,'levels','level2','data'))
     jsonfile = open(os.path.join(outputdir,'levels','level2','data',title+'-'+name+'.json'), "w")
     jsonfile.write(output)
@@ -188,61 +172,52 @@ def collectCPIStackDataFCC(verbose = False, requested_cores_list = []):
   num_exceptions=0
   usedcomponents = dict.fromkeys(cpiitems.names,0)
 
+  #compute the CPI stacks of all intervals at once
+  intervals = [ ("periodic-"+str(i*interval), "periodic-"+str((i+1)*interval)) for i in range(0,num_intervals) ]
+  stacks = cpibatch.compute(intervals, cores_list = requested_cores_list, use_simple = False, use_simple_mem = True)
   for i in range(0,num_intervals):
     if verbose:
       print 'Collect CPI stack info for intervals with a fixed time span (interval '+str(i+1)+' / '+str(num_intervals)+')'+"\r",
-    currentinterval = ("periodic-"+str(i*interval)+":periodic-"+str((i+1)*interval)).split(":")
+    currentinterval = intervals[i]
 
     newinstructioncount=getInstructionCount(currentinterval)
     instructioncountlist.append(newinstructioncount)
     instructioncount+=newinstructioncount
     instructioncountsumlist.append(instructioncount)
 
-    try:
-      results = cpistack.cpistack_compute(
-        config = config,
-        stats = stats,
-        partial = currentinterval,
-        use_simple = False,
-        use_simple_mem = True,
-        no_collapse = True,
-        aggregate = True,
-        cores_list = requested_cores_list,
-      )
-      data = results.get_data('cpi')
-
-      totalcpi=sum(data[0].itervalues())
-      if totalcpi > 0:
-        ipc = 1./totalcpi
-      else:
-        ipc = 0
-
-      ipcvalues[0]["data"][i]=dict(x=i*interval/1e9, y=ipc)
-
-      for key in results.labels:
-        cpi = data[0][key]
-        if totalcpi > 0:
-          cpipercentage = 100.*cpi/totalcpi
-        else:
-          cpipercentage = 0
-
-        if cpi > 0:
-          usedcomponents[key]=1
-        cpicomponents[key][i][0]=i
-        cpicomponents[key][i][1]=cpipercentage
-        cpicomponents[key][i][2]=cpi
-        simplecomponent = cpiitems.names_to_contributions[key]
-        simplifiedcpicomponents[simplecomponent][i][0]=i
-        simplifiedcpicomponents[simplecomponent][i][1]+=cpipercentage
-        simplifiedcpicomponents[simplecomponent][i][2]+=cpi
-        if not simplecomponent in usedsimplifiedcpicomponents:
-          usedsimplifiedcpicomponents.append(simplecomponent)
-
-    except ValueError:
+    results = stacks[i]
+    if results is None:
       ipcvalues[0]["data"][i]=dict(x=i, y=0)
       num_exceptions += 1
       continue
 
+    totalcpi=sum(results.cpi.itervalues())
+    if totalcpi > 0:
+      ipc = 1./totalcpi
+    else:
+      ipc = 0
+
+    ipcvalues[0]["data"][i]=dict(x=i*interval/1e9, y=ipc)
+
+    for key in results.labels:
+      cpi = results.cpi[key]
+      if totalcpi > 0:
+        cpipercentage = 100.*cpi/totalcpi
+      else:
+        cpipercentage = 0
+
+      if cpi > 0:
+        usedcomponents[key]=1
+      cpicomponents[key][i][0]=i
+      cpicomponents[key][i][1]=cpipercentage
+      cpicomponents[key][i][2]=cpi
+      simplecomponent = cpiitems.names_to_contributions[key]
+      simplifiedcpicomponents[simplecomponent][i][0]=i
+      simplifiedcpicomponents[simplecomponent][i][1]+=cpipercentage
+      simplifiedcpicomponents[simplecomponent][i][2]+=cpi
+      if not simplecomponent in usedsimplifiedcpicomponents:
+        usedsimplifiedcpicomponents.append(simplecomponent)
+
   for component in cpiitems.names:
     if usedcomponents[component]==1:
       usedcpicomponents.append(component)
@@ -325,7 +300,7 @@ def writetojson(outputdir, componentname, componenttype, componentindex, verbose
       yvalue = str(components[key][i][componentindex])
       jsonoutput[index]["data"][i]=dict(x=xvalue, y=yvalue)
     index+=1
-  output = re.sub(r'("[xy]": )"([^\"]*)"',r'\1\2',json.dumps(jsonoutput, indent=4))
+  output = re.sub(r'("[xy]": )"([^\"]*)"',r'\1\2',json.dumps(jsonoutput))
   mkdir_p(os.path.join(outputdir,'levels','level2','data'))
   jsonfile = open(os.path.join(outputdir,'levels','level2','data',title+'-'+componentname+'.json'), "w")
   jsonfile.write(output)
@@ -421,18 +396,25 @@ def writeIPCvaluestoJSON(outputdir, verbose = False):
     print 'Writing '+title+'-ipc.json'
   mkdir_p(os.path.join(outputdir,'levels','level2','data'))
   ipcjsonfile = open(os.path.join(outputdir,'levels','level2','data',title+'-ipc.json'), "w")
-  ipcjsonfile.write(json.dumps(ipcvalues, indent=4))
+  ipcjsonfile.write(json.dumps(ipcvalues))
   ipcjsonfile.close()
   ipcjsonfile = open(os.path.join(outputdir,'levels','level2','data',title+'-ipcfic.json'), "w")
-  ipcjsonfile.write(json.dumps(ipcvaluesfic, indent=4))
+  ipcjsonfile.write(json.dumps(ipcvaluesfic))
   ipcjsonfile.close()
 
 
 #return the total number of instructions processed in an interval
 def getInstructionCount(intervalstr):
-  results = sniper_lib.get_results(config = config, stats = stats, partial = intervalstr, metrics = ("performance_model.instruction_count",))
-  instructioncount = sum(results["results"]["performance_model.instruction_count"])
-  return instructioncount
+  global instructioncountsnapshots
+  if instructioncountsnapshots is None:
+    #read the instruction count of all snapshots in one go, rather than two snapshots per interval
+    prefixes = stats.get_snapshots()
+    data = stats.read_timeseries(("performance_model.instruction_count",), prefixes)["performance_model.instruction_count"]
+    instructioncountsnapshots = dict(zip(prefixes, data.sum(axis = 1).tolist()))
+  for prefix in intervalstr:
+    if prefix not in instructioncountsnapshots:
+      raise ValueError('Invalid prefix %s' % prefix)
+  return instructioncountsnapshots[intervalstr[1]] - instructioncountsnapshots[intervalstr[0]]
 
 def getTotalInstructionCount():
   results = sniper_lib.get_results(config = config, stats = stats, metrics = ("performance_model.instruction_count",))
@@ -480,7 +462,7 @@ def createJSONData(native_interval_, nativenum_intervals_, interval_, num_interv
   if verbose:
     print 'Generate JSON data for Level 2'
 
-  global native_interval, nativenum_intervals, interval, num_intervals, resultsdir, outputdir, title, use_mcpat, stats, config
+  global native_interval, nativenum_intervals, interval, num_intervals, resultsdir, outputdir, title, use_mcpat, stats, config, cpibatch
   native_interval = native_interval_
   nativenum_intervals = nativenum_intervals_
   interval = interval_
@@ -491,6 +473,8 @@ def createJSONData(native_interval_, nativenum_intervals_, interval_, num_interv
   use_mcpat = mcpat
   stats = sniper_stats.SniperStats(resultsdir_)
   config = sniper_lib.get_config(resultsdir = resultsdir_)
+  #reads the CPI stack metrics of all snapshots, used for both the fixed time and fixed instruction count intervals
+  cpibatch = cpistack_batch.CpiBatch(config, stats)
 
   initialize()
 
@@ -61,12 +61,10 @@ def createJSONData(interval, num_intervals, resultsdir, outputdir, title, verbos
 
   # Write JSON to file
   mkdir_p(os.path.join(outputdir,'levels','level3','data'))
+  # Written once, as a compact JSON literal that level3.html loads with a script tag
   f = open(os.path.join(outputdir,'levels','level3','data','ipcvalues.txt'), "w")
   f.write("intervalsize = "+str(interval)+";\n")
-  f.write("ipcvaluestr = '"+json.dumps(intervaldata)+"';")
-  f.close()
-  f = open(os.path.join(outputdir,'levels','level3','data','ipcvalues.json'), "w")
-  f.write(json.dumps(intervaldata, indent=4))
+  f.write("ipcvaluestr = "+json.dumps(intervaldata, separators=(',',':'))+";")
   f.close()
   if verbose:
     print
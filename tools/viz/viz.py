@@ -1,5 +1,5 @@
 #!/usr/bin/env python
-import os, sys, getopt, re, math, subprocess, json, shutil
+import os, sys, getopt, re, math, subprocess, json, shutil, multiprocessing, traceback, cPickle
 HOME = os.path.abspath(os.path.dirname(__file__))
 sys.path.extend([ os.path.abspath(os.path.join(HOME, '..')) ])
 import sniper_lib, sniper_stats, cpistack, level1, level2, level3, topology, profile, functionbased
@@ -19,10 +19,58 @@ def mkdir_p(path):
 levels_all = [ '1', '2', '3', 'topo', 'profile', 'aso' ]
 levels_default = [ '1', '2', '3', 'topo' ]
 
+# Levels whose inputs and settings did not change since the previous run into the same output directory are not regenerated.
+# A level's fingerprint is its settings plus the modification time and size of the simulation results it reads.
+FINGERPRINT_VERSION = 1
+FINGERPRINT_FILENAME = 'viz.fingerprints'
+FINGERPRINT_INPUTS = {
+  'profile': ('sim.rtntracefull',),
+  'aso': ('sim.rtntrace',),
+}
+
+def level_fingerprint(level, resultsdir, settings):
+  inputs = []
+  for filename in FINGERPRINT_INPUTS.get(level, ()):
+    try:
+      st = os.stat(os.path.join(resultsdir, filename))
+    except OSError:
+      continue
+    inputs.append((filename, st.st_mtime, st.st_size))
+  return (FINGERPRINT_VERSION, os.path.realpath(resultsdir), settings, sniper_lib.results_cache_signature(resultsdir), tuple(inputs))
+
+def fingerprints_read(outputdir):
+  try:
+    return cPickle.load(open(os.path.join(outputdir, FINGERPRINT_FILENAME), 'rb'))
+  except Exception:
+    # Missing, stale format or corrupt: regenerate everything
+    return {}
+
+def fingerprints_write(outputdir, fingerprints):
+  filename = os.path.join(outputdir, FINGERPRINT_FILENAME)
+  fp = open(filename + '.tmp', 'wb')
+  cPickle.dump(fingerprints, fp, cPickle.HIGHEST_PROTOCOL)
+  fp.close()
+  os.rename(filename + '.tmp', filename)
+
+def create_level(level, args, kwds):
+  # Runs in a worker process, print the traceback here as it is lost when the exception is passed back to the parent
+  try:
+    {
+      '1': level1.createJSONData,
+      '2': level2.createJSONData,
+      '3': level3.createJSONData,
+      'topo': topology.createJSONData,
+      'profile': profile.createJSONData,
+      'aso': functionbased.createJSONData,
+    }[level](*args, **kwds)
+  except:
+    traceback.print_exc()
+    raise
+
 
 if __name__ == '__main__':
   def usage():
-    print 'Usage: '+sys.argv[0]+ ' [-h|--help (help)] [-d <resultsdir (default: .)>] [-j <jobid>] [-t <title>] [-n <num-intervals (default: 1000, all: 0)>] [-i <interval (default: smallest_interval)>] [-o <outputdir (default: viz)>] [--mcpat] [--level <levels (default: %s)>] [--add-level <level>] [-v|--verbose]' % ','.join(levels_default)
+    print 'Usage: '+sys.argv[0]+ ' [-h|--help (help)] [-d <resultsdir (default: .)>] [-j <jobid>] [-t <title>] [-n <num-intervals (default: 1000, all: 0)>] [-i <interval (default: smallest_interval)>] [-o <outputdir (default: viz)>] [--mcpat] [--level <levels (default: %s)>] [--add-level <level>] [--jobs <n> (default: number of levels)] [--force (regenerate unchanged levels)] [-v|--verbose]' % ','.join(levels_default)
     sys.exit()
 
   resultsdir = '.'
@@ -33,10 +81,12 @@ if __name__ == '__main__':
   interval = None
   verbose = False
   levels = levels_default
+  jobs = None
+  force = False
   dircleanup = None
 
   try:
-    opts, args = getopt.getopt(sys.argv[1:], "hd:o:t:n:i:vj:", [ "help", "mcpat", "level=", "add-level=", "verbose" ])
+    opts, args = getopt.getopt(sys.argv[1:], "hd:o:t:n:i:vj:", [ "help", "mcpat", "level=", "add-level=", "jobs=", "force", "verbose" ])
   except getopt.GetoptError, e:
     print e
     usage()
@@ -67,6 +117,10 @@ if __name__ == '__main__':
 	print 'Invalid level', a
 	sys.exit(1)
       levels.append(a)
+    if o == '--jobs':
+      jobs = int(a)
+    if o == '--force':
+      force = True
     if o == '-v' or o == '--verbose':
       verbose = True
     if o == '-j':
@@ -138,12 +192,52 @@ if __name__ == '__main__':
 
   mkdir_p(outputdir)
 
-  if '1' in levels: level1.createJSONData(resultsdir, outputdir, verbose = verbose)
-  if '2' in levels: level2.createJSONData(defaultinterval, defaultnum_intervals, interval, num_intervals, resultsdir, outputdir, title, use_mcpat, verbose = verbose)
-  if '3' in levels: level3.createJSONData(interval, num_intervals, resultsdir, outputdir, title, verbose = verbose)
-  if 'topo' in levels: topology.createJSONData(interval, num_intervals, resultsdir, outputdir, verbose = verbose)
-  if 'profile' in levels: profile.createJSONData(resultsdir, outputdir, verbose = verbose)
-  if 'aso' in levels: functionbased.createJSONData(resultsdir, outputdir, title)
+  # Each level only depends on the simulation results, so independent levels are generated concurrently
+  tasks = {
+    '1': ((resultsdir, outputdir), dict(verbose = verbose), ()),
+    '2': ((defaultinterval, defaultnum_intervals, interval, num_intervals, resultsdir, outputdir, title, use_mcpat), dict(verbose = verbose),
+          (defaultinterval, defaultnum_intervals, interval, num_intervals, title, use_mcpat)),
+    '3': ((interval, num_intervals, resultsdir, outputdir, title), dict(verbose = verbose), (interval, num_intervals, title)),
+    'topo': ((interval, num_intervals, resultsdir, outputdir), dict(verbose = verbose), (interval, num_intervals)),
+    'profile': ((resultsdir, outputdir), dict(verbose = verbose), ()),
+    'aso': ((resultsdir, outputdir, title), {}, (title,)),
+  }
+  fingerprints = fingerprints_read(outputdir)
+  todo = []
+  for level in levels_all:
+    if level not in levels:
+      continue
+    fingerprint = level_fingerprint(level, resultsdir, tasks[level][2])
+    if not force and fingerprints.get(level) == fingerprint:
+      if verbose:
+        print 'Level %s is up to date' % level
+      continue
+    todo.append((level, fingerprint))
+
+  if jobs is None:
+    jobs = min(len(todo), multiprocessing.cpu_count())
+  if jobs > 1 and len(todo) > 1:
+    # Levels keep their state in module globals (e.g. level2), so give every level a fresh worker process
+    pool = multiprocessing.Pool(jobs, maxtasksperchild = 1)
+    running = [ (level, fingerprint, pool.apply_async(create_level, (level,) + tasks[level][:2])) for level, fingerprint in todo ]
+    pool.close()
+    failed = []
+    for level, fingerprint, result in running:
+      try:
+        result.get()
+        fingerprints[level] = fingerprint
+      except Exception:
+        failed.append(level)
+    pool.join()
+    fingerprints_write(outputdir, fingerprints)
+    if failed:
+      print 'Error: generating level(s) %s failed' % ','.join(failed)
+      sys.exit(1)
+  else:
+    for level, fingerprint in todo:
+      create_level(level, *tasks[level][:2])
+      fingerprints[level] = fingerprint
+      fingerprints_write(outputdir, fingerprints)
 
   if verbose:
     print "Write general info about the visualizations in info.txt"